@@ -0,0 +1,525 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks of the chessopy library.
+Usage: python bench.py [benchmark_name ...] 
+(all the benchmarks are run if no name is given).
+"""
+
+import chessopy
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+chessopy.FOLDER_PATH = os.path.dirname(os.path.abspath(__file__)) + "/"
+
+# Standard perft reference positions: (name, fen, expected node counts by depth)
+# cf. https://www.chessprogramming.org/Perft_Results
+PERFT_POSITIONS = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 
+        [20, 400, 8902, 197281]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 
+        [48, 2039, 97862]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 
+        [14, 191, 2812, 43238]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 
+        [6, 264, 9467]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", 
+        [44, 1486, 62379]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", 
+        [46, 2079, 89890]),
+]
+
+def bench_perft() :
+    """Run perft on the reference positions, check the node counts and report nodes per second."""
+    board = chessopy.Board()
+    total_nodes = 0
+    total_time = 0
+    for name, fen, node_counts in PERFT_POSITIONS :
+        board.set_fen(fen)
+        depth = len(node_counts)
+        start_time = time.perf_counter()
+        nodes = board.perft(depth)
+        elapsed_time = time.perf_counter() - start_time
+        status = "ok" if nodes == node_counts[-1] else f"FAILED (expected {node_counts[-1]})"
+        print(f"perft {name:<10} depth {depth}: {nodes:>8} nodes in {elapsed_time:6.2f} s, "
+              f"{nodes/elapsed_time:>9.0f} nps {status}")
+        total_nodes += nodes
+        total_time += elapsed_time
+    print(f"perft total: {total_nodes} nodes in {total_time:.2f} s, {total_nodes/total_time:.0f} nps")
+
+def bench_undo_depth() :
+    """Measure the cost of MoveLines.go_to_parent (Undo) at the end of lines of different depths, 
+    it should not depend on the depth."""
+    repetitions = 100000
+    for depth in (10, 100, 300) :
+        move_lines = chessopy.MoveLines("new")
+        # A single line of the given depth
+        keys = [chessopy.move_key(ply % 64, (ply + 1) % 64) for ply in range(depth)]
+        node = move_lines["move_lines"]
+        for key in keys :
+            node[key] = {}
+            node = node[key]
+        move_lines.go_to_root()
+        for key in keys :
+            move_lines.go_to_child(key)
+        last_key = keys[-1]
+        start_time = time.perf_counter()
+        for k in range(repetitions) :
+            move_lines.go_to_parent()
+            move_lines.go_to_child(last_key)
+        elapsed_time = time.perf_counter() - start_time
+        print(f"undo at depth {depth:>3}: {elapsed_time/repetitions*1e9:6.0f} ns per go_to_parent + go_to_child")
+
+def create_random_games(game_count: int, max_plies: int = 100, seed: int = 0) -> list :
+    """Return a corpus of random legal games, as lists of move tuples (cf. Board._generate_legal_moves)."""
+    random_generator = random.Random(seed)
+    board = chessopy.Board(chessopy.MoveLines("new"))
+    games = []
+    for k in range(game_count) :
+        board.set_new_game()
+        game = []
+        for ply in range(max_plies) :
+            moves = board._generate_legal_moves()
+            if not moves :
+                break
+            move = random_generator.choice(moves)
+            board._make_move(*move)
+            game.append(move)
+        games.append(game)
+    return games
+
+def bench_san() :
+    """Measure the throughput of san generation (Board._get_san) and parsing (Board.parse_san) 
+    on a corpus of random games."""
+    games = create_random_games(200)
+    board = chessopy.Board(chessopy.MoveLines("new"))
+    move_count = sum(len(game) for game in games)
+    # Replay only, to subtract the cost of making the moves
+    start_time = time.perf_counter()
+    for game in games :
+        board.set_new_game()
+        for move in game :
+            board._make_move(*move)
+    replay_time = time.perf_counter() - start_time
+    # Generation
+    san_games = []
+    start_time = time.perf_counter()
+    for game in games :
+        board.set_new_game()
+        san_game = []
+        for move in game :
+            san_game.append(board._get_san(*move))
+            board._make_move(*move)
+        san_games.append(san_game)
+    emit_time = time.perf_counter() - start_time - replay_time
+    # Parsing
+    start_time = time.perf_counter()
+    for san_game in san_games :
+        board.set_new_game()
+        for san in san_game :
+            board._make_move(*board.parse_san(san))
+    parse_time = time.perf_counter() - start_time - replay_time
+    print(f"san corpus: {move_count} moves in {len(games)} random games")
+    print(f"san emit:  {move_count/emit_time:>8.0f} moves/s")
+    print(f"san parse: {move_count/parse_time:>8.0f} moves/s")
+
+def create_move_tree(games: list, max_plies: int) -> dict :
+    """Return a move tree (cf. MoveLines["move_lines"]) with the first plies of the games given."""
+    move_tree = {}
+    for game in games :
+        node = move_tree
+        for move in game[:max_plies] :
+            node = node.setdefault(chessopy.move_key(*move), {})
+    return move_tree
+
+@contextlib.contextmanager
+def temporary_databases_folder() :
+    """Set chessopy.FOLDER_PATH to a new temporary folder containing a databases folder 
+    during the with block, and give the path of the temporary folder."""
+    folder_path = chessopy.FOLDER_PATH
+    with tempfile.TemporaryDirectory() as temporary_folder :
+        chessopy.FOLDER_PATH = temporary_folder + "/"
+        os.mkdir(temporary_folder + "/databases")
+        try :
+            yield temporary_folder
+        finally :
+            chessopy.FOLDER_PATH = folder_path
+
+def count_moves(move_tree: dict) -> int :
+    """Return the number of moves (edges) of the move tree given."""
+    move_count = 0
+    stack = [move_tree]
+    while stack :
+        node = stack.pop()
+        move_count += len(node)
+        stack.extend(node.values())
+    return move_count
+
+def run_python(code: str) -> list :
+    """Run the code given in a new interpreter (in the folder of the repository) and return the words printed."""
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, 
+                          check=True, cwd=chessopy.FOLDER_PATH).stdout.split()
+
+def bench_training() :
+    """Measure the number of headless training sessions (chessopy.training) per second, 
+    and the cold import time of the headless modules."""
+    import chessopy.training
+    move_lines = chessopy.MoveLines("new")
+    move_lines["move_lines"] = create_move_tree(create_random_games(200, 20), 20)
+    session = chessopy.training.TrainingSession(chessopy.Board(move_lines))
+    random_generator = random.Random(0)
+    session_count = 2000
+    move_count = 0
+    start_time = time.perf_counter()
+    for k in range(session_count) :
+        session.start()
+        while not session.is_line_finished() :
+            # The user knows the lines
+            key = random_generator.choice(list(session.move_lines.current_node))
+            start_square_number, destination_square_number, promotion = chessopy.key_to_move(key)
+            result = session.play_move(start_square_number, destination_square_number)
+            move_count += 1 if result.reply is None else 2
+    elapsed_time = time.perf_counter() - start_time
+    print(f"training: {session_count/elapsed_time:>8.0f} sessions/s ({move_count/elapsed_time:.0f} moves/s)")
+    # Cold imports, in new interpreters
+    code = "import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)"
+    for module_name in ("chessopy", "chessopy.training") :
+        import_times = []
+        for k in range(5) :
+            output = run_python(code.format(module_name) + "; import sys; print('tkinter' in sys.modules)")
+            import_times.append(float(output[0]))
+        print(f"cold import {module_name:<18}: {min(import_times)*1000:6.1f} ms (tkinter imported: {output[1]})")
+
+def bench_scheduler() :
+    """Measure the cost of choosing the most urgent line and reviewing it (chessopy.scheduler)
+    for different numbers of cards, compared to a scan of all the cards."""
+    import chessopy.scheduler
+    now = [0.0]
+    repetitions = 20000
+    for card_count in (1000, 10000, 100000) :
+        random_generator = random.Random(0)
+        scheduler = chessopy.scheduler.RepetitionScheduler(clock=lambda: now[0], random_generator=random_generator)
+        for k in range(card_count) :
+            scheduler.add_card((str(k // 100), str(k % 100)))
+        start_time = time.perf_counter()
+        for k in range(repetitions) :
+            now[0] += 1
+            scheduler.review(scheduler.get_next_line(), random_generator.random() < 0.8)
+        heap_time = (time.perf_counter() - start_time) / repetitions
+        start_time = time.perf_counter()
+        for k in range(100) :
+            min(scheduler.states.items(), key=lambda item: (item[1].due, -item[1].get_error_rate()))
+        scan_time = (time.perf_counter() - start_time) / 100
+        print(f"scheduler {card_count:>6} cards: {heap_time*1e6:7.1f} µs per next line + review "
+              f"(scan of the cards: {scan_time*1e6:9.1f} µs)")
+
+def bench_renderers() :
+    """Measure the frame time of the board renderers of the graphical interface (chessopy.gui.RENDERERS): 
+    reset of the position after a game, and 100 consecutive moves. A display is needed."""
+    import tkinter
+    import chessopy.gui
+    game = create_random_games(1, 100, seed=1)[0]
+    for name in chessopy.gui.RENDERERS :
+        try :
+            app = chessopy.gui.ChessGuiApp(name)
+        except tkinter.TclError as exception :
+            print(f"renderers: no display ({exception}), skipped")
+            return
+        board_gui = app.board_gui
+        app.update()
+        # Reset
+        reset_times = []
+        for k in range(10) :
+            for start_square_number, destination_square_number, promotion in game[:40] :
+                board_gui.make_computer_move(start_square_number, destination_square_number)
+            app.update()
+            start_time = time.perf_counter()
+            board_gui.reset_position()
+            app.update()
+            reset_times.append(time.perf_counter() - start_time)
+        # Consecutive moves
+        start_time = time.perf_counter()
+        for start_square_number, destination_square_number, promotion in game :
+            board_gui.make_computer_move(start_square_number, destination_square_number)
+            app.update()
+        move_time = (time.perf_counter() - start_time) / len(game)
+        app.destroy()
+        print(f"renderer {name:<8}: reset {min(reset_times)*1000:6.2f} ms, "
+              f"move {move_time*1000:6.2f} ms per frame ({len(game)} moves)")
+
+def bench_startup() :
+    """Measure the startup time: headless import and board creation, 
+    and graphical interface from the import to the first paint (a display is needed)."""
+    headless_code = """import time; start_time = time.perf_counter()
+import chessopy; import_time = time.perf_counter() - start_time
+chessopy.FOLDER_PATH = ''
+board = chessopy.Board(chessopy.MoveLines("new")); empty_board_time = time.perf_counter() - start_time
+board = chessopy.Board(); board_time = time.perf_counter() - start_time
+print(import_time, empty_board_time, board_time)"""
+    times = [[float(word) for word in run_python(headless_code)] for k in range(5)]
+    import_time, empty_board_time, board_time = (min(column) for column in zip(*times))
+    print(f"startup headless: import chessopy {import_time*1000:6.1f} ms, "
+          f"+ Board(MoveLines('new')) {empty_board_time*1000:6.1f} ms, "
+          f"+ Board() ({chessopy.LINES_TO_BE_LOADED} lines) {board_time*1000:6.1f} ms")
+    gui_code = """import time; start_time = time.perf_counter()
+import chessopy, chessopy.gui
+chessopy.FOLDER_PATH = ''
+import_time = time.perf_counter() - start_time
+app = chessopy.gui.ChessGuiApp(); app.update(); paint_time = time.perf_counter() - start_time
+while not app.board_gui.are_lines_loaded :
+    app.update(); time.sleep(0.001)
+print(import_time, paint_time, time.perf_counter() - start_time)
+app.destroy()"""
+    try :
+        times = [[float(word) for word in run_python(gui_code)] for k in range(3)]
+    except subprocess.CalledProcessError :
+        print("startup gui: no display, skipped")
+        return
+    import_time, paint_time, loaded_time = (min(column) for column in zip(*times))
+    print(f"startup gui: import {import_time*1000:6.1f} ms, first paint {paint_time*1000:6.1f} ms, "
+          f"lines loaded {loaded_time*1000:6.1f} ms")
+
+def bench_save() :
+    """Compare the cost of saving a few new moves in a big move lines: 
+    journal (MoveLines.add_curent_lines_to_database) and whole database (MoveLines.save_new_database)."""
+    move_tree = create_move_tree(create_random_games(2000, 40), 40)
+    with temporary_databases_folder() :
+        move_lines = chessopy.MoveLines("new")
+        move_lines["move_lines"] = move_tree
+        move_lines.save_new_database("big_database.json")
+        move_lines = chessopy.MoveLines("big")
+        move_lines.JOURNAL_COMPACTION_SIZE = 10**9
+        keys = list(move_lines.current_node)
+        repetitions = 20
+        start_time = time.perf_counter()
+        for k in range(repetitions) :
+            # A few moves added at the end of a line
+            move_lines.go_to_root()
+            move_lines.go_to_child(keys[k % len(keys)])
+            for ply in range(4) :
+                move_lines.go_to_child(chessopy.move_key(k, ply))
+            move_lines.add_curent_lines_to_database()
+        journal_time = (time.perf_counter() - start_time) / repetitions
+        start_time = time.perf_counter()
+        for k in range(repetitions) :
+            move_lines.save_new_database("big_database.json")
+        full_time = (time.perf_counter() - start_time) / repetitions
+    node_count = count_moves(move_tree)
+    print(f"save of 4 new moves in {node_count} moves: journal {journal_time*1000:7.2f} ms, "
+          f"whole database {full_time*1000:7.2f} ms")
+
+def bench_validation() :
+    """Measure the validation of a big move tree (chessopy.validation) in the current process
+    and with a pool of processes (the speedup depends on the number of cores)."""
+    import chessopy.validation
+    games = create_random_games(12000, 45)
+    move_lines = chessopy.MoveLines("new")
+    move_lines["move_lines"] = create_move_tree(games, 45)
+    node_count = count_moves(move_lines["move_lines"])
+    for process_count in sorted({1, os.cpu_count() or 1}) :
+        start_time = time.perf_counter()
+        bad_edges = chessopy.validation.validate_move_lines(move_lines, process_count)
+        elapsed_time = time.perf_counter() - start_time
+        print(f"validation with {process_count} process(es): {len(bad_edges)} bad edge(s), "
+              f"{elapsed_time:6.2f} s, {node_count/elapsed_time:8.0f} moves/s")
+
+def bench_analysis() :
+    """Compare the cost of the statistics of a big move lines (chessopy.analysis): 
+    traversal of the tree, and reading of the summary index."""
+    import chessopy.analysis
+    move_tree = create_move_tree(create_random_games(2000, 40), 40)
+    with temporary_databases_folder() :
+        move_lines = chessopy.MoveLines("new")
+        move_lines["move_lines"] = move_tree
+        move_lines.save_new_database("big_database.json")
+        move_lines = chessopy.MoveLines("big")
+        for user_color in [None, chessopy.PieceColor.WHITE] :
+            start_time = time.perf_counter()
+            statistics = chessopy.analysis.get_statistics(move_lines, user_color)
+            traversal_time = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            chessopy.analysis.get_statistics(move_lines, user_color)
+            index_time = time.perf_counter() - start_time
+            print(f"statistics of {statistics.move_count} moves (user color {user_color}): "
+                  f"traversal {traversal_time*1000:8.1f} ms, index {index_time*1000:6.1f} ms")
+
+def bench_fen() :
+    """Measure the resets to a position with Board.set_fen (cached or not) and Board.get_fen."""
+    fen = "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"
+    board = chessopy.Board(chessopy.MoveLines("new"))
+    repetitions = 20000
+    start_time = time.perf_counter()
+    for k in range(repetitions) :
+        board._parse_fen(fen)
+    parse_time = (time.perf_counter() - start_time) / repetitions
+    start_time = time.perf_counter()
+    for k in range(repetitions) :
+        board.set_fen(fen)
+    cached_time = (time.perf_counter() - start_time) / repetitions
+    start_time = time.perf_counter()
+    for k in range(repetitions) :
+        board.get_fen()
+    dump_time = (time.perf_counter() - start_time) / repetitions
+    print(f"fen: parse {parse_time*1e6:6.1f} us, cached set_fen {cached_time*1e6:6.1f} us, "
+          f"get_fen {dump_time*1e6:6.1f} us")
+
+def bench_move_keys() :
+    """Compare the move keys of MoveLines (16-bit integers, cf. chessopy.move_key) with the 
+    "start,dest" strings of the json files: memory of a big move tree (tracemalloc), 
+    read from a json file or grown move by move, and decoding of the coords of the children of the nodes."""
+    import tracemalloc
+    move_tree = create_move_tree(create_random_games(2000, 40), 40)
+    move_count = count_moves(move_tree)
+    json_string = json.dumps(chessopy.move_tree_to_json(move_tree))
+    tracemalloc.start()
+    json_tree = json.loads(json_string)
+    json_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    integer_tree = chessopy.move_tree_from_json(json_tree)
+    integer_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"move tree of {move_count} moves read from json: string keys {json_memory/move_count:6.1f} bytes/move, "
+          f"integer keys {integer_memory/move_count:6.1f} bytes/move")
+    # Tree grown move by move, like the lines recorded by Board.move_piece: 
+    # the string keys were formatted by each call of add_move
+    games = create_random_games(2000, 40)
+    tracemalloc.start()
+    string_tree = {}
+    for game in games :
+        node = string_tree
+        for move in game :
+            node = node.setdefault(f"{move[0]},{move[1]}", {})
+    string_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del string_tree
+    tracemalloc.start()
+    move_lines = chessopy.MoveLines("new")
+    for game in games :
+        move_lines.go_to_root()
+        for move in game :
+            move_lines.go_to_child(chessopy.move_key(*move))
+    move_lines.go_to_root()
+    integer_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"move tree of {move_count} moves grown move by move: string keys {string_memory/move_count:6.1f} bytes/move, "
+          f"integer keys {integer_memory/move_count:6.1f} bytes/move")
+    nodes = []
+    stack = [integer_tree]
+    while stack :
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.values())
+    json_nodes = []
+    stack = [json_tree]
+    while stack :
+        node = stack.pop()
+        json_nodes.append(node)
+        stack.extend(node.values())
+    start_time = time.perf_counter()
+    for node in json_nodes :
+        [tuple(int(number) for number in key.split(',')[:2]) for key in node]
+    split_time = time.perf_counter() - start_time
+    move_lines = chessopy.MoveLines("new")
+    start_time = time.perf_counter()
+    for node in nodes :
+        move_lines.current_node = node
+        move_lines.get_coords_of_childs_of_current_node()
+    integer_time = time.perf_counter() - start_time
+    print(f"coords of the children: string keys {split_time/move_count*1e9:6.0f} ns/move, "
+          f"integer keys {integer_time/move_count*1e9:6.0f} ns/move")
+
+def replay_games(board: chessopy.Board, games: list, move_count: int) -> list :
+    """Replay the games with Board.push_move until move_count moves are played, 
+    and return the move_played lists of the games."""
+    res = []
+    played_count = 0
+    while played_count < move_count :
+        for game in games :
+            board.set_new_game()
+            for move in game :
+                board.push_move(board._create_move(move))
+            res.append(board.move_played)
+            played_count += len(game)
+            if played_count >= move_count :
+                break
+    board.set_new_game()
+    return res
+
+def bench_move_memory() :
+    """Measure the replay time of moves with Board.push_move, and with tracemalloc 
+    the memory of one million moves replayed and kept (the move_played lists of the games)."""
+    import tracemalloc
+    games = create_random_games(1000, 100)
+    board = chessopy.Board(chessopy.MoveLines("new"))
+    move_count = 100000
+    start_time = time.perf_counter()
+    replay_games(board, games, move_count)
+    elapsed_time = time.perf_counter() - start_time
+    print(f"replay: {elapsed_time/move_count*1e6:.2f} us/move")
+    move_count = 1000000
+    tracemalloc.start()
+    games_played = replay_games(board, games, move_count)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    move_count = sum(len(game) for game in games_played)
+    print(f"{move_count} moves kept in {memory/2**20:.1f} MiB ({memory/move_count:.1f} bytes/move)")
+
+def bench_engine() :
+    """Measure the nodes per second of the engine search (chessopy.engine) on a few positions, 
+    with a time budget of 2 seconds."""
+    import chessopy.engine
+    positions = [
+        ("initial", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+        ("italian", "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"),
+        ("middlegame", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+        ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"),
+    ]
+    board = chessopy.Board(chessopy.MoveLines("new"))
+    for name, fen in positions :
+        board.set_fen(fen)
+        result = chessopy.engine.Engine().search(board, 2.0)
+        print(f"{name:>10}: depth {result.depth:>2}, {result.node_count:>7} nodes, "
+              f"{result.node_count/result.elapsed_time:8.0f} nodes/s, move {result.move} ({result.score:+d})")
+
+BENCHMARKS = {
+    "perft": bench_perft,
+    "undo_depth": bench_undo_depth,
+    "san": bench_san,
+    "training": bench_training,
+    "scheduler": bench_scheduler,
+    "renderers": bench_renderers,
+    "startup": bench_startup,
+    "save": bench_save,
+    "validation": bench_validation,
+    "analysis": bench_analysis,
+    "fen": bench_fen,
+    "move_keys": bench_move_keys,
+    "move_memory": bench_move_memory,
+    "engine": bench_engine,
+}
+
+if __name__ == "__main__" :
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names :
+        BENCHMARKS[name]()
@@ -17,8 +17,10 @@
 """
 A simple graphical interface written only in Python using tkinter.
 A very simple oriented object was written to modelize the chess game.
-The rules of chess are not implemented in these objects, that means 
-that the user can make whatever he wants on the board.
+The board can generate the legal moves, but the graphical interface 
+doesn't check them, that means that the user can make whatever he wants 
+on the board.
+The chess objects don't depend on tkinter, the graphical interface is in chessopy.gui
 """
 
 __author__ = "Nicolas Sénave"
@@ -33,9 +35,11 @@ from abc import ABC, abstractmethod
 from typing import List
 import re
 import json
+import os
 from random import randrange
-from tkinter import Tk, Canvas, PhotoImage, Button, Label, \
-    N, E, S, W, NE, NW, SE, SW, X, Y, BOTH
+from functools import lru_cache
+from collections import OrderedDict
+from chessopy.polyglot_keys import POLYGLOT_RANDOM_ARRAY
 
 # TODO: work with relative path instead...
 FOLDER_PATH = "C:/Users/Nico/Documents/chessopy/"
@@ -51,18 +55,32 @@ class PieceColor(Enum) :
     BLACK = 0
     WHITE = 1
 
+class PieceType(Enum) :
+    PAWN = 0
+    KNIGHT = 1
+    BISHOP = 2
+    ROOK = 3
+    QUEEN = 4
+    KING = 5
+
 class Piece(ABC) :
     """
     Abstract buisness class for chess pieces.
     A piece is initialized with a PieceColor.
     A piece has a square number which can be used to find 
     the square that the piece has been put on.
+    The piece_type, san_name and value class attributes are set by each subclass:
+    the instances only store their color and square number (__slots__).
     """
+
+    __slots__ = ("color", "square_number")
+
+    piece_type = None
+    san_name = None
+    value = None
     
     def __init__(self, piece_color: PieceColor) :
         self.color = piece_color
-        self.san_name = None
-        self.value = None
         self.square_number = None
     
     def get_color(self) -> PieceColor :
@@ -79,47 +97,53 @@ class Piece(ABC) :
     
     def get_square_number(self) -> int :
         return self.square_number
+    
+    def get_piece_type(self) -> PieceType :
+        return self.piece_type
 
 class Pawn(Piece) :
-    
-    def __init__(self, piece_color: PieceColor) :
-        Piece.__init__(self, piece_color)
-        self.value = 1
-        self.san_name = 'P'
+
+    __slots__ = ()
+    piece_type = PieceType.PAWN
+    san_name = 'P'
+    value = 1
 
 class Knight(Piece) :
-    
-    def __init__(self, piece_color: PieceColor) :
-        Piece.__init__(self, piece_color)
-        self.value = 3
-        self.san_name = 'N'
+
+    __slots__ = ()
+    piece_type = PieceType.KNIGHT
+    san_name = 'N'
+    value = 3
 
 class Bishop(Piece) :
-    
-    def __init__(self, piece_color: PieceColor) :
-        Piece.__init__(self, piece_color)
-        self.value = 3
-        self.san_name = 'B'
+
+    __slots__ = ()
+    piece_type = PieceType.BISHOP
+    san_name = 'B'
+    value = 3
 
 class Rook(Piece) :
-    
-    def __init__(self, piece_color: PieceColor) :
-        Piece.__init__(self, piece_color)
-        self.value = 5
-        self.san_name = 'R'
+
+    __slots__ = ()
+    piece_type = PieceType.ROOK
+    san_name = 'R'
+    value = 5
 
 class Queen(Piece) :
-    
-    def __init__(self, piece_color: PieceColor) :
-        Piece.__init__(self, piece_color)
-        self.value = 9
-        self.san_name = 'Q'
+
+    __slots__ = ()
+    piece_type = PieceType.QUEEN
+    san_name = 'Q'
+    value = 9
 
 class King(Piece) :
-    
-    def __init__(self, piece_color: PieceColor) :
-        Piece.__init__(self, piece_color)
-        self.san_name = 'K'
+
+    __slots__ = ()
+    piece_type = PieceType.KING
+    san_name = 'K'
+
+# Piece classes indexed by PieceType value
+PIECE_CLASSES = [Pawn, Knight, Bishop, Rook, Queen, King]
 
 class SquareColor(Enum) :
     DARK = 0
@@ -131,8 +155,12 @@ class Square() :
     A square is defined with his rank and file, 
     which are integers between 0 and 7 included.
     These are called the square 'coordinates'.
+    When the square belongs to a Board, its piece is read from 
+    (and written to) the board bitboards: the square is only a view.
     """
 
+    __slots__ = ("rank", "file", "color", "board", "_piece")
+
     RANK_NAMES = ['1','2','3','4','5','6','7','8']
     FILE_NAMES = ['a','b','c','d','e','f','g','h']
 
@@ -141,11 +169,13 @@ class Square() :
         """Return the SquareColor corresponding to the square coordinates."""
         return (file_number%2 + rank_number%2)%2
 
-    def __init__(self, rank_number, file_number) :
+    def __init__(self, rank_number, file_number, board=None) :
         self.rank = rank_number
         self.file = file_number
         self.color = Square.calculate_square_color(rank_number, file_number)
-        self.piece = None
+        self.board = board
+        # Only used if the square doesn't belong to a board
+        self._piece = None
     
     def __repr__(self) :
         return f"Square({self.rank},{self.file})"
@@ -186,14 +216,26 @@ class Square() :
     def get_color(self) :
         return self.color
     
+    @property
+    def piece(self) -> Piece :
+        if self.board is None :
+            return self._piece
+        return self.board.get_piece_at(self.get_number())
+    
     def put_piece(self, piece: Piece) :
         """Put the given piece on the square."""
-        self.piece = piece
+        if self.board is None :
+            self._piece = piece
+        else :
+            self.board.put_piece_on_square(piece, self)
     
     def remove_piece(self) :
         """Remove the piece (if exists) from the square.
         Nothing happens if the square was already empty."""
-        self.piece = None
+        if self.board is None :
+            self._piece = None
+        else :
+            self.board.remove_piece_at(self.get_number())
     
     def get_piece(self) -> Piece :
         """Return the piece which is on the square.
@@ -201,24 +243,52 @@ class Square() :
         return self.piece
 
     def has_piece(self) -> bool :
-        return self.piece is not None
+        if self.board is None :
+            return self._piece is not None
+        return bool(self.board.occupied & (1 << self.get_number()))
     
     def is_empty(self) -> bool :
-        return self.piece is None
+        return not self.has_piece()
 
 class Move() :
     """
     Chess class to manage moves.
-    A move is defined by the start_square and the destination_square.
+    A move is defined by the start_square and the destination_square, 
+    and the piece type chosen for a promotion if needed.
     An exception is raised if the start square has no piece.
+    Castling moves are king moves of two squares.
+    The squares are shared with the board, and the piece taken is only stored 
+    as its bitboard index (__slots__): Board.move_played can hold a lot of moves.
     """
 
-    def __init__(self, start_square: Square, destination_square: Square) :
+    __slots__ = ("start_square", "destination_square", "promotion", "piece_taken_index", "castling", "en_passant")
+
+    def __init__(self, start_square: Square, destination_square: Square, promotion: PieceType = None) :
         if start_square.is_empty() :
             raise NoPieceOnStartSquareException()
         self.start_square = start_square
         self.destination_square = destination_square
-        self.piece_taken = destination_square.piece
+        self.promotion = promotion
+        # Index of the bitboard of the piece taken (cf. Board.get_bitboard_index), None if there is none
+        board = destination_square.board
+        if board is not None :
+            self.piece_taken_index = board.get_bitboard_index_at(destination_square.get_number())
+        else :
+            piece = destination_square.piece
+            self.piece_taken_index = None if piece is None else piece.get_color().value*6 + piece.get_piece_type().value
+        # Set by Board.push_move
+        self.castling = False
+        self.en_passant = False
+    
+    @property
+    def piece_taken(self) -> Piece :
+        """The piece which was on the destination square (a view built from piece_taken_index), or None."""
+        index = self.piece_taken_index
+        if index is None :
+            return None
+        piece = PIECE_CLASSES[index % 6](PieceColor(index // 6))
+        piece.set_square_number(self.destination_square.get_number())
+        return piece
     
     def __str__(self) :
         return f"({self.start_square.get_number()},{self.destination_square.get_number()})"
@@ -226,32 +296,74 @@ class Move() :
     def get_san_notation(self) -> str :
         """
         Return the san notation of the move.
-        NB: disambiguation of ambiguous knight moves is not implemented.
+        The move must not have been played yet. If the squares belong to a board, 
+        the notation is complete (cf. Board.get_san), otherwise disambiguation, 
+        check and castling are not known.
         """
-        res = ""
+        board = self.start_square.board
+        if board is not None :
+            return board.get_san(self)
         moving_piece = self.start_square.piece
-        res = res + self.destination_square.get_name()
+        res = self.destination_square.get_name()
         if self.destination_square.has_piece() :
             res = 'x' + res
-            if type(moving_piece) is Pawn :
+            if moving_piece.get_piece_type() is PieceType.PAWN :
                 res = self.start_square.get_file_name() + res
-        if type(moving_piece) is not Pawn :
+        if moving_piece.get_piece_type() is not PieceType.PAWN :
             res = moving_piece.get_san_name() + res
+        elif self.promotion is not None :
+            res += '=' + PIECE_CLASSES[self.promotion.value](moving_piece.get_color()).get_san_name()
         return res
     
     def get_piece_taken(self) :
         return self.piece_taken
+    
+    def get_key(self) -> int :
+        """Return the key of the move in the move lines (cf. move_key)."""
+        promotion = self.promotion.value if self.promotion is not None else None
+        return move_key(self.start_square.get_number(), self.destination_square.get_number(), promotion)
+    
+    def is_special(self) -> bool :
+        """Return True if the move changes other squares than its start and 
+        destination squares, or changes the moving piece (castling, en passant, promotion)."""
+        return self.castling or self.en_passant or self.promotion is not None
+
+def write_file_atomically(file_path: str, data, mode: str = 'w') :
+    """
+    Write the data in a temporary file of the same folder, then rename it to file_path: 
+    even after a crash during the writing, the file is either the old one or the new one.
+    """
+    temporary_path = file_path + ".tmp"
+    with open(temporary_path, mode) as temporary_file :
+        temporary_file.write(data)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, file_path)
 
 class MoveLines(dict) :
     """
     Subclass from dict which is designed to contain moves (class Move).
+    The moves are the keys of nested dicts: 16-bit integers packing the start square, 
+    the destination square and the promotion (cf. move_key), written "start,dest" in the json files.
     The class has methods to save and load lines in/from json files.
+    The lines loaded from a database are saved incrementally: the moves added or removed 
+    are appended to a journal (<lines_name>_database.journal), which is merged into the database 
+    file when it gets big (cf. add_curent_lines_to_database).
     """
+
+    # Number of entries of the journal above which it is merged into the database file
+    JOURNAL_COMPACTION_SIZE = 1000
+
     # TODO: some work with the file gestion ... ...
     def __init__(self, lines_name=LINES_TO_BE_LOADED) :
         #
         dict.__init__(self)
         self.lines_name = lines_name
+        # Moves added or removed since the last save: list of (operation, line), operation is '+' or '-'.
+        # Only the lines loaded from a database are journaled.
+        self.journal_entries = []
+        self.journal_size = 0 # number of entries in the journal file
+        self.is_journaled = False
         #
         self["move_lines"] = {} # root node
         #
@@ -260,8 +372,24 @@ class MoveLines(dict) :
         else :
             self.load_from_database(lines_name)
         #
-        self.current_node = self["move_lines"]
-        self.current_line = []
+        self.go_to_root()
+    
+    def get_database_path(self, extension: str = ".json") -> str :
+        return FOLDER_PATH + "databases/" + self.lines_name + "_database" + extension
+    
+    @property
+    def root_fen(self) -> str :
+        """FEN of the position of the root, None for the initial position."""
+        return self.get("root_fen")
+    
+    def set_root_fen(self, fen: str) :
+        """Set the FEN of the position of the root (None for the initial position). 
+        The moves of the lines must be moves from this position."""
+        if fen is None :
+            self.pop("root_fen", None)
+        else :
+            self["root_fen"] = fen
+        self.go_to_root()
     
     def load_from_database(self, lines_name: str) :
         """
@@ -269,20 +397,93 @@ class MoveLines(dict) :
         "all" will load the entire database
         Otherwise: 
         For instance: "french" will select the moves which have been recorded under that name.
+        The journal of the database is replayed, if there is one.
         """
-        with open(FOLDER_PATH + "databases/" + lines_name + "_database.json") as json_database :
+        self.lines_name = lines_name
+        with open(self.get_database_path()) as json_database :
             loaded_dict = json.load(json_database)
-            print("loaded_dict : ", loaded_dict)
-        self["move_lines"] = loaded_dict["move_lines"]
+        self["move_lines"] = move_tree_from_json(loaded_dict["move_lines"])
+        if "root_fen" in loaded_dict :
+            self["root_fen"] = loaded_dict["root_fen"]
+        else :
+            self.pop("root_fen", None)
+        self.journal_entries = []
+        self.journal_size = self.replay_journal()
+        self.is_journaled = True
+        self.go_to_root()
+    
+    def replay_journal(self) -> int :
+        """Apply the entries of the journal file to the move lines and return their number. 
+        An incomplete last entry (the writing was interrupted) is ignored and removed from the file."""
+        journal_path = self.get_database_path(".journal")
+        if not os.path.exists(journal_path) :
+            return 0
+        entry_count = 0
+        journal_length = 0 # bytes of the complete entries
+        with open(journal_path) as journal_file :
+            for entry in journal_file :
+                if not entry.endswith("\n") :
+                    break
+                journal_length += len(entry.encode())
+                operation, *key_strings = entry.split()
+                line = [shared_key(key_from_json(key_string)) for key_string in key_strings]
+                node = self["move_lines"]
+                if operation == '+' :
+                    for key in line :
+                        node = node.setdefault(key, {})
+                elif operation == '-' :
+                    for key in line[:-1] :
+                        node = node.get(key, {})
+                    node.pop(line[-1], None)
+                entry_count += 1
+        if os.path.getsize(journal_path) != journal_length :
+            os.truncate(journal_path, journal_length)
+        return entry_count
     
     def save_new_database(self, database_name="new_database.json") :
         # TODO: relative path...
-        with open(FOLDER_PATH + "databases/" + database_name, 'w') as json_database :
-            json.dump(self, json_database) #indent=2
+        saved_dict = dict(self)
+        saved_dict["move_lines"] = move_tree_to_json(self["move_lines"])
+        write_file_atomically(FOLDER_PATH + "databases/" + database_name, json.dumps(saved_dict)) #indent=2
     
     def add_curent_lines_to_database(self) :
-        # TODO
-        pass
+        """
+        Save the moves added or removed since the last save in the database of the lines 
+        (<lines_name>_database.json), in O(number of moves added or removed): they are appended 
+        to the journal of the database. The journal is merged into the database file when 
+        it has more than JOURNAL_COMPACTION_SIZE entries.
+        Lines which were not loaded from a database are saved entirely.
+        """
+        if not self.is_journaled :
+            self.compact_journal()
+            return
+        if self.journal_entries :
+            entries = "".join(f"{operation} {' '.join(key_to_string(key) for key in line)}\n" 
+                              for operation, line in self.journal_entries)
+            with open(self.get_database_path(".journal"), 'a') as journal_file :
+                journal_file.write(entries)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            self.journal_size += len(self.journal_entries)
+            self.journal_entries = []
+        if self.journal_size > self.JOURNAL_COMPACTION_SIZE :
+            self.compact_journal()
+    
+    def compact_journal(self) :
+        """Write the whole move lines in the database file (atomically), and delete the journal."""
+        self.save_new_database(self.lines_name + "_database.json")
+        journal_path = self.get_database_path(".journal")
+        if os.path.exists(journal_path) :
+            os.remove(journal_path)
+        self.journal_entries = []
+        self.journal_size = 0
+        self.is_journaled = True
+    
+    def remove_move(self, key) :
+        """Remove the move of the key given from the current node, with all the moves after it."""
+        del self.current_node[key]
+        if self.is_journaled :
+            self.journal_entries.append(('-', tuple(self.current_line) + (key,)))
 
     def go_to_root(self) :
         """
@@ -291,6 +492,9 @@ class MoveLines(dict) :
         """
         self.current_node = self["move_lines"]
         self.current_line = []
+        # Nodes of the current line (root included), so that going 
+        # to the parent node doesn't need to walk the line from the root
+        self.node_stack = [self.current_node]
     
     def go_to_child(self, key) -> dict :
         """
@@ -300,10 +504,13 @@ class MoveLines(dict) :
         The key is added to the current_line attribute.
         """
         if key not in self.current_node :
+            key = shared_key(key)
             self.current_node[key] = {}
-            print("MoveRecord: Adding a new node.")
+            if self.is_journaled :
+                self.journal_entries.append(('+', tuple(self.current_line) + (key,)))
         self.current_line.append(key)
         self.current_node = self.current_node[key]
+        self.node_stack.append(self.current_node)
     
     def go_to_parent(self) -> dict :
         """
@@ -312,27 +519,25 @@ class MoveLines(dict) :
         """
         if self.current_line != [] :
             self.current_line.pop()
-            # We go to root then remake the line
-            self.current_node = self["move_lines"]
-            for key in self.current_line :
-                self.current_node = self.current_node[key]
+            self.node_stack.pop()
+            self.current_node = self.node_stack[-1]
         else :
             print("MoveRecord: Warning: already at the top node.")
 
-    def add_move(self, move: Move) :
+    def add_move(self, move: Move, position_hash: int = None) :
         """
         Add the move given to the dictionnary.
+        The position_hash argument (hash of the position reached) is not used in this class.
         """
-        key = f"{move.start_square.get_number()},{move.destination_square.get_number()}"
-        self.go_to_child(key)
+        self.go_to_child(move.get_key())
     
     def get_coords_of_current_node(self) -> tuple :
         """
-        Get the key of the curent node, for instance "52,44", 
+        Get the key of the first child of the curent node, 
         convert it to a tuple like (52,44) and return it.
         """
         key = next(iter(self.current_node))
-        coords = tuple(int(number) for number in key.split(','))
+        coords = (key & 63, (key >> 6) & 63)
         print(f"Coords of current move in the dict : {coords}")
         return coords
     
@@ -341,35 +546,481 @@ class MoveLines(dict) :
         Return the list of the coords of the children of the current node.
         Coords are tuple like (52,44).
         """
-        res = []
-        for key in self.current_node :
-            res.append(tuple(int(number) for number in key.split(',')))
-        return res
+        return [(key & 63, (key >> 6) & 63) for key in self.current_node]
+    
+    def choose_random_child(self) -> int :
+        """Return the key of a child of the current node chosen at random, 
+        or None if the current node has no child."""
+        key_list = list(self.current_node.keys())
+        if not key_list :
+            return None
+        return key_list[randrange(len(key_list))]
+
+def encode_move(start_square_number: int, destination_square_number: int, promotion: PieceType = None) -> int :
+    """
+    Return the move packed in a 16-bit integer: 
+    6 bits for the start square, 6 bits for the destination square 
+    and 3 bits for the promotion piece type (0 if there is no promotion).
+    """
+    promotion_value = promotion.value if promotion is not None else 0
+    return start_square_number | destination_square_number << 6 | promotion_value << 12
+
+def decode_move(move_code: int) -> tuple :
+    """Return the tuple (start_square_number, destination_square_number, promotion) 
+    of a move packed with encode_move."""
+    promotion_value = move_code >> 12
+    promotion = PieceType(promotion_value) if promotion_value else None
+    return (move_code & 63, (move_code >> 6) & 63, promotion)
+
+# Letters of the promotions in the string keys (cf. key_to_string)
+PROMOTION_LETTERS = {PieceType.KNIGHT.value: 'n', PieceType.BISHOP.value: 'b', PieceType.ROOK.value: 'r'}
+PROMOTION_VALUES = {letter: value for value, letter in PROMOTION_LETTERS.items()}
+
+def move_key(start_square_number: int, destination_square_number: int, promotion: int = None) -> int :
+    """
+    Return the key of a move in the move lines: the move packed in a 16-bit integer like encode_move, 
+    promotion being a PieceType value or None. A promotion to a queen is the default 
+    (cf. Board._make_move), it has the key of the move without promotion.
+    """
+    if promotion is None or promotion == PieceType.QUEEN.value :
+        return start_square_number | destination_square_number << 6
+    return start_square_number | destination_square_number << 6 | promotion << 12
+
+# The int objects of the keys stored in the move trees, shared by all the trees: 
+# the keys above 256 are not cached by Python, each edge would have its own object.
+SHARED_KEYS = {}
+
+def shared_key(key) -> int :
+    """Return the object shared by the move trees for the key (cf. SHARED_KEYS)."""
+    return SHARED_KEYS.setdefault(key, key)
+
+def key_to_move(key: int) -> tuple :
+    """Return the move tuple (start_square_number, destination_square_number, promotion) of the key, 
+    promotion being None for the moves without promotion and the promotions to a queen."""
+    return (key & 63, (key >> 6) & 63, (key >> 12) or None)
+
+def key_to_string(key) -> str :
+    """Return the key of the JSON files: "start,dest" (for instance "52,44"), 
+    followed by ",n", ",b" or ",r" for the under-promotions. 
+    Keys which are not integers (not valid) are returned unchanged."""
+    if not isinstance(key, int) :
+        return key
+    start_square_number, destination_square_number, promotion = key_to_move(key)
+    if promotion is None :
+        return f"{start_square_number},{destination_square_number}"
+    return f"{start_square_number},{destination_square_number},{PROMOTION_LETTERS[promotion]}"
+
+def key_from_string(key_string: str) -> int :
+    """Return the key of the move of a key of the JSON files (cf. key_to_string), or None if it is not valid."""
+    fields = key_string.split(',')
+    if not 2 <= len(fields) <= 3 or not fields[0].isdigit() or not fields[1].isdigit() :
+        return None
+    start_square_number, destination_square_number = int(fields[0]), int(fields[1])
+    if start_square_number > 63 or destination_square_number > 63 :
+        return None
+    if len(fields) == 2 :
+        return move_key(start_square_number, destination_square_number)
+    if fields[2] not in PROMOTION_VALUES :
+        return None
+    return move_key(start_square_number, destination_square_number, PROMOTION_VALUES[fields[2]])
+
+def key_from_json(key_string: str) :
+    """Return the key of a key of the JSON files, or the string itself if it is not valid: 
+    it is kept in the move lines, so that it can be reported (cf. chessopy.validation)."""
+    key = key_from_string(key_string)
+    return key_string if key is None else key
+
+def move_tree_from_json(json_tree: dict) -> dict :
+    """Return the nested dict of moves with integer keys of a nested dict read from a JSON file (cf. key_from_json)."""
+    res = {}
+    # Each key string is converted once, like the strings shared by json.loads
+    keys = {}
+    # Without recursion: the stack contains the pairs (JSON node, converted node)
+    stack = [(json_tree, res)]
+    while stack :
+        json_node, node = stack.pop()
+        for key_string, json_child in json_node.items() :
+            key = keys.get(key_string)
+            if key is None :
+                key = keys[key_string] = shared_key(key_from_json(key_string))
+            child = node[key] = {}
+            if json_child :
+                stack.append((json_child, child))
+    return res
+
+def move_tree_to_json(move_tree: dict) -> dict :
+    """Return the nested dict of moves with string keys to write in a JSON file (cf. move_tree_from_json)."""
+    res = {}
+    stack = [(move_tree, res)]
+    while stack :
+        node, json_node = stack.pop()
+        for key, child in node.items() :
+            json_child = json_node[key_to_string(key)] = {}
+            if child :
+                stack.append((child, json_child))
+    return res
+
+class UnknownPositionException(Exception) :
+    pass
+
+class PositionMoveLines(MoveLines) :
+    """
+    MoveLines where the nodes are positions, identified by their Zobrist hash, 
+    instead of the sequences of moves leading to them.
+    Lines which transpose share the same node, and so all the moves after it: 
+    the move lines are a directed acyclic graph instead of a tree.
+    The "positions" item maps each position hash to a dict of the moves 
+    from this position: {move key: hash of the position reached}.
+    The navigation methods are the same as in MoveLines.
+    """
+
+    def __init__(self, lines_name=LINES_TO_BE_LOADED, root_hash: int = None) :
+        #
+        dict.__init__(self)
+        self.lines_name = lines_name
+        # The root is the initial position by default
+        if root_hash is None :
+            root_hash = Board(MoveLines("new")).get_zobrist_hash()
+        self["root"] = root_hash
+        self["positions"] = {root_hash: {}}
+        #
+        if lines_name != "new" :
+            self.load_from_database(lines_name)
+        #
+        self.go_to_root()
+    
+    def load_from_database(self, lines_name: str) :
+        """
+        Load the lines saved in <lines_name>_database.json.
+        Files saved by MoveLines (nested dict of moves) are converted.
+        """
+        self.lines_name = lines_name
+        with open(FOLDER_PATH + "databases/" + lines_name + "_database.json") as json_database :
+            loaded_dict = json.load(json_database)
+        self.set_root_fen(loaded_dict.get("root_fen"))
+        if "positions" in loaded_dict :
+            self["root"] = int(loaded_dict["root"], 16)
+            self["positions"] = {int(position_hash, 16): {key_from_json(key): int(child_hash, 16) 
+                                                          for key, child_hash in moves.items()} 
+                                 for position_hash, moves in loaded_dict["positions"].items()}
+        else :
+            self["positions"] = {self["root"]: {}}
+            bad_edges = self.add_move_tree(move_tree_from_json(loaded_dict["move_lines"]))
+            if bad_edges :
+                print(f"PositionMoveLines: Warning: {len(bad_edges)} moves not valid skipped in {lines_name}.")
+        self.go_to_root()
+    
+    def save_new_database(self, database_name="new_database.json") :
+        # Hashes are written in hexadecimal
+        saved_dict = {
+            "root": format(self["root"], 'x'),
+            "positions": {format(position_hash, 'x'): {key_to_string(key): format(child_hash, 'x') 
+                                                       for key, child_hash in moves.items()} 
+                          for position_hash, moves in self["positions"].items()}
+        }
+        if self.root_fen is not None :
+            saved_dict["root_fen"] = self.root_fen
+        write_file_atomically(FOLDER_PATH + "databases/" + database_name, json.dumps(saved_dict))
+    
+    def add_curent_lines_to_database(self) :
+        """Save the move lines in the database of the lines (<lines_name>_database.json), entirely."""
+        self.save_new_database(self.lines_name + "_database.json")
+    
+    def set_root_fen(self, fen: str) :
+        """Set the FEN of the position of the root (None for the initial position), 
+        the root becomes the node of this position."""
+        if fen is None :
+            self.pop("root_fen", None)
+        else :
+            self["root_fen"] = fen
+        board = Board(MoveLines("new"))
+        board.set_fen(fen or STARTING_FEN)
+        self["root"] = board.get_zobrist_hash()
+        self["positions"].setdefault(self["root"], {})
+        self.go_to_root()
+    
+    def add_move_tree(self, move_tree: dict) -> list :
+        """
+        Add the moves of a nested dict of moves (like the "move_lines" item of MoveLines) 
+        from the root position. The moves are replayed on a board to get the positions.
+        The moves which are not valid or not legal (cf. chessopy.validation.play_key) are skipped 
+        with the moves after them, and returned as a list of chessopy.validation.BadEdge.
+        """
+        # Not imported with the module: chessopy.validation imports chessopy
+        from chessopy.validation import BadEdge, play_key
+        bad_edges = []
+        board = Board(MoveLines("new"))
+        board.set_fen(self.root_fen or STARTING_FEN)
+        if board.get_zobrist_hash() != self["root"] :
+            raise UnknownPositionException()
+        positions = self["positions"]
+        # Depth-first traversal without recursion: the stack contains the position hash, 
+        # the line and the iterator on the children of each node
+        stack = [(self["root"], (), iter(move_tree.items()))]
+        undo_stack = []
+        while stack :
+            position_hash, line, children = stack[-1]
+            child = next(children, None)
+            if child is None :
+                stack.pop()
+                if undo_stack :
+                    board._unmake_move(undo_stack.pop())
+                continue
+            key, subtree = child
+            undo, reason = play_key(board, key)
+            if undo is None :
+                bad_edges.append(BadEdge(line + (key,), reason))
+                continue
+            undo_stack.append(undo)
+            child_hash = board.get_zobrist_hash()
+            positions[position_hash][key] = child_hash
+            positions.setdefault(child_hash, {})
+            stack.append((child_hash, line + (key,), iter(subtree.items())))
+        return bad_edges
+
+    def go_to_root(self) :
+        """
+        Set the current_node attribute to the moves of the root position.
+        The current_line is reseted.
+        """
+        self.current_node = self["positions"][self["root"]]
+        self.current_line = []
+        # Hashes of the positions of the current line (root included)
+        self.position_stack = [self["root"]]
+    
+    def go_to_child(self, key, position_hash: int = None) :
+        """
+        Set the current_node attribute to the child using the key given.
+        If the key does not exist, a new move is added to the current node, 
+        and position_hash (hash of the position reached) must be given.
+        The key is added to the current_line attribute.
+        """
+        if key in self.current_node :
+            position_hash = self.current_node[key]
+        else :
+            if position_hash is None :
+                raise UnknownPositionException()
+            self.current_node[key] = position_hash
+        self.current_line.append(key)
+        self.position_stack.append(position_hash)
+        self.current_node = self["positions"].setdefault(position_hash, {})
+    
+    def go_to_parent(self) :
+        """
+        Set the current_node attribute to the position before the last move of the current line.
+        The current node is unchanched if current_node is already at the top.
+        """
+        if self.current_line != [] :
+            self.current_line.pop()
+            self.position_stack.pop()
+            self.current_node = self["positions"][self.position_stack[-1]]
+        else :
+            print("MoveRecord: Warning: already at the top node.")
+    
+    def add_move(self, move: Move, position_hash: int = None) :
+        """
+        Add the move given to the current node.
+        position_hash is the hash of the position reached, it is needed if the move is new.
+        """
+        self.go_to_child(move.get_key(), position_hash)
+    
+    def get_current_position_hash(self) -> int :
+        return self.position_stack[-1]
 
 class NotValidSanMoveException(Exception) :
     pass
 
+class NotValidFenException(Exception) :
+    pass
+
+class IllegalMoveException(Exception) :
+    pass
+
+############ Move generation tables ############
+
+# Castling rights are stored in an integer as the sum of these flags
+WHITE_KING_SIDE = 1
+WHITE_QUEEN_SIDE = 2
+BLACK_KING_SIDE = 4
+BLACK_QUEEN_SIDE = 8
+
+# Castling rights kept when a piece leaves or arrives on a square
+CASTLING_RIGHTS_MASKS = [15] * 64
+CASTLING_RIGHTS_MASKS[0] = 15 & ~WHITE_QUEEN_SIDE
+CASTLING_RIGHTS_MASKS[7] = 15 & ~WHITE_KING_SIDE
+CASTLING_RIGHTS_MASKS[4] = 15 & ~(WHITE_KING_SIDE | WHITE_QUEEN_SIDE)
+CASTLING_RIGHTS_MASKS[56] = 15 & ~BLACK_QUEEN_SIDE
+CASTLING_RIGHTS_MASKS[63] = 15 & ~BLACK_KING_SIDE
+CASTLING_RIGHTS_MASKS[60] = 15 & ~(BLACK_KING_SIDE | BLACK_QUEEN_SIDE)
+
+def _step_attacks(square_number: int, steps: List[tuple]) -> int :
+    """Return the mask of the squares reached from the given square with 
+    the (rank, file) steps given, ignoring those which leave the board."""
+    rank_number, file_number = divmod(square_number, 8)
+    res = 0
+    for rank_step, file_step in steps :
+        rank, file = rank_number + rank_step, file_number + file_step
+        if 0 <= rank < 8 and 0 <= file < 8 :
+            res |= 1 << (rank*8 + file)
+    return res
+
+def _ray(square_number: int, rank_step: int, file_step: int) -> int :
+    """Return the mask of the squares in the given direction from the given square 
+    (the square itself excluded), up to the edge of the board."""
+    rank_number, file_number = divmod(square_number, 8)
+    res = 0
+    rank, file = rank_number + rank_step, file_number + file_step
+    while 0 <= rank < 8 and 0 <= file < 8 :
+        res |= 1 << (rank*8 + file)
+        rank, file = rank + rank_step, file + file_step
+    return res
+
+KNIGHT_STEPS = [(1,2), (2,1), (2,-1), (1,-2), (-1,-2), (-2,-1), (-2,1), (-1,2)]
+KING_STEPS = [(1,0), (1,1), (0,1), (-1,1), (-1,0), (-1,-1), (0,-1), (1,-1)]
+
+KNIGHT_ATTACKS = [_step_attacks(n, KNIGHT_STEPS) for n in range(64)]
+KING_ATTACKS = [_step_attacks(n, KING_STEPS) for n in range(64)]
+# PAWN_ATTACKS[color.value][square_number]
+PAWN_ATTACKS = [[_step_attacks(n, [(-1,-1), (-1,1)]) for n in range(64)],
+                [_step_attacks(n, [(1,-1), (1,1)]) for n in range(64)]]
+
+# Rays in directions where square numbers increase (the nearest blocker is the 
+# least significant bit) and in directions where they decrease (most significant bit).
+ROOK_RAYS_UP = [[_ray(n, 1, 0) for n in range(64)], [_ray(n, 0, 1) for n in range(64)]]
+ROOK_RAYS_DOWN = [[_ray(n, -1, 0) for n in range(64)], [_ray(n, 0, -1) for n in range(64)]]
+BISHOP_RAYS_UP = [[_ray(n, 1, 1) for n in range(64)], [_ray(n, 1, -1) for n in range(64)]]
+BISHOP_RAYS_DOWN = [[_ray(n, -1, -1) for n in range(64)], [_ray(n, -1, 1) for n in range(64)]]
+
+def _sliding_attacks(square_number: int, occupied: int, rays_up: List[List[int]], rays_down: List[List[int]]) -> int :
+    """Return the mask of the squares attacked along the given rays, 
+    the rays being stopped by the first occupied square."""
+    res = 0
+    for rays in rays_up :
+        attacks = rays[square_number]
+        blockers = attacks & occupied
+        if blockers :
+            attacks ^= rays[(blockers & -blockers).bit_length() - 1]
+        res |= attacks
+    for rays in rays_down :
+        attacks = rays[square_number]
+        blockers = attacks & occupied
+        if blockers :
+            attacks ^= rays[blockers.bit_length() - 1]
+        res |= attacks
+    return res
+
+def rook_attacks(square_number: int, occupied: int) -> int :
+    """Return the mask of the squares attacked by a rook on the given square."""
+    return _sliding_attacks(square_number, occupied, ROOK_RAYS_UP, ROOK_RAYS_DOWN)
+
+def bishop_attacks(square_number: int, occupied: int) -> int :
+    """Return the mask of the squares attacked by a bishop on the given square."""
+    return _sliding_attacks(square_number, occupied, BISHOP_RAYS_UP, BISHOP_RAYS_DOWN)
+
+# Piece types a pawn can be promoted to, in the order moves are generated
+PROMOTION_TYPES = [PieceType.QUEEN.value, PieceType.ROOK.value, PieceType.BISHOP.value, PieceType.KNIGHT.value]
+
+# PieceColor indexed by value, avoids an Enum lookup in the move generator
+COLORS = (PieceColor.BLACK, PieceColor.WHITE)
+
+############ SAN ############
+
+SQUARE_NAMES = [f"{Square.FILE_NAMES[n & 7]}{Square.RANK_NAMES[n >> 3]}" for n in range(64)]
+
+# Groups: piece, start file, start rank, capture, destination, promotion, castling
+SAN_PATTERN = re.compile(r"^(?:([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?|(O-O-O|O-O|0-0-0|0-0))[+#]?$")
+SAN_PIECE_TYPE_VALUES = {'N': 1, 'B': 2, 'R': 3, 'Q': 4, 'K': 5}
+
+@lru_cache(maxsize=4096)
+def _parse_san_string(san_string: str) -> tuple :
+    """
+    Return the tuple (piece_type_value, start_file_number, start_rank_number, capture, 
+    destination_square_number, promotion, castling) of the san move given, without looking 
+    at any position (so the results can be cached). castling is 2 for king side, -2 for 
+    queen side and 0 otherwise. Missing informations are None.
+    An exception is raised if the san move is not valid.
+    """
+    match = SAN_PATTERN.match(san_string)
+    if not match :
+        raise NotValidSanMoveException()
+    piece_name, file_name, rank_name, capture, destination_name, promotion_name, castling = match.groups()
+    if castling :
+        return (5, None, None, False, None, None, -2 if castling in ('O-O-O', '0-0-0') else 2)
+    return (SAN_PIECE_TYPE_VALUES[piece_name] if piece_name else 0, 
+            Square.FILE_NAMES.index(file_name) if file_name else None, 
+            Square.RANK_NAMES.index(rank_name) if rank_name else None, 
+            capture is not None, 
+            SQUARE_NAMES.index(destination_name), 
+            SAN_PIECE_TYPE_VALUES[promotion_name] if promotion_name else None, 
+            0)
+
+############ Zobrist hashing ############
+
+# Random keys XORed together to compute the 64-bit hash of a position.
+# These are the keys of the PolyGlot book format, so the hash of a position 
+# is its key in PolyGlot books (cf. chessopy.polyglot).
+# ZOBRIST_PIECES[bitboard_index][square_number]
+ZOBRIST_PIECES = [[POLYGLOT_RANDOM_ARRAY[64*(2*(index % 6) + index // 6) + n] for n in range(64)] 
+                  for index in range(12)]
+# ZOBRIST_CASTLING[castling_rights]
+ZOBRIST_CASTLING = [0] * 16
+for _castling_rights in range(16) :
+    for _k in range(4) :
+        if _castling_rights & (1 << _k) :
+            ZOBRIST_CASTLING[_castling_rights] ^= POLYGLOT_RANDOM_ARRAY[768 + _k]
+# ZOBRIST_EP_FILES[file_number], used only if a pawn can take en passant, so that 
+# transpositions which differ only by an unusable en passant square have the same hash.
+ZOBRIST_EP_FILES = POLYGLOT_RANDOM_ARRAY[772:780]
+# Used if white is to move
+ZOBRIST_TURN = POLYGLOT_RANDOM_ARRAY[780]
+
+############ FEN ############
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# States of the positions parsed by Board.set_fen: {fen: Board.get_position_state()}, 
+# the least recently used ones are dropped above FEN_CACHE_SIZE positions
+FEN_CACHE = OrderedDict()
+FEN_CACHE_SIZE = 256
+
 class Board() :
     """
     Business class for the chess board.
 
-    The board contains a list of 64 squares named squares.
-    The pieces are stored in black_pieces and white_pieces lists 
-    when created (allows to iterate on the piece of a side without 
-    testing a color condition).
+    The position is stored in bitboards: 12 integers used as 64-bit masks, 
+    one for each piece type and color (bit n is set if such a piece is on 
+    the square number n), plus occupancy masks for each color and for 
+    both of them.
+
+    The board also contains a list of 64 squares named squares. 
+    These squares, and the pieces they return, are views over the bitboards.
 
     >>> board = Board()
     """
 
+    BACK_RANK_PIECE_TYPES = [PieceType.ROOK, PieceType.KNIGHT, PieceType.BISHOP, PieceType.QUEEN, 
+                             PieceType.KING, PieceType.BISHOP, PieceType.KNIGHT, PieceType.ROOK]
+
+    FEN_PIECE_NAMES = "PNBRQK"
+    FEN_PIECE_TYPES = {name: PieceType(value) for value, name in enumerate(FEN_PIECE_NAMES)}
+    # FEN name of the pieces of each bitboard
+    FEN_NAMES_BY_INDEX = FEN_PIECE_NAMES.lower() + FEN_PIECE_NAMES
+    FEN_CASTLING_FLAGS = {'K': WHITE_KING_SIDE, 'Q': WHITE_QUEEN_SIDE, 'k': BLACK_KING_SIDE, 'q': BLACK_QUEEN_SIDE}
+
     @staticmethod
-    def create_squares() -> List[Square] :
+    def create_squares(board=None) -> List[Square] :
         """Return a list of all the board squares."""
         res = []
         for rank_number in range(8):
             for file_number in range(8):
-                res.append(Square(rank_number, file_number))
+                res.append(Square(rank_number, file_number, board))
         return res
     
+    @staticmethod
+    def get_bitboard_index(piece_type: PieceType, color: PieceColor) -> int :
+        """Return the index of the bitboard of the given piece type and color."""
+        return color.value*6 + piece_type.value
+    
     @staticmethod
     def create_pieces_set(color: PieceColor) : # NB: not used for the moment
         """Return a list of 8 pawns, 2 rooks, 2 bishops, 2 knights, 1 queen, 1 knight,
@@ -381,16 +1032,34 @@ class Board() :
         res += [Queen(color), King(color)]
         return res
 
-    def __init__(self) :
-        self.squares = Board.create_squares()
-        self.white_pieces = []
-        self.black_pieces = []
+    def __init__(self, move_lines: MoveLines = None) :
+        # bitboards[color.value*6 + piece_type.value]
+        self.bitboards = [0] * 12
+        # occupied_co[color.value]
+        self.occupied_co = [0, 0]
+        self.occupied = 0
+        self.squares = Board.create_squares(self)
+        # Game state
+        self.turn = PieceColor.WHITE
+        self.castling_rights = WHITE_KING_SIDE | WHITE_QUEEN_SIDE | BLACK_KING_SIDE | BLACK_QUEEN_SIDE
+        self.ep_square = None # square number where a pawn can take en passant
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # 64-bit Zobrist hash of the position, updated with the moves
+        self.zobrist_hash = 0
+        # undo_stack contains the tuples returned by _make_move 
+        # for the moves in move_played
+        self.undo_stack = []
         # move_played is a list of moves (class Move)
         self.move_played = []
-        # move_lines is a MoveLines object.
+        # Number of the last moves of move_played which are not in move_lines (cf. move_piece)
+        self.unrecorded_move_count = 0
+        # move_lines is a MoveLines object (a new one is loaded if None is given).
         # Its current_line attribute is a list of coords of moves :
         # (start_square_number, destination_square_number)
-        self.move_lines = MoveLines()
+        if move_lines is None :
+            move_lines = MoveLines()
+        self.move_lines = move_lines
         #
         self.set_new_game()
     
@@ -420,470 +1089,904 @@ class Board() :
         file_number = Square.FILE_NAMES.index(square_name[0])
         return self.get_square_from_coords(rank_number, file_number)
     
+    def get_bitboard(self, piece_type: PieceType, color: PieceColor) -> int :
+        """Return the mask of the squares occupied by pieces of the given type and color."""
+        return self.bitboards[color.value*6 + piece_type.value]
+    
+    def get_occupancy(self, color: PieceColor = None) -> int :
+        """Return the mask of the squares occupied by pieces of the given color,
+        or by any piece if no color is given."""
+        if color is None :
+            return self.occupied
+        return self.occupied_co[color.value]
+    
+    def get_bitboard_index_at(self, square_number: int) -> int :
+        """Return the index of the bitboard which contains the square number given.
+        Return None if the square is empty."""
+        mask = 1 << square_number
+        if not self.occupied & mask :
+            return None
+        index = 0 if self.occupied_co[0] & mask else 6
+        while not self.bitboards[index] & mask :
+            index += 1
+        return index
+    
+    def get_piece_type_at(self, square_number: int) -> PieceType :
+        """Return the type of the piece on the square number given, or None."""
+        index = self.get_bitboard_index_at(square_number)
+        if index is None :
+            return None
+        return PieceType(index % 6)
+    
+    def get_color_at(self, square_number: int) -> PieceColor :
+        """Return the color of the piece on the square number given, or None."""
+        mask = 1 << square_number
+        if self.occupied_co[PieceColor.WHITE.value] & mask :
+            return PieceColor.WHITE
+        if self.occupied_co[PieceColor.BLACK.value] & mask :
+            return PieceColor.BLACK
+        return None
+    
+    def get_piece_at(self, square_number: int) -> Piece :
+        """
+        Return a Piece object describing the piece on the square number given.
+        Return None if the square is empty.
+        NB: the piece is a view built from the bitboards, two calls 
+        return two different objects.
+        """
+        index = self.get_bitboard_index_at(square_number)
+        if index is None :
+            return None
+        piece = PIECE_CLASSES[index % 6](PieceColor(index // 6))
+        piece.set_square_number(square_number)
+        return piece
+    
+    def set_piece_at(self, square_number: int, piece_type: PieceType, color: PieceColor) :
+        """Put a piece of the given type and color on the square number given.
+        The piece which was on the square, if any, is removed."""
+        self.remove_piece_at(square_number)
+        mask = 1 << square_number
+        self.bitboards[color.value*6 + piece_type.value] |= mask
+        self.occupied_co[color.value] |= mask
+        self.occupied |= mask
+        self.zobrist_hash ^= ZOBRIST_PIECES[color.value*6 + piece_type.value][square_number]
+    
+    def remove_piece_at(self, square_number: int) :
+        """Remove the piece on the square number given.
+        Nothing happens if the square was already empty."""
+        index = self.get_bitboard_index_at(square_number)
+        if index is None :
+            return
+        mask = ~(1 << square_number)
+        self.bitboards[index] &= mask
+        self.occupied_co[index // 6] &= mask
+        self.occupied &= mask
+        self.zobrist_hash ^= ZOBRIST_PIECES[index][square_number]
+    
     def put_piece_on_square(self, piece: Piece, square: Square) :
-        square.put_piece(piece)
+        self.set_piece_at(square.get_number(), piece.get_piece_type(), piece.get_color())
         piece.set_square_number(square.get_number())
+    
+    def get_pieces(self, color: PieceColor) -> List[Piece] :
+        """Return a list containing the pieces of the given color (views)."""
+        res = []
+        for piece_type in PieceType :
+            bitboard = self.bitboards[color.value*6 + piece_type.value]
+            while bitboard :
+                square_number = (bitboard & -bitboard).bit_length() - 1
+                piece = PIECE_CLASSES[piece_type.value](color)
+                piece.set_square_number(square_number)
+                res.append(piece)
+                bitboard &= bitboard - 1
+        return res
+    
+    @property
+    def white_pieces(self) -> List[Piece] :
+        return self.get_pieces(PieceColor.WHITE)
+    
+    @property
+    def black_pieces(self) -> List[Piece] :
+        return self.get_pieces(PieceColor.BLACK)
 
     def get_all_pieces(self) -> List[Piece] :
         """Return a list containing all the pieces on board.
-        Note that this method does not allow to modify the piece lists 
-        of the board."""
+        Note that the pieces are views: modifying them doesn't modify the board."""
         return self.white_pieces + self.black_pieces
 
     def delete_all_pieces(self) :
-        """Renew white_pieces and black_pieces as new lists.
-        NB: This method doesn't really delete the piece since they still exist 
-        on the squares !"""
-        # TODO: improve the gestion of pieces
-        # (these two lists seem pointless...)
-        self.white_pieces = []
-        self.black_pieces = []
+        """Remove all the pieces from the board."""
+        self.bitboards = [0] * 12
+        self.occupied_co = [0, 0]
+        self.occupied = 0
     
     def set_new_game(self) :
         """
-        Set the white and black pieces on the board.
+        Set the position of the root of the move lines: the initial position, 
+        or the position of their root_fen if they have one.
         """
-        #
-        self.move_played = []
-        self.move_lines.go_to_root()
-        # Clean the board
-        self.delete_all_pieces()
-        for square in self.squares :
-            square.piece = None
-        # Create and put the 8 pawns on each side
-        for file_number in range(8) :
-            white_pawn = Pawn(PieceColor.WHITE)
-            self.white_pieces.append(white_pawn)
-            self.put_piece_on_square(white_pawn, self.get_square_from_coords(1, file_number))
-            black_pawn = Pawn(PieceColor.BLACK)
-            self.black_pieces.append(black_pawn)
-            self.put_piece_on_square(black_pawn, self.get_square_from_coords(6, file_number))
-        # Create and put pieces which come by two
-        for k in range(2) :
-            white_bishop = Bishop(PieceColor.WHITE)
-            white_knight = Knight(PieceColor.WHITE)
-            white_rook = Rook(PieceColor.WHITE)
-            self.white_pieces.extend([white_bishop, white_knight, white_rook])
-            self.put_piece_on_square(white_bishop, self.get_square_from_coords(0, 2+k*3))
-            self.put_piece_on_square(white_knight, self.get_square_from_coords(0, 1+k*5))
-            self.put_piece_on_square(white_rook, self.get_square_from_coords(0, 0+k*7))
-            black_bishop = Bishop(PieceColor.BLACK)
-            black_knight = Knight(PieceColor.BLACK)
-            black_rook = Rook(PieceColor.BLACK)
-            self.black_pieces.extend([black_bishop, black_knight, black_rook])
-            self.put_piece_on_square(black_bishop, self.get_square_from_coords(7, 2+k*3))
-            self.put_piece_on_square(black_knight, self.get_square_from_coords(7, 1+k*5))
-            self.put_piece_on_square(black_rook, self.get_square_from_coords(7, 0+k*7))
-        # King and Queen
-        white_queen = Queen(PieceColor.WHITE)
-        self.white_pieces.append(white_queen)
-        self.put_piece_on_square(white_queen, self.get_square_from_coords(0, 3))
-        black_queen = Queen(PieceColor.BLACK)
-        self.black_pieces.append(black_queen)
-        self.put_piece_on_square(black_queen, self.get_square_from_coords(7, 3))
-        white_king = King(PieceColor.WHITE)
-        self.white_pieces.append(white_king)
-        self.put_piece_on_square(white_king, self.get_square_from_coords(0, 4))
-        black_king = King(PieceColor.BLACK)
-        self.black_pieces.append(black_king)
-        self.put_piece_on_square(black_king, self.get_square_from_coords(7, 4))
-
-    def move_piece(self, piece: Piece, destination_square: Square, undo=False) :
-        """Moves the given piece on the given square."""
+        self.set_fen(self.move_lines.root_fen or STARTING_FEN)
+
+    def move_piece(self, piece: Piece, destination_square: Square, undo=False, promotion: PieceType = None, 
+                   record: bool = True) :
+        """Moves the given piece on the given square.
+        The move is recorded in move_played and move_lines, unless undo is True.
+        If record is False (a move of the engine for instance), the move is not added to move_lines: 
+        the position is then out of the lines, and so are the moves played after it, until it is undone."""
         # Get the values needed
         start_square_number = piece.get_square_number()
         start_square = self.get_square_from_number(start_square_number)
+        destination_square_number = destination_square.get_number()
+        if undo :
+            # Move piece without recording anything
+            self.remove_piece_at(start_square_number)
+            self.set_piece_at(destination_square_number, piece.get_piece_type(), piece.get_color())
+            piece.set_square_number(destination_square_number)
+            return
         # Record move
-        if not undo :
-            move = Move(start_square, destination_square)
-            # In move_played
-            self.move_played.append(move)
-            # In move_lines
-            self.move_lines.add_move(move)
-            #
-            print(move.get_san_notation())
-        # Move piece
-        piece.set_square_number(destination_square.get_number())
-        start_square.remove_piece()
-        destination_square.put_piece(piece)
+        move = Move(start_square, destination_square, promotion)
+        # Move piece (and record it in move_played)
+        self.push_move(move)
+        piece.set_square_number(destination_square_number)
+        # In move_lines (with the position reached)
+        if record and not self.unrecorded_move_count :
+            self.move_lines.add_move(move, self.zobrist_hash)
+        else :
+            self.unrecorded_move_count += 1
+    
+    def move_from_numbers(self, start_square_number: int, destination_square_number: int, promotion: PieceType = None, 
+                          record: bool = True) :
+        """Move the piece on the start square to the destination square (cf. move_piece).
+        An exception is raised if there is no piece on the start square."""
+        piece = self.get_piece_at(start_square_number)
+        if piece is None :
+            raise NoPieceOnStartSquareException()
+        self.move_piece(piece, self.squares[destination_square_number], promotion=promotion, record=record)
     
     def pop_last_move(self) -> Move :
         """Undo the last move and return it."""
-        # Pop move from move_played
+        # Go in the parent in move_lines, if the move is in the lines
+        if self.unrecorded_move_count :
+            self.unrecorded_move_count -= 1
+        else :
+            self.move_lines.go_to_parent()
+        # Pop move from move_played and change what to be changed on the board
+        return self.pop_move()
+    
+    def push_move(self, move: Move) :
+        """
+        Make the move given on the board and append it to move_played.
+        The move is not checked, but the rules are applied: castling moves the rook, 
+        en passant removes the pawn taken, and a pawn reaching the last rank is promoted 
+        (to a queen if move.promotion is None).
+        """
+        promotion = move.promotion.value if move.promotion is not None else None
+        undo = self._make_move(move.start_square.get_number(), move.destination_square.get_number(), promotion)
+        moving_index, new_index, captured_index, captured_square_number, rook_move = undo[2:7]
+        if new_index != moving_index :
+            move.promotion = PieceType(new_index % 6)
+        move.castling = rook_move is not None
+        if captured_index is not None and captured_square_number != undo[1] :
+            move.en_passant = True
+        self.move_played.append(move)
+        self.undo_stack.append(undo)
+    
+    def pop_move(self) -> Move :
+        """Undo the last move of move_played and return it."""
         last_move = self.move_played.pop()
-        # Go in the parent in move_lines
-        self.move_lines.go_to_parent()
-        # Change what to be changed on the board
-        self.move_piece(last_move.destination_square.piece, last_move.start_square, undo=True)
-        if last_move.piece_taken is not None :
-            self.put_piece_on_square(last_move.piece_taken, last_move.destination_square)
+        self._unmake_move(self.undo_stack.pop())
         return last_move
     
+    def _make_move(self, start_square_number: int, destination_square_number: int, promotion: int = None) -> tuple :
+        """
+        Make the move on the bitboards and update the game state.
+        promotion is a PieceType value, or None.
+        Return a tuple of the informations needed by _unmake_move.
+        """
+        bitboards = self.bitboards
+        occupied_co = self.occupied_co
+        start_mask = 1 << start_square_number
+        destination_mask = 1 << destination_square_number
+        moving_index = self.get_bitboard_index_at(start_square_number)
+        color_value = moving_index // 6
+        piece_type_value = moving_index - color_value*6
+        zobrist_hash = self.zobrist_hash
+        if self.ep_square is not None :
+            zobrist_hash ^= self._get_ep_zobrist_key()
+        # Piece taken
+        captured_square_number = destination_square_number
+        captured_index = self.get_bitboard_index_at(destination_square_number)
+        if piece_type_value == 0 and destination_square_number == self.ep_square and captured_index is None \
+                and (destination_square_number - start_square_number) % 8 != 0 :
+            captured_square_number = destination_square_number - 8 if color_value else destination_square_number + 8
+            captured_index = self.get_bitboard_index_at(captured_square_number)
+        if captured_index is not None :
+            captured_mask = ~(1 << captured_square_number)
+            bitboards[captured_index] &= captured_mask
+            occupied_co[captured_index // 6] &= captured_mask
+            zobrist_hash ^= ZOBRIST_PIECES[captured_index][captured_square_number]
+        # Moving piece (with promotion)
+        new_index = moving_index
+        if piece_type_value == 0 and destination_square_number >> 3 == (7 if color_value else 0) :
+            new_index = color_value*6 + (promotion if promotion is not None else 4)
+        bitboards[moving_index] &= ~start_mask
+        bitboards[new_index] |= destination_mask
+        occupied_co[color_value] = (occupied_co[color_value] & ~start_mask) | destination_mask
+        zobrist_hash ^= ZOBRIST_PIECES[moving_index][start_square_number] ^ ZOBRIST_PIECES[new_index][destination_square_number]
+        # Rook of a castling move
+        rook_move = None
+        if piece_type_value == 5 and start_square_number in (4, 60) \
+                and abs(destination_square_number - start_square_number) == 2 :
+            if destination_square_number > start_square_number :
+                rook_move = (start_square_number + 3, start_square_number + 1)
+            else :
+                rook_move = (start_square_number - 4, start_square_number - 1)
+            rook_index = self.get_bitboard_index_at(rook_move[0])
+            if rook_index is None :
+                rook_move = None
+            else :
+                rook_mask = (1 << rook_move[0]) | (1 << rook_move[1])
+                bitboards[rook_index] ^= rook_mask
+                occupied_co[rook_index // 6] ^= rook_mask
+                zobrist_hash ^= ZOBRIST_PIECES[rook_index][rook_move[0]] ^ ZOBRIST_PIECES[rook_index][rook_move[1]]
+                rook_move = rook_move + (rook_index,)
+        self.occupied = occupied_co[0] | occupied_co[1]
+        # Game state
+        undo = (start_square_number, destination_square_number, moving_index, new_index, 
+                captured_index, captured_square_number, rook_move, 
+                self.castling_rights, self.ep_square, self.turn, self.halfmove_clock, self.fullmove_number, 
+                self.zobrist_hash)
+        zobrist_hash ^= ZOBRIST_CASTLING[self.castling_rights] ^ ZOBRIST_TURN
+        self.castling_rights &= CASTLING_RIGHTS_MASKS[start_square_number] & CASTLING_RIGHTS_MASKS[destination_square_number]
+        zobrist_hash ^= ZOBRIST_CASTLING[self.castling_rights]
+        if piece_type_value == 0 and abs(destination_square_number - start_square_number) == 16 :
+            self.ep_square = (start_square_number + destination_square_number) // 2
+            # The en passant key depends on the opponent pawns, the turn must be set before
+            self.turn = COLORS[1 - color_value]
+            zobrist_hash ^= self._get_ep_zobrist_key()
+        else :
+            self.ep_square = None
+        if piece_type_value == 0 or captured_index is not None :
+            self.halfmove_clock = 0
+        else :
+            self.halfmove_clock += 1
+        if not color_value :
+            self.fullmove_number += 1
+        self.turn = COLORS[1 - color_value]
+        self.zobrist_hash = zobrist_hash
+        return undo
+    
+    def _unmake_move(self, undo: tuple) :
+        """Undo a move made with _make_move, using the tuple it returned."""
+        start_square_number, destination_square_number, moving_index, new_index, \
+            captured_index, captured_square_number, rook_move, \
+            self.castling_rights, self.ep_square, self.turn, self.halfmove_clock, self.fullmove_number, \
+            self.zobrist_hash = undo
+        bitboards = self.bitboards
+        occupied_co = self.occupied_co
+        color_value = moving_index // 6
+        start_mask = 1 << start_square_number
+        destination_mask = 1 << destination_square_number
+        bitboards[new_index] &= ~destination_mask
+        bitboards[moving_index] |= start_mask
+        occupied_co[color_value] = (occupied_co[color_value] & ~destination_mask) | start_mask
+        if rook_move is not None :
+            rook_mask = (1 << rook_move[0]) | (1 << rook_move[1])
+            bitboards[rook_move[2]] ^= rook_mask
+            occupied_co[rook_move[2] // 6] ^= rook_mask
+        if captured_index is not None :
+            captured_mask = 1 << captured_square_number
+            bitboards[captured_index] |= captured_mask
+            occupied_co[captured_index // 6] |= captured_mask
+        self.occupied = occupied_co[0] | occupied_co[1]
+    
+    def _get_ep_zobrist_key(self) -> int :
+        """Return the Zobrist key of the en passant square if a pawn of the side 
+        to move can take en passant, 0 otherwise."""
+        if self.ep_square is None :
+            return 0
+        color_value = self.turn.value
+        if PAWN_ATTACKS[1 - color_value][self.ep_square] & self.bitboards[color_value*6] :
+            return ZOBRIST_EP_FILES[self.ep_square & 7]
+        return 0
+    
+    def compute_zobrist_hash(self) -> int :
+        """
+        Compute the Zobrist hash of the position from scratch.
+        NB: the hash is updated incrementally when moves are made, 
+        the zobrist_hash attribute should be used instead.
+        """
+        res = 0
+        for index, bitboard in enumerate(self.bitboards) :
+            while bitboard :
+                lsb = bitboard & -bitboard
+                bitboard ^= lsb
+                res ^= ZOBRIST_PIECES[index][lsb.bit_length() - 1]
+        res ^= ZOBRIST_CASTLING[self.castling_rights]
+        res ^= self._get_ep_zobrist_key()
+        if self.turn == PieceColor.WHITE :
+            res ^= ZOBRIST_TURN
+        return res
+    
+    def get_zobrist_hash(self) -> int :
+        """Return the 64-bit Zobrist hash of the current position. 
+        Positions reached by different move orders have the same hash."""
+        return self.zobrist_hash
+    
+    def is_square_attacked(self, square_number: int, color: PieceColor) -> bool :
+        """Return True if the square is attacked by a piece of the given color."""
+        bitboards = self.bitboards
+        offset = color.value*6
+        if KNIGHT_ATTACKS[square_number] & bitboards[offset + 1] :
+            return True
+        if KING_ATTACKS[square_number] & bitboards[offset + 5] :
+            return True
+        if PAWN_ATTACKS[1 - color.value][square_number] & bitboards[offset] :
+            return True
+        queens = bitboards[offset + 4]
+        rooks_and_queens = bitboards[offset + 3] | queens
+        if rooks_and_queens and rook_attacks(square_number, self.occupied) & rooks_and_queens :
+            return True
+        bishops_and_queens = bitboards[offset + 2] | queens
+        if bishops_and_queens and bishop_attacks(square_number, self.occupied) & bishops_and_queens :
+            return True
+        return False
+    
+    def _is_king_attacked(self, color_value: int) -> bool :
+        """Return True if the king of the given color value is attacked.
+        Return False if there is no such king on the board."""
+        king = self.bitboards[color_value*6 + 5]
+        if not king :
+            return False
+        return self.is_square_attacked(king.bit_length() - 1, COLORS[1 - color_value])
+    
+    def is_check(self) -> bool :
+        """Return True if the king of the side to move is in check."""
+        return self._is_king_attacked(self.turn.value)
+    
+    def _generate_pseudo_legal_moves(self) -> List[tuple] :
+        """
+        Return the list of the pseudo-legal moves of the side to move, that is 
+        the moves which follow the rules except that they may leave the king in check.
+        Moves are tuples (start_square_number, destination_square_number, promotion), 
+        promotion being a PieceType value or None.
+        """
+        res = []
+        append = res.append
+        bitboards = self.bitboards
+        color_value = self.turn.value
+        offset = color_value*6
+        us = self.occupied_co[color_value]
+        them = self.occupied_co[1 - color_value]
+        occupied = self.occupied
+        empty = ~occupied
+        # Pawns
+        pawns = bitboards[offset]
+        if color_value :
+            step, start_rank, last_rank = 8, 1, 7
+        else :
+            step, start_rank, last_rank = -8, 6, 0
+        targets = them
+        if self.ep_square is not None :
+            targets |= 1 << self.ep_square
+        pawn_attacks = PAWN_ATTACKS[color_value]
+        while pawns :
+            lsb = pawns & -pawns
+            pawns ^= lsb
+            start = lsb.bit_length() - 1
+            destinations = pawn_attacks[start] & targets
+            destination = start + step
+            if empty & (1 << destination) :
+                destinations |= 1 << destination
+                if start >> 3 == start_rank and empty & (1 << (destination + step)) :
+                    destinations |= 1 << (destination + step)
+            while destinations :
+                lsb = destinations & -destinations
+                destinations ^= lsb
+                destination = lsb.bit_length() - 1
+                if destination >> 3 == last_rank :
+                    for promotion in PROMOTION_TYPES :
+                        append((start, destination, promotion))
+                else :
+                    append((start, destination, None))
+        # Pieces
+        not_us = ~us
+        for piece_type_value in (1, 2, 3, 4, 5) :
+            pieces = bitboards[offset + piece_type_value]
+            while pieces :
+                lsb = pieces & -pieces
+                pieces ^= lsb
+                start = lsb.bit_length() - 1
+                if piece_type_value == 1 :
+                    destinations = KNIGHT_ATTACKS[start]
+                elif piece_type_value == 2 :
+                    destinations = bishop_attacks(start, occupied)
+                elif piece_type_value == 3 :
+                    destinations = rook_attacks(start, occupied)
+                elif piece_type_value == 4 :
+                    destinations = rook_attacks(start, occupied) | bishop_attacks(start, occupied)
+                else :
+                    destinations = KING_ATTACKS[start]
+                destinations &= not_us
+                while destinations :
+                    lsb = destinations & -destinations
+                    destinations ^= lsb
+                    append((start, lsb.bit_length() - 1, None))
+        # Castling
+        res.extend(self._generate_castling_moves())
+        return res
+    
+    def _generate_castling_moves(self) -> List[tuple] :
+        """Return the castling moves of the side to move, as tuples like in 
+        _generate_pseudo_legal_moves. The king is not in check and doesn't cross 
+        an attacked square, but the destination square is not checked."""
+        res = []
+        color_value = self.turn.value
+        offset = color_value*6
+        bitboards = self.bitboards
+        occupied = self.occupied
+        if color_value :
+            king_side, queen_side, king_square = WHITE_KING_SIDE, WHITE_QUEEN_SIDE, 4
+        else :
+            king_side, queen_side, king_square = BLACK_KING_SIDE, BLACK_QUEEN_SIDE, 60
+        if self.castling_rights & (king_side | queen_side) and bitboards[offset + 5] & (1 << king_square) :
+            opponent = COLORS[1 - color_value]
+            if self.castling_rights & king_side and bitboards[offset + 3] & (1 << (king_square + 3)) \
+                    and not occupied & (0b11 << (king_square + 1)) \
+                    and not self.is_square_attacked(king_square, opponent) \
+                    and not self.is_square_attacked(king_square + 1, opponent) \
+                    and not self.is_square_attacked(king_square + 2, opponent) :
+                res.append((king_square, king_square + 2, None))
+            if self.castling_rights & queen_side and bitboards[offset + 3] & (1 << (king_square - 4)) \
+                    and not occupied & (0b111 << (king_square - 3)) \
+                    and not self.is_square_attacked(king_square, opponent) \
+                    and not self.is_square_attacked(king_square - 1, opponent) \
+                    and not self.is_square_attacked(king_square - 2, opponent) :
+                res.append((king_square, king_square - 2, None))
+        return res
+    
+    def _generate_legal_moves(self) -> List[tuple] :
+        """Return the list of the legal moves of the side to move, 
+        as tuples like in _generate_pseudo_legal_moves."""
+        res = []
+        color_value = self.turn.value
+        for move in self._generate_pseudo_legal_moves() :
+            undo = self._make_move(*move)
+            if not self._is_king_attacked(color_value) :
+                res.append(move)
+            self._unmake_move(undo)
+        return res
+    
+    def _create_move(self, move: tuple) -> Move :
+        """Create a Move object from a move tuple of the generator."""
+        promotion = PieceType(move[2]) if move[2] is not None else None
+        return Move(self.squares[move[0]], self.squares[move[1]], promotion)
+    
+    def generate_pseudo_legal_moves(self) -> List[Move] :
+        """Return the list of the pseudo-legal moves of the side to move 
+        (moves that may leave the king in check)."""
+        return [self._create_move(move) for move in self._generate_pseudo_legal_moves()]
+    
+    def generate_legal_moves(self) -> List[Move] :
+        """Return the list of the legal moves of the side to move."""
+        return [self._create_move(move) for move in self._generate_legal_moves()]
+    
+    def is_legal(self, move: Move) -> bool :
+        """Return True if the move given is legal in the current position.
+        A pawn move to the last rank without promotion is considered as a queen promotion."""
+        promotion = move.promotion.value if move.promotion is not None else None
+        start_square_number = move.start_square.get_number()
+        destination_square_number = move.destination_square.get_number()
+        if promotion is None and self.get_piece_type_at(start_square_number) is PieceType.PAWN \
+                and destination_square_number >> 3 in (0, 7) :
+            promotion = PieceType.QUEEN.value
+        return (start_square_number, destination_square_number, promotion) in self._generate_legal_moves()
+    
+    def _is_legal_tuple(self, move: tuple) -> bool :
+        """Return True if the pseudo-legal move tuple given doesn't leave the king in check."""
+        color_value = self.turn.value
+        undo = self._make_move(*move)
+        res = not self._is_king_attacked(color_value)
+        self._unmake_move(undo)
+        return res
+    
+    def _is_pseudo_legal_tuple(self, move: tuple) -> bool :
+        """Return True if the move tuple given is in _generate_pseudo_legal_moves(),
+        without generating all the moves."""
+        start, destination, promotion = move
+        color_value = self.turn.value
+        offset = color_value*6
+        start_mask, destination_mask = 1 << start, 1 << destination
+        bitboards = self.bitboards
+        if not self.occupied_co[color_value] & start_mask or self.occupied_co[color_value] & destination_mask :
+            return False
+        if bitboards[offset] & start_mask :
+            if color_value :
+                step, start_rank, last_rank = 8, 1, 7
+            else :
+                step, start_rank, last_rank = -8, 6, 0
+            if (destination >> 3 == last_rank) != (promotion is not None) :
+                return False
+            if promotion is not None and promotion not in PROMOTION_TYPES :
+                return False
+            targets = self.occupied_co[1 - color_value]
+            if self.ep_square is not None :
+                targets |= 1 << self.ep_square
+            if PAWN_ATTACKS[color_value][start] & targets & destination_mask :
+                return True
+            empty = ~self.occupied
+            if destination == start + step :
+                return bool(empty & destination_mask)
+            return destination == start + 2*step and start >> 3 == start_rank \
+                and bool(empty & (1 << (start + step))) and bool(empty & destination_mask)
+        if promotion is not None :
+            return False
+        occupied = self.occupied
+        if bitboards[offset + 1] & start_mask :
+            destinations = KNIGHT_ATTACKS[start]
+        elif bitboards[offset + 2] & start_mask :
+            destinations = bishop_attacks(start, occupied)
+        elif bitboards[offset + 3] & start_mask :
+            destinations = rook_attacks(start, occupied)
+        elif bitboards[offset + 4] & start_mask :
+            destinations = rook_attacks(start, occupied) | bishop_attacks(start, occupied)
+        else :
+            if abs(destination - start) == 2 :
+                return move in self._generate_castling_moves()
+            destinations = KING_ATTACKS[start]
+        return bool(destinations & destination_mask)
+    
+    def has_legal_move(self) -> bool :
+        """Return True if the side to move has at least one legal move 
+        (stops at the first one found)."""
+        for move in self._generate_pseudo_legal_moves() :
+            if self._is_legal_tuple(move) :
+                return True
+        return False
+    
+    def is_checkmate(self) -> bool :
+        return self.is_check() and not self.has_legal_move()
+    
+    def is_stalemate(self) -> bool :
+        return not self.is_check() and not self.has_legal_move()
+    
+    def perft(self, depth: int) -> int :
+        """
+        Return the number of leaf nodes of the legal move tree of the given depth.
+        This is the standard way to check and benchmark a move generator.
+        """
+        if depth == 0 :
+            return 1
+        moves = self._generate_legal_moves()
+        if depth == 1 :
+            return len(moves)
+        nodes = 0
+        for move in moves :
+            undo = self._make_move(*move)
+            nodes += self.perft(depth - 1)
+            self._unmake_move(undo)
+        return nodes
+    
     def castle_king_side(self) :
         """Warning : function does not check if catling is possible."""
-        pass
+        king_square_number = 4 if self.turn == PieceColor.WHITE else 60
+        self.move_from_numbers(king_square_number, king_square_number + 2)
 
     def castle_queen_side(self) :
         """Warning : function does not check if catling is possible."""
-        pass
+        king_square_number = 4 if self.turn == PieceColor.WHITE else 60
+        self.move_from_numbers(king_square_number, king_square_number - 2)
 
-    def move_en_passant(self) :
-        pass
+    def move_en_passant(self, start_square: Square) :
+        """Take en passant with the pawn on the given square.
+        An exception is raised if the move is not legal."""
+        if self.ep_square is None :
+            raise IllegalMoveException()
+        move = Move(start_square, self.squares[self.ep_square])
+        if not self.is_legal(move) :
+            raise IllegalMoveException()
+        self.move_piece(start_square.piece, move.destination_square)
     
-    def move_from_san(self, san_string: str) :
-        """Make the move from the san move given.
-        An exception is raised if the given san move is not valid.
-        Note: the 'e.p.' mention for en passant moves makes the expression not valid."""
-        # Check if the expression is correct
-        san_pattern = re.compile(r"/^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(=[NBRQK])?(\+|#)?$|^O-O(-O)?$/")
-        if not san_pattern.match(san_string) :
-            raise NotValidSanMoveException()
-        # Remove the non 'move-meaningfull' characters # NB: maybe not usefull to do that finally
-        san_string.replace('#', '')
-        san_string.replace('+', '')
+    def get_position_state(self) -> tuple :
+        """Return the position and game state as an immutable tuple (cf. set_position_state)."""
+        return (tuple(self.bitboards), tuple(self.occupied_co), self.occupied, self.turn, self.castling_rights, 
+                self.ep_square, self.halfmove_clock, self.fullmove_number, self.zobrist_hash)
+    
+    def set_position_state(self, state: tuple) :
+        """Set the position and game state returned by get_position_state.
+        The moves played are not changed."""
+        bitboards, occupied_co, self.occupied, self.turn, self.castling_rights, \
+            self.ep_square, self.halfmove_clock, self.fullmove_number, self.zobrist_hash = state
+        self.bitboards = list(bitboards)
+        self.occupied_co = list(occupied_co)
+    
+    def set_fen(self, fen: str) :
+        """
+        Set the position described by the FEN string given.
+        The moves played are forgotten and the move lines go back to their root.
+        The positions parsed are cached (FEN_CACHE): setting a FEN again only copies its state.
+        """
+        state = FEN_CACHE.get(fen)
+        if state is not None :
+            FEN_CACHE.move_to_end(fen)
+            self.set_position_state(state)
+        else :
+            # Nothing is changed if the FEN is not valid
+            self._parse_fen(fen)
+            FEN_CACHE[fen] = self.get_position_state()
+            if len(FEN_CACHE) > FEN_CACHE_SIZE :
+                FEN_CACHE.popitem(last=False)
+        self.move_played = []
+        self.undo_stack = []
+        self.unrecorded_move_count = 0
+        self.move_lines.go_to_root()
+    
+    def _parse_fen(self, fen: str) :
+        """Set the position described by the FEN string given, without the cache.
+        All the fields are checked before the board is changed: NotValidFenException 
+        is raised if one is not valid, and the board is unchanged."""
+        fields = fen.split()
+        if len(fields) < 4 :
+            raise NotValidFenException()
+        ranks = fields[0].split('/')
+        if len(ranks) != 8 :
+            raise NotValidFenException()
+        # (square number, piece type, color) of the pieces
+        pieces = []
+        for rank_index, rank_string in enumerate(ranks) :
+            rank_number = 7 - rank_index
+            file_number = 0
+            for char in rank_string :
+                if char.isdigit() :
+                    file_number += int(char)
+                elif char.upper() in Board.FEN_PIECE_TYPES and file_number < 8 :
+                    piece_type = Board.FEN_PIECE_TYPES[char.upper()]
+                    # No pawn on the first and last ranks, their moves could not be generated
+                    if piece_type is PieceType.PAWN and rank_number in (0, 7) :
+                        raise NotValidFenException()
+                    color = PieceColor.WHITE if char.isupper() else PieceColor.BLACK
+                    pieces.append((rank_number*8 + file_number, piece_type, color))
+                    file_number += 1
+                else :
+                    raise NotValidFenException()
+            if file_number != 8 :
+                raise NotValidFenException()
+        if fields[1] not in ('w', 'b') :
+            raise NotValidFenException()
+        castling_rights = 0
+        for char in fields[2] :
+            if char in Board.FEN_CASTLING_FLAGS :
+                castling_rights |= Board.FEN_CASTLING_FLAGS[char]
+            elif char != '-' :
+                raise NotValidFenException()
+        if fields[3] == '-' :
+            ep_square = None
+        elif fields[3] in SQUARE_NAMES and fields[3][1] in ('3', '6') :
+            ep_square = SQUARE_NAMES.index(fields[3])
+        else :
+            raise NotValidFenException()
+        counters = fields[4:6]
+        if not all(counter.isdigit() for counter in counters) :
+            raise NotValidFenException()
+        self.delete_all_pieces()
+        for square_number, piece_type, color in pieces :
+            self.set_piece_at(square_number, piece_type, color)
+        self.turn = PieceColor.WHITE if fields[1] == 'w' else PieceColor.BLACK
+        self.castling_rights = castling_rights
+        self.ep_square = ep_square
+        self.halfmove_clock = int(counters[0]) if len(counters) > 0 else 0
+        self.fullmove_number = int(counters[1]) if len(counters) > 1 else 1
+        self.zobrist_hash = self.compute_zobrist_hash()
+    
+    def get_fen(self) -> str :
+        """Return the FEN string describing the current position."""
+        # FEN name of the piece of each square, from the bitboards
+        names = [None] * 64
+        for index, bitboard in enumerate(self.bitboards) :
+            fen_name = Board.FEN_NAMES_BY_INDEX[index]
+            while bitboard :
+                lsb = bitboard & -bitboard
+                bitboard ^= lsb
+                names[lsb.bit_length() - 1] = fen_name
+        rank_strings = []
+        for rank_number in range(7, -1, -1) :
+            rank_string = ""
+            empty_count = 0
+            for fen_name in names[rank_number*8:rank_number*8 + 8] :
+                if fen_name is None :
+                    empty_count += 1
+                    continue
+                if empty_count :
+                    rank_string += str(empty_count)
+                    empty_count = 0
+                rank_string += fen_name
+            if empty_count :
+                rank_string += str(empty_count)
+            rank_strings.append(rank_string)
+        castling = "".join(char for char, flag in Board.FEN_CASTLING_FLAGS.items() if self.castling_rights & flag)
+        if self.ep_square is None :
+            ep = '-'
+        else :
+            ep = self.squares[self.ep_square].get_name()
+        turn = 'w' if self.turn == PieceColor.WHITE else 'b'
+        return f"{'/'.join(rank_strings)} {turn} {castling or '-'} {ep} {self.halfmove_clock} {self.fullmove_number}"
+    
+    def _get_san_candidates(self, piece_type_value: int, destination_square_number: int, capture: bool) -> int :
+        """
+        Return the mask of the squares of the pieces of the side to move, of the given type, 
+        which can go to the destination square (pseudo-legal moves).
+        For pawns, capture tells if the move is a capture.
+        """
+        color_value = self.turn.value
+        pieces = self.bitboards[color_value*6 + piece_type_value]
+        destination_mask = 1 << destination_square_number
+        if self.occupied_co[color_value] & destination_mask :
+            return 0
+        if piece_type_value == 0 :
+            if capture :
+                if not self.occupied_co[1 - color_value] & destination_mask and destination_square_number != self.ep_square :
+                    return 0
+                return PAWN_ATTACKS[1 - color_value][destination_square_number] & pieces
+            if self.occupied & destination_mask :
+                return 0
+            step = 8 if color_value else -8
+            start_square_number = destination_square_number - step
+            # No pawn can go to the first rank of its side
+            if not 0 <= start_square_number < 64 :
+                return 0
+            start_mask = 1 << start_square_number
+            if pieces & start_mask :
+                return start_mask
+            if not self.occupied & start_mask and destination_square_number >> 3 == (3 if color_value else 4) :
+                return pieces & (1 << (destination_square_number - 2*step))
+            return 0
+        if piece_type_value == 1 :
+            return KNIGHT_ATTACKS[destination_square_number] & pieces
+        if piece_type_value == 2 :
+            return bishop_attacks(destination_square_number, self.occupied) & pieces
+        if piece_type_value == 3 :
+            return rook_attacks(destination_square_number, self.occupied) & pieces
+        if piece_type_value == 4 :
+            return (rook_attacks(destination_square_number, self.occupied) 
+                    | bishop_attacks(destination_square_number, self.occupied)) & pieces
+        return KING_ATTACKS[destination_square_number] & pieces
+    
+    def parse_san(self, san_string: str) -> tuple :
+        """
+        Return the legal move described by the san move given, as a tuple 
+        (start_square_number, destination_square_number, promotion), promotion 
+        being a PieceType value or None.
+        An exception is raised if the san move is not valid, illegal or ambiguous.
+        Note: the 'e.p.' mention for en passant moves makes the expression not valid.
+        """
+        piece_type_value, file_number, rank_number, capture, destination_square_number, promotion, castling = \
+            _parse_san_string(san_string)
         # Castle
-        if 'O-O-O' in san_string :
-            self.castle_queen_side()
-        elif 'O-O' in san_string :
-            self.castle_king_side()
+        if castling :
+            king_square_number = 4 if self.turn == PieceColor.WHITE else 60
+            res = (king_square_number, king_square_number + castling, None)
+            if res not in self._generate_castling_moves() or not self._is_legal_tuple(res) :
+                raise NotValidSanMoveException()
+            return res
         # Other moves
+        last_rank = 7 if self.turn == PieceColor.WHITE else 0
+        if piece_type_value == 0 and (promotion is not None) != (destination_square_number >> 3 == last_rank) :
+            raise NotValidSanMoveException()
+        candidates = self._get_san_candidates(piece_type_value, destination_square_number, 
+                                              capture or file_number is not None)
+        res = None
+        while candidates :
+            lsb = candidates & -candidates
+            candidates ^= lsb
+            start_square_number = lsb.bit_length() - 1
+            if file_number is not None and start_square_number & 7 != file_number :
+                continue
+            if rank_number is not None and start_square_number >> 3 != rank_number :
+                continue
+            move = (start_square_number, destination_square_number, promotion)
+            if not self._is_legal_tuple(move) :
+                continue
+            if res is not None : # ambiguous
+                raise NotValidSanMoveException()
+            res = move
+        if res is None :
+            raise NotValidSanMoveException()
+        return res
+    
+    def get_san(self, move: Move) -> str :
+        """Return the san notation of the move given, which must be legal 
+        and not played yet. Disambiguation, castling, promotion, check and mate are handled."""
+        promotion = move.promotion.value if move.promotion is not None else None
+        return self._get_san(move.start_square.get_number(), move.destination_square.get_number(), promotion)
+    
+    def _get_san(self, start_square_number: int, destination_square_number: int, promotion: int = None) -> str :
+        """Return the san notation of the legal move tuple given (cf. get_san)."""
+        index = self.get_bitboard_index_at(start_square_number)
+        piece_type_value = index % 6
+        destination_name = SQUARE_NAMES[destination_square_number]
+        if piece_type_value == 5 and start_square_number in (4, 60) \
+                and abs(destination_square_number - start_square_number) == 2 :
+            res = "O-O" if destination_square_number > start_square_number else "O-O-O"
+        elif piece_type_value == 0 :
+            if start_square_number & 7 != destination_square_number & 7 :
+                res = Square.FILE_NAMES[start_square_number & 7] + 'x' + destination_name
+            else :
+                res = destination_name
+            if destination_square_number >> 3 in (0, 7) :
+                res += '=' + Board.FEN_PIECE_NAMES[promotion if promotion is not None else 4]
         else :
-            destination_san_square = re.findall(r"[a-h][1-8]", san_string)
-            san_string.replace(destination_san_square, '')
-            moving_piece_name = re.findall(r"K|Q|R|B|N", san_string).pop()
-            # to be continued... ####################################################################################
+            res = Board.FEN_PIECE_NAMES[piece_type_value]
+            # Disambiguation with the other pieces of the same type which can go to the destination
+            others = self._get_san_candidates(piece_type_value, destination_square_number, True) \
+                & ~(1 << start_square_number)
+            same_file = same_rank = ambiguous = False
+            while others :
+                lsb = others & -others
+                others ^= lsb
+                other_square_number = lsb.bit_length() - 1
+                if not self._is_legal_tuple((other_square_number, destination_square_number, None)) :
+                    continue
+                ambiguous = True
+                if other_square_number & 7 == start_square_number & 7 :
+                    same_file = True
+                if other_square_number >> 3 == start_square_number >> 3 :
+                    same_rank = True
+            if ambiguous :
+                if not same_file :
+                    res += Square.FILE_NAMES[start_square_number & 7]
+                elif not same_rank :
+                    res += Square.RANK_NAMES[start_square_number >> 3]
+                else :
+                    res += SQUARE_NAMES[start_square_number]
+            if self.occupied & (1 << destination_square_number) :
+                res += 'x'
+            res += destination_name
+        # Check and mate
+        undo = self._make_move(start_square_number, destination_square_number, promotion)
+        if self.is_check() :
+            res += '+' if self.has_legal_move() else '#'
+        self._unmake_move(undo)
+        return res
+    
+    def move_from_san(self, san_string: str) :
+        """Make the move from the san move given.
+        An exception is raised if the given san move is not valid, illegal or ambiguous.
+        Note: the 'e.p.' mention for en passant moves makes the expression not valid."""
+        start_square_number, destination_square_number, promotion = self.parse_san(san_string)
+        if promotion is not None :
+            promotion = PieceType(promotion)
+        self.move_from_numbers(start_square_number, destination_square_number, promotion)
     
-    def set_training_lines(self, lines_name: str) :
+    def set_training_lines(self, lines_name: str, library=None) :
         """
         Load a set of lines using MoveLines.load_from_database
         The lines_name argument is the name of the lines in the database.
         "all" will load the entire database
         Otherwise: 
         For instance: "french" will select the moves which have been recorded under that name.
+        If a library is given (cf. chessopy.library.RepertoireLibrary), the lines are taken 
+        from it instead (loaded only if they are not in memory), and stay in memory while they are used.
         """
-        self.move_lines.load_from_database(lines_name)
+        if library is None :
+            self.move_lines.load_from_database(lines_name)
+            return
+        library.unpin(getattr(self.move_lines, "lines_name", None))
+        library.pin(lines_name)
+        self.move_lines = library.get(lines_name)
+        self.move_lines.go_to_root()
     
     def check_move(self, move: Move) -> bool :
         """
         Check if the move given is in the lines chosen.
         """
         start_square_number = move.start_square.get_number()
-        destination_square_number = move.start_square.get_number()
+        destination_square_number = move.destination_square.get_number()
         coords = (start_square_number, destination_square_number)
-        return coords in self.move_lines.current_node
+        return coords in self.move_lines.get_coords_of_childs_of_current_node()
 
 class NoPieceOnStartSquareException(Exception) :
     pass
 
-############ Graphical objects ############
-
-SQUARE_SIZE = 86
-BOARD_SIZE = SQUARE_SIZE * 8
-
-class PieceGui(PhotoImage) :
-    
-    def __init__(self, piece: Piece, image_path: str) :
-        PhotoImage.__init__(self, file=image_path)
-        self.piece = piece
-
-class SquareGui(Canvas) :
-
-    DARK_BG = 'lightgrey'
-    LIGHT_BG = 'lightblue'
-
-    SELECTED_COLOR = 'yellow'
-
-    HIGHLIGHTED_COLOR = 'blue'
-
-    def __init__(self, parent, square: Square) :
-        # Init
-        Canvas.__init__(self, parent, width=SQUARE_SIZE, height=SQUARE_SIZE)
-        self.parent = parent
-        # Square attribute
-        self.square = square
-        self.selected = False
-        self.highlighted = False
-        # Graphical piece
-        self.piece_gui = None
-        # Position on the board canvas
-        x_position = 1/8 * self.square.get_file()
-        y_position = 1 - (1/8 * (self.square.get_rank() + 1))
-        self.place(relx=x_position, rely=y_position)
-        # Configure square background
-        if self.square.get_color() == SquareColor.DARK.value :
-            self.base_color = SquareGui.DARK_BG
-        else :
-            self.base_color = SquareGui.LIGHT_BG
-        self.configure(bg=self.base_color)
-        # Button bindings
-        self.bind("<Button-1>", self.on_left_click)
-        self.bind("<Button-3>", self.on_right_click)
-    
-    def set_piece_gui(self, piece_gui: PieceGui) :
-        """Set the piece_gui attribute."""
-        self.piece_gui = piece_gui
-
-    def display_piece(self) :
-        self.create_image(0, 0, image=self.piece_gui, anchor=NW)
-    
-    def clear_square(self) :
-        self.delete("all")
-    
-    def select(self) :
-        self.selected = True
-        self.point()
-        self.parent.square_gui_selected = self
-
-    def unselect(self) :
-        self.selected = False
-        self.unpoint()
-        self.parent.square_gui_selected = None
-    
-    def point(self) :
-        self.configure(bg=SquareGui.SELECTED_COLOR)
-    
-    def unpoint(self) :
-        if self.highlighted :
-            self.configure(bg=SquareGui.HIGHLIGHTED_COLOR)
-        else :
-            self.configure(bg=self.base_color)
-    
-    def on_left_click(self, event) :
-        if self.selected :
-            self.unselect()
-        else :
-            if self.parent.square_gui_selected is None :
-                if self.square.has_piece() :
-                    self.select()
-                else :
-                    pass # do nothing
-            else :
-                if self.parent.is_training_session :
-                    self.parent.check_then_make_move(self)
-                else :
-                    self.parent.make_move(self)
-                self.parent.square_gui_selected.unselect()
-    
-    def highlight(self) :
-        self.configure(bg=SquareGui.HIGHLIGHTED_COLOR)
-        self.highlighted = not self.highlighted
-    
-    def unhighlight(self) :
-        if not self.selected :
-            self.configure(bg=self.base_color)
-        else :
-            self.configure(bg=SquareGui.HIGHLIGHTED_COLOR)
-        self.highlighted = not self.highlighted
-
-    def on_right_click(self, event) :
-        if not self.highlighted :
-            self.highlight()
-        else :
-            self.unhighlight()
-        
-
-class BoardGui(Canvas) :
-    
-    def __init__(self, parent) :
-        Canvas.__init__(self, parent, width=BOARD_SIZE, height=BOARD_SIZE)
-        self.parent = parent
-        self.board = Board()
-        self.squares_gui = []
-        for square in self.board.squares :
-            self.squares_gui.append(SquareGui(self, square))
-        #
-        self.square_gui_selected = None
-        #
-        self.off_board_pieces_gui = []
-        #
-        self.is_training_session = False
-        # self.training_list = [ #this list will be replaced by board.move_lines
-        #     (12,28),
-        #     (52,44),
-        #     (11,27),
-        #     (51,35),
-        #     (28,36),
-        #     (50,34)
-        #     ]
-        # self.move_number = 0
-    
-    def display_all_pieces(self) :
-        for piece in self.board.get_all_pieces() :
-            image_path = FOLDER_PATH + "images/piece_sets/cburnett/86x86/" # TODO: relative path...
-            if piece.get_color() == PieceColor.BLACK :
-                image_file = "black"
-            else :
-                image_file = "white"
-            if type(piece) is Pawn :
-                image_file += "_pawn.png"
-            elif type(piece) is Knight :
-                image_file += "_knight.png"
-            elif type(piece) is Bishop :
-                image_file += "_bishop.png"
-            elif type(piece) is Rook :
-                image_file += "_rook.png"
-            elif type(piece) is Queen :
-                image_file += "_queen.png"
-            else :
-                image_file += "_king.png"
-            piece_gui = PieceGui(piece, image_path+image_file)
-            square_number = piece.get_square_number()
-            square_gui = self.squares_gui[square_number]
-            square_gui.set_piece_gui(piece_gui)
-            square_gui.display_piece()
-
-    def clear_board(self) :
-        for square_gui in self.squares_gui :
-            square_gui.piece_gui = None
-            square_gui.clear_square()
-    
-    def reset_position(self) :
-        self.board.set_new_game()
-        self.clear_board()
-        self.display_all_pieces()
-
-    def check_then_make_move(self, square_gui: SquareGui) :
-        start_square_number = self.square_gui_selected.square.get_number()
-        destination_square_number = square_gui.square.get_number()
-        next_moves_coords = self.board.move_lines.get_coords_of_childs_of_current_node()
-        if (start_square_number, destination_square_number) not in next_moves_coords :
-            print("T'es pas dans le coup.")
-        else :
-            self.make_move(square_gui)
-
-    def make_move(self, square_gui: SquareGui) :
-        #
-        self.parent.undo_button.configure(state="normal")
-        #
-        if square_gui.square.has_piece() :
-            self.off_board_pieces_gui.append(square_gui.piece_gui)
-            square_gui.clear_square()
-        self.board.move_piece(self.square_gui_selected.square.piece, square_gui.square)
-        square_gui.set_piece_gui(self.square_gui_selected.piece_gui)
-        square_gui.display_piece()
-        self.square_gui_selected.clear_square()
-        #
-        if self.is_training_session :
-            self.square_gui_selected.unpoint()
-            # square_gui.point()
-            self.update()
-            # square_gui.unpoint()
-            self.play_random_move()
-    
-    def make_computer_move(self, start_square_number: int, destination_square_number: int) :
-        """Make a move without using the square_gui_selected attribute."""
-        # Get the squares
-        start_square_gui = self.squares_gui[start_square_number]
-        destination_square_gui = self.squares_gui[destination_square_number]
-        # 
-        if destination_square_gui.square.has_piece() :
-            self.off_board_pieces_gui.append(destination_square_gui.piece_gui)
-            destination_square_gui.clear_square()
-        self.board.move_piece(start_square_gui.square.piece, destination_square_gui.square)
-        destination_square_gui.set_piece_gui(start_square_gui.piece_gui)
-        destination_square_gui.display_piece()
-        start_square_gui.clear_square()
-    
-    def undo_last_move(self, event) :
-        if not self.board.move_played == [] :
-            # In case of a square was selected while the user clicked 'Undo'
-            if self.square_gui_selected is not None :
-                self.square_gui_selected.unselect()
-            #
-            last_move = self.board.pop_last_move()
-            piece_gui_unmoved = self.squares_gui[last_move.destination_square.get_number()].piece_gui
-            self.squares_gui[last_move.start_square.get_number()].set_piece_gui(piece_gui_unmoved)
-            self.squares_gui[last_move.start_square.get_number()].display_piece()
-            self.squares_gui[last_move.destination_square.get_number()].clear_square()
-            if last_move.piece_taken is not None :
-                self.squares_gui[last_move.destination_square.get_number()].set_piece_gui(self.off_board_pieces_gui.pop())
-                self.squares_gui[last_move.destination_square.get_number()].display_piece()
-        if self.board.move_played == [] :
-            self.parent.undo_button.configure(state="disabled")
-    
-    def start_training(self, event) :
-        #
-        if not self.is_training_session :
-            self.reset_position()
-            self.is_training_session = True
-            self.parent.start_button.configure(text="Stop training")
-        else :
-            self.is_training_session = False
-            self.parent.start_button.configure(text="Start training")
-    
-    def play_random_move(self, event=None) :
-        print("event is None : ", event is None)
-        if event is None :
-            self.after(200) #TODO? number of millisec is hardcoded
-            # NB: maybe put 300 if we add sounds
-            pass
-        #
-        if self.board.move_lines.current_node == {} :
-            print("No more move on the current line.")
-        else :
-            key_list = list(self.board.move_lines.current_node.keys())
-            random_key = key_list[randrange(len(key_list))]
-            coords = tuple(int(number) for number in random_key.split(','))
-            self.make_computer_move(coords[0], coords[1])
-    
-    def print_some_stuff(self, event) :
-        print("Moves in move_played : ")
-        for move in self.board.move_played :
-            print(move)
-        print("Move lines : ")
-        print(self.board.move_lines)
-        
-    def save_current_move_lines(self, event) : 
-        #TODO: add a database_name argument to let the user control it from the gui
-        """Save the move lines using MoveRecord.save_new_database."""
-        self.board.move_lines.save_new_database()
-
-############ Main ############
-
-class ChessGuiApp(Tk) :
-    
-    def __init__(self) :
-        # Define the window
-        Tk.__init__(self)
-        self.title("ChessOpy")
-        # 
-        self.board_gui = BoardGui(self)
-        self.board_gui.display_all_pieces()
-        self.board_gui.grid(row=0, column=0)
-        #
-        self.side_canvas = Canvas(self, width=BOARD_SIZE//4, height=BOARD_SIZE, bg='ivory')
-        self.side_canvas.grid(row=0, column=1, sticky='ns')
-        #
-        # self.buttons_canvas = Canvas(self.side_canvas, bg='ivory')
-        # self.buttons_canvas.pack(fill=X)
-        #
-        self.create_buttons()
-        #
-        # self.display_canvas = Canvas(self.side_canvas, bg='lightgreen')
-        # self.display_canvas.pack(expand=True)
-        #
-        self.display_label= Label(self.side_canvas, text="Bienvenue !", bg='lightgreen')
-        self.display_label.pack(expand=True)
-    
-    def create_buttons(self) :
-        #
-        self.undo_button = Button(self.side_canvas, text="Undo", state="disabled")
-        self.undo_button.bind("<Button-1>", self.board_gui.undo_last_move)
-        self.undo_button.pack(fill=X)
-        #
-        self.start_button = Button(self.side_canvas, text="Start training")
-        self.start_button.bind("<Button-1>", self.board_gui.start_training)
-        self.start_button.pack(fill=X)
-        #
-        self.save_button = Button(self.side_canvas, text="Save move lines")
-        self.save_button.bind("<Button-1>", self.board_gui.save_current_move_lines)
-        self.save_button.pack(fill=X)
-        #
-        self.play_button = Button(self.side_canvas, text="Play random move")
-        self.play_button.bind("<Button-1>", self.board_gui.play_random_move)
-        self.play_button.pack(fill=X)
-
 if __name__ == "__main__" :
+    from chessopy.gui import ChessGuiApp
     root = ChessGuiApp()
-    # root.geometry(f'{int(BOARD_SIZE*1.25)}x{BOARD_SIZE}+40+20')
     root.mainloop()
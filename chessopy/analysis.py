@@ -0,0 +1,224 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Statistics of move lines: number of moves, depth, branching factor per ply,
+ends of the lines and replies of the opponent which are not covered.
+
+They are computed in one depth-first traversal without recursion (the lines can be
+deeper than the recursion limit), and saved in a summary index next to the database
+(<lines_name>_database.stats.json): the next queries read the index instead of
+walking the tree again, until the database files change.
+Usage: python -m chessopy.analysis <lines_name> [white|black]
+"""
+
+from typing import Dict, List
+import json
+import os
+import sys
+
+import chessopy
+from chessopy import Board, MoveLines, PieceColor, key_from_json, key_to_string, move_key
+from chessopy.validation import play_key
+
+# Files of a database, the index is outdated when one of them changes
+DATABASE_EXTENSIONS = [".json", ".journal", ".bin"]
+INDEX_EXTENSION = ".stats.json"
+
+class RepertoireStatistics() :
+    """
+    Statistics of move lines, seen by the user playing user_color (None if unknown):
+        - move_count: number of moves (edges of the tree),
+        - max_depth: number of plies of the longest line,
+        - node_counts: number of moves of each ply (index 0 for the first move),
+        - branching_factors: average number of moves of the nodes which are not line ends,
+        for each ply (index 0 for the root),
+        - line_ends: lines (tuples of keys) which end the move lines,
+        - uncovered_replies: {line: keys of the legal moves of the opponent missing after the line},
+        for the lines where the opponent is to move and has at least one reply.
+    """
+
+    def __init__(self, user_color: PieceColor = None) :
+        self.user_color = user_color
+        self.move_count = 0
+        self.max_depth = 0
+        self.node_counts = []
+        self.branching_factors = []
+        self.line_ends = []
+        self.uncovered_replies = {}
+
+    def get_line_ends(self, line: tuple = ()) -> List[tuple] :
+        """Return the ends of the lines which start with the line given."""
+        line = tuple(line)
+        return [line_end for line_end in self.line_ends if line_end[:len(line)] == line]
+
+    def get_uncovered_replies(self, line: tuple = ()) -> Dict[tuple, List[int]] :
+        """Return the uncovered replies after the lines which start with the line given."""
+        line = tuple(line)
+        return {reply_line: keys for reply_line, keys in self.uncovered_replies.items()
+                if reply_line[:len(line)] == line}
+
+    def get_uncovered_reply_count(self) -> int :
+        return sum(len(keys) for keys in self.uncovered_replies.values())
+
+    def to_dict(self) -> dict :
+        return {
+            "user_color": None if self.user_color is None else self.user_color.name,
+            "move_count": self.move_count,
+            "max_depth": self.max_depth,
+            "node_counts": self.node_counts,
+            "branching_factors": self.branching_factors,
+            "line_ends": [_join_line(line) for line in self.line_ends],
+            "uncovered_replies": {_join_line(line): [key_to_string(key) for key in keys] 
+                                  for line, keys in self.uncovered_replies.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, saved_dict: dict) -> "RepertoireStatistics" :
+        user_color = saved_dict["user_color"]
+        statistics = cls(None if user_color is None else PieceColor[user_color])
+        statistics.move_count = saved_dict["move_count"]
+        statistics.max_depth = saved_dict["max_depth"]
+        statistics.node_counts = saved_dict["node_counts"]
+        statistics.branching_factors = saved_dict["branching_factors"]
+        statistics.line_ends = [_split_line(line) for line in saved_dict["line_ends"]]
+        statistics.uncovered_replies = {_split_line(line): [key_from_json(key) for key in keys] 
+                                        for line, keys in saved_dict["uncovered_replies"].items()}
+        return statistics
+
+def _join_line(line: tuple) -> str :
+    return "/".join(key_to_string(key) for key in line)
+
+def _split_line(line: str) -> tuple :
+    return tuple(key_from_json(key) for key in line.split("/")) if line else ()
+
+def compute_statistics(move_tree: dict, user_color: PieceColor = None, root_fen: str = None) -> RepertoireStatistics :
+    """
+    Return the statistics of the nested dict of moves given (like the "move_lines" item of MoveLines).
+    The uncovered replies are only searched if user_color is given, the moves are then
+    replayed on a board from the position of root_fen (the initial position by default):
+    nothing is searched after an illegal move (cf. chessopy.validation).
+    """
+    statistics = RepertoireStatistics(user_color)
+    node_counts = statistics.node_counts
+    # Number of children of the nodes which are not line ends, and number of such nodes, by ply
+    child_counts = []
+    parent_counts = []
+    board = None
+    if user_color is not None :
+        board = Board(MoveLines("new"))
+        if root_fen is not None :
+            board.set_fen(root_fen)
+    _visit_node(statistics, (), move_tree, board, child_counts, parent_counts)
+    # Depth-first traversal without recursion: the stack contains the line and the iterator
+    # on the children of each node, and the undo of its move if the node is on the board
+    # (not after an illegal move), True for the root
+    stack = [((), iter(move_tree.items()), board is not None)]
+    while stack :
+        line, children, undo = stack[-1]
+        child = next(children, None)
+        if child is None :
+            stack.pop()
+            if undo and undo is not True :
+                board._unmake_move(undo)
+            continue
+        key, subtree = child
+        child_line = line + (key,)
+        depth = len(child_line)
+        if depth > len(node_counts) :
+            node_counts.append(0)
+        node_counts[depth - 1] += 1
+        statistics.move_count += 1
+        # The position of a line end is not needed
+        child_undo = play_key(board, key)[0] if undo and subtree else None
+        _visit_node(statistics, child_line, subtree, board if child_undo is not None else None,
+                    child_counts, parent_counts)
+        if subtree :
+            stack.append((child_line, iter(subtree.items()), child_undo))
+    statistics.max_depth = len(node_counts)
+    statistics.branching_factors = [child_count / parent_count if parent_count else 0
+                                    for child_count, parent_count in zip(child_counts, parent_counts)]
+    return statistics
+
+def _visit_node(statistics: RepertoireStatistics, line: tuple, node: dict, board: Board,
+                child_counts: list, parent_counts: list) :
+    """Count the node given (reached by the line given) in the statistics.
+    board is None if the position of the node is not known."""
+    if not node :
+        if line :
+            statistics.line_ends.append(line)
+        return
+    depth = len(line)
+    if depth >= len(parent_counts) :
+        child_counts.append(0)
+        parent_counts.append(0)
+    child_counts[depth] += len(node)
+    parent_counts[depth] += 1
+    if board is not None and board.turn is not statistics.user_color :
+        legal_keys = {move_key(*move) for move in board._generate_legal_moves()}
+        uncovered_keys = legal_keys.difference(node)
+        if uncovered_keys :
+            statistics.uncovered_replies[line] = sorted(uncovered_keys)
+
+def get_database_signature(move_lines: MoveLines) -> list :
+    """Return the size and modification time of the files of the database of the move lines."""
+    res = []
+    for extension in DATABASE_EXTENSIONS :
+        file_path = move_lines.get_database_path(extension)
+        if os.path.isfile(file_path) :
+            file_stat = os.stat(file_path)
+            res.append([extension, file_stat.st_size, file_stat.st_mtime_ns])
+    return res
+
+def has_unsaved_moves(move_lines: MoveLines) -> bool :
+    """Return True if the move lines have moves added or removed since they were loaded or saved."""
+    return bool(getattr(move_lines, "journal_entries", None) or getattr(move_lines, "added_moves", None))
+
+def get_statistics(move_lines: MoveLines, user_color: PieceColor = None) -> RepertoireStatistics :
+    """
+    Return the statistics of the move lines given (MoveLines, or any class with a to_move_tree method).
+    They are read from the index of the database if it is up to date, otherwise they are computed
+    and the index is written. Nothing is written for the move lines which are not saved.
+    """
+    use_index = move_lines.lines_name != "new" and not has_unsaved_moves(move_lines)
+    if use_index :
+        index_path = move_lines.get_database_path(INDEX_EXTENSION)
+        signature = get_database_signature(move_lines)
+        try :
+            with open(index_path) as index_file :
+                index = json.load(index_file)
+            if index["signature"] == signature and index["statistics"]["user_color"] == (None if user_color is None else user_color.name) :
+                return RepertoireStatistics.from_dict(index["statistics"])
+        except (OSError, ValueError, KeyError) : # no index, or an index to rewrite
+            pass
+    if hasattr(move_lines, "to_move_tree") :
+        move_tree = move_lines.to_move_tree()
+    else :
+        move_tree = move_lines["move_lines"]
+    statistics = compute_statistics(move_tree, user_color, move_lines.root_fen)
+    if use_index :
+        chessopy.write_file_atomically(index_path, json.dumps({"signature": signature, "statistics": statistics.to_dict()}))
+    return statistics
+
+if __name__ == "__main__" :
+    lines_name = sys.argv[1]
+    user_color = PieceColor[sys.argv[2].upper()] if len(sys.argv) > 2 else None
+    statistics = get_statistics(MoveLines(lines_name), user_color)
+    print(f"{statistics.move_count} moves, {len(statistics.line_ends)} lines, depth {statistics.max_depth}")
+    for ply, (node_count, branching_factor) in enumerate(zip(statistics.node_counts, statistics.branching_factors)) :
+        print(f"ply {ply + 1:>3}: {node_count:>7} moves, branching factor {branching_factor:.2f}")
+    if user_color is not None :
+        print(f"{statistics.get_uncovered_reply_count()} uncovered replies after {len(statistics.uncovered_replies)} lines")
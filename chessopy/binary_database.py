@@ -0,0 +1,281 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compact binary format for the move lines, read with mmap.
+
+A file is a 16 bytes header followed by fixed-width node records:
+    header: magic (8 bytes), version (uint16), reserved (uint16), node count (uint32)
+    node:   move (uint16, cf. chessopy.move_key), child count (uint16), 
+            index of the first child (uint32)
+The root is the node 0 (its move is not used). The children of a node 
+are contiguous, so a node can be browsed without reading the rest of the file.
+All the integers are little-endian.
+"""
+
+from collections.abc import Mapping
+from typing import List
+import json
+import mmap
+import struct
+
+import chessopy
+from chessopy import MoveLines
+
+MAGIC = b"CHESOPY\0"
+VERSION = 1
+HEADER_STRUCT = struct.Struct("<8sHHI")
+NODE_STRUCT = struct.Struct("<HHI")
+
+class NotValidBinaryDatabaseException(Exception) :
+    pass
+
+class ReadOnlyBinaryDatabaseException(Exception) :
+    pass
+
+def write_binary_database(move_tree: dict, binary_path: str) :
+    """
+    Write a nested dict of moves (like the "move_lines" item of MoveLines) 
+    in the binary format. Nodes are numbered in breadth-first order, 
+    which makes the children of a node contiguous.
+    NotValidBinaryDatabaseException is raised if a key is not a move key 
+    (a string of the JSON files which is not valid, cf. chessopy.key_from_json).
+    """
+    records = []
+    # Each queued node is (move_code, subtree, index of the parent node), the root comes first.
+    # The index of a node is its position in the queue.
+    queue = [(0, move_tree, None)]
+    position = 0
+    while position < len(queue) :
+        move_code, subtree, parent_index = queue[position]
+        records.append(NODE_STRUCT.pack(move_code, len(subtree), len(queue) if subtree else 0))
+        for key, child in subtree.items() :
+            if not isinstance(key, int) or not 0 <= key < 1 << 16 :
+                raise NotValidBinaryDatabaseException(f"not valid move in the line: {get_line(queue, position, key)}")
+            queue.append((key, child, position))
+        position += 1
+    chessopy.write_file_atomically(binary_path, HEADER_STRUCT.pack(MAGIC, VERSION, 0, len(records)) + b"".join(records), 'wb')
+
+def get_line(queue: list, position: int, key) -> str :
+    """Return the line of the key given, child of the node at the position given of the queue 
+    of write_binary_database, in the format of the journal ("12,28 52,44")."""
+    keys = [chessopy.key_to_string(key)]
+    while position :
+        move_code, subtree, position = queue[position]
+        keys.append(chessopy.key_to_string(move_code))
+    return " ".join(reversed(keys))
+
+def read_binary_database(binary_path: str) -> dict :
+    """Read a file in the binary format and return the nested dict of moves."""
+    with BinaryMoveLinesReader(binary_path) as reader :
+        return reader.to_move_tree()
+
+def convert_json_to_binary(json_path: str, binary_path: str) :
+    """Convert a database saved by MoveLines in json to the binary format."""
+    with open(json_path) as json_database :
+        loaded_dict = json.load(json_database)
+    write_binary_database(chessopy.move_tree_from_json(loaded_dict["move_lines"]), binary_path)
+
+def convert_binary_to_json(binary_path: str, json_path: str) :
+    """Convert a database in the binary format to the json format of MoveLines."""
+    chessopy.write_file_atomically(json_path, json.dumps({"move_lines": chessopy.move_tree_to_json(read_binary_database(binary_path))}))
+
+class BinaryMoveLinesReader() :
+    """
+    Read-only access to the node records of a binary database, through mmap.
+    Nothing is read before a node is asked.
+    """
+
+    def __init__(self, binary_path: str) :
+        self.binary_file = open(binary_path, 'rb')
+        try :
+            self.buffer = mmap.mmap(self.binary_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError : # empty file
+            self.binary_file.close()
+            raise NotValidBinaryDatabaseException()
+        magic, version, reserved, self.node_count = HEADER_STRUCT.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION \
+                or len(self.buffer) != HEADER_STRUCT.size + self.node_count*NODE_STRUCT.size :
+            self.close()
+            raise NotValidBinaryDatabaseException()
+    
+    def __enter__(self) :
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) :
+        self.close()
+    
+    def close(self) :
+        self.buffer.close()
+        self.binary_file.close()
+    
+    def get_node(self, node_index: int) -> tuple :
+        """Return the tuple (move_code, child_count, first_child_index) of the node."""
+        return NODE_STRUCT.unpack_from(self.buffer, HEADER_STRUCT.size + node_index*NODE_STRUCT.size)
+    
+    def get_children(self, node_index: int) -> List[tuple] :
+        """Return the list of the tuples (move_code, child_index) of the children of the node."""
+        move_code, child_count, first_child_index = self.get_node(node_index)
+        unpack_from = NODE_STRUCT.unpack_from
+        offset = HEADER_STRUCT.size + first_child_index*NODE_STRUCT.size
+        return [(unpack_from(self.buffer, offset + k*NODE_STRUCT.size)[0], first_child_index + k) 
+                for k in range(child_count)]
+    
+    def to_move_tree(self, node_index: int = 0) -> dict :
+        """Return the nested dict of moves from the given node (without recursion)."""
+        res = {}
+        stack = [(node_index, res)]
+        while stack :
+            index, subtree = stack.pop()
+            for move_code, child_index in self.get_children(index) :
+                child = subtree[chessopy.shared_key(move_code)] = {}
+                stack.append((child_index, child))
+        return res
+
+class BinaryNode(Mapping) :
+    """
+    Read-only view of a node of a binary database, which behaves like 
+    the nested dicts of MoveLines: {move key: child node}.
+    The moves added in memory (by BinaryMoveLines) are included.
+    """
+
+    def __init__(self, move_lines, node_index: int) :
+        self.move_lines = move_lines
+        self.node_index = node_index
+    
+    def _get_file_children(self) -> dict :
+        return dict(self.move_lines.reader.get_children(self.node_index))
+    
+    def __getitem__(self, key) :
+        added_moves = self.move_lines.added_moves.get(self.node_index)
+        if added_moves is not None and key in added_moves :
+            return added_moves[key]
+        for move_code, child_index in self.move_lines.reader.get_children(self.node_index) :
+            if move_code == key :
+                return BinaryNode(self.move_lines, child_index)
+        raise KeyError(key)
+    
+    def __iter__(self) :
+        yield from self._get_file_children()
+        yield from self.move_lines.added_moves.get(self.node_index, {})
+    
+    def __len__(self) :
+        return self.move_lines.reader.get_node(self.node_index)[1] \
+            + len(self.move_lines.added_moves.get(self.node_index, {}))
+    
+    def __repr__(self) :
+        return f"BinaryNode({self.node_index})"
+
+class BinaryMoveLines(MoveLines) :
+    """
+    MoveLines read from a binary database (<lines_name>_database.bin) with mmap: 
+    the nodes are read when they are visited, the whole tree is never loaded.
+    The moves added are kept in memory, in nested dicts like in MoveLines, 
+    and the moves cannot be removed (the file is read-only).
+    """
+
+    def __init__(self, lines_name=chessopy.LINES_TO_BE_LOADED) :
+        #
+        dict.__init__(self)
+        self.lines_name = lines_name
+        self.reader = None
+        # Moves added to the nodes of the file: {node_index: {move key: {...}}}
+        self.added_moves = {}
+        self.root = {}
+        # No journal, the whole file is written by add_curent_lines_to_database
+        self.journal_entries = []
+        self.journal_size = 0
+        self.is_journaled = False
+        #
+        if lines_name != "new" :
+            self.load_from_database(lines_name)
+        #
+        self.go_to_root()
+    
+    def load_from_database(self, lines_name: str) :
+        """Open <lines_name>_database.bin, no node is read at this step."""
+        if self.reader is not None :
+            self.reader.close()
+        self.reader = BinaryMoveLinesReader(chessopy.FOLDER_PATH + "databases/" + lines_name + "_database.bin")
+        self.added_moves = {}
+        self.root = BinaryNode(self, 0)
+    
+    def close(self) :
+        """Close the binary database file."""
+        if self.reader is not None :
+            self.reader.close()
+            self.reader = None
+    
+    def to_move_tree(self) -> dict :
+        """Return the whole move lines (added moves included) as a nested dict."""
+        res = {}
+        stack = [(self.root, res)]
+        while stack :
+            node, subtree = stack.pop()
+            for key in node :
+                child = subtree[chessopy.shared_key(key)] = {}
+                stack.append((node[key], child))
+        return res
+    
+    def save_new_database(self, database_name="new_database.bin") :
+        write_binary_database(self.to_move_tree(), chessopy.FOLDER_PATH + "databases/" + database_name)
+    
+    def add_curent_lines_to_database(self) :
+        """Save the move lines in the database of the lines (<lines_name>_database.bin), 
+        the file is then reopened and the current line is kept."""
+        current_line = list(self.current_line)
+        move_tree = self.to_move_tree()
+        self.close()
+        write_binary_database(move_tree, chessopy.FOLDER_PATH + "databases/" + self.lines_name + "_database.bin")
+        self.load_from_database(self.lines_name)
+        self.go_to_root()
+        for key in current_line :
+            self.go_to_child(key)
+    
+    def remove_move(self, key) :
+        """The moves cannot be removed from a binary database: ReadOnlyBinaryDatabaseException is raised."""
+        raise ReadOnlyBinaryDatabaseException(f"{self.lines_name}: the moves of a binary database cannot be removed")
+    
+    def go_to_root(self) :
+        self.current_node = self.root
+        self.current_line = []
+        self.node_stack = [self.current_node]
+    
+    def go_to_child(self, key) :
+        """
+        Set the current_node attribute to the child using the key given.
+        If the key does not exist, a new node is added in memory.
+        The key is added to the current_line attribute.
+        """
+        if key not in self.current_node :
+            key = chessopy.shared_key(key)
+            if isinstance(self.current_node, BinaryNode) :
+                self.added_moves.setdefault(self.current_node.node_index, {})[key] = {}
+            else :
+                self.current_node[key] = {}
+        self.current_line.append(key)
+        self.current_node = self.current_node[key]
+        self.node_stack.append(self.current_node)
+
+if __name__ == "__main__" :
+    # Convert a database: python -m chessopy.binary_database <source> <destination>
+    # The direction is given by the extension of the source (.json or .bin).
+    import sys
+    source_path, destination_path = sys.argv[1:3]
+    if source_path.endswith(".json") :
+        convert_json_to_binary(source_path, destination_path)
+    else :
+        convert_binary_to_json(source_path, destination_path)
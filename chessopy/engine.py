@@ -0,0 +1,326 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Small chess engine, to reply out of the move lines: iterative deepening alpha-beta
+(negamax) search on the bitboards of a Board, with a transposition table of bounded size,
+move ordering (move of the table, captures by MVV-LVA, killer moves), a quiescence search
+of the captures and a time budget.
+The evaluation is the material (Piece.get_value), with a small bonus for the pawns
+and knights in the center. Draws by repetition are not detected.
+Usage: python -m chessopy.engine "<fen>" [time_budget]
+"""
+
+from collections import namedtuple
+import sys
+import threading
+import time
+
+from chessopy import Board, MoveLines, PieceColor, PIECE_CLASSES
+
+# Values of the pieces in centipawns, indexed by PieceType value (the king has no value)
+PIECE_VALUES = [100*(piece_class(PieceColor.WHITE).get_value() or 0) for piece_class in PIECE_CLASSES]
+# Bonus of the pawns and knights on the 4 central squares (d4, e4, d5, e5) and around them
+CENTER = (1 << 27) | (1 << 28) | (1 << 35) | (1 << 36)
+EXTENDED_CENTER = 0x00003C24243C0000
+CENTER_BONUS = 20
+EXTENDED_CENTER_BONUS = 8
+
+MATE_SCORE = 100000
+INFINITE_SCORE = MATE_SCORE + 1
+MAX_PLY = 64
+# The scores beyond it are mates, stored in the table relative to the node (not to the root)
+MATE_BOUND = MATE_SCORE - MAX_PLY
+
+# Bounds of the scores of the transposition table
+EXACT = 0
+LOWER_BOUND = 1 # the score is at least the one stored (beta cutoff)
+UPPER_BOUND = 2 # the score is at most the one stored (no move raised alpha)
+
+# The time and the stop event are checked every NODES_BETWEEN_CHECKS nodes
+NODES_BETWEEN_CHECKS = 1024
+
+SearchResult = namedtuple("SearchResult", ["move", "score", "depth", "node_count", "elapsed_time"])
+# move: move tuple (start_square_number, destination_square_number, promotion) or None if there is no legal move
+# score: centipawns for the side to move, +/- (MATE_SCORE - plies) for a mate
+# depth: depth of the last iteration completed
+
+class SearchTimeout(Exception) :
+    pass
+
+class TranspositionTable() :
+    """
+    Results of the positions already searched, by Zobrist hash. The table has a fixed number
+    of entries (a power of two), indexed by the low bits of the hash: an entry is replaced
+    by a result of a new search, or of the same search at least as deep.
+    """
+
+    def __init__(self, size: int = 1 << 16) :
+        self.size = 1 << max(size - 1, 1).bit_length()
+        self.mask = self.size - 1
+        # Tuples (zobrist_hash, depth, score, bound, move, generation), or None
+        self.entries = [None] * self.size
+        self.used_count = 0
+        self.generation = 0
+
+    def __len__(self) :
+        return self.used_count
+
+    def new_search(self) :
+        self.generation += 1
+
+    def clear(self) :
+        self.entries = [None] * self.size
+        self.used_count = 0
+
+    def get(self, zobrist_hash: int) -> tuple :
+        """Return the entry of the position given, or None."""
+        entry = self.entries[zobrist_hash & self.mask]
+        if entry is not None and entry[0] == zobrist_hash :
+            return entry
+        return None
+
+    def put(self, zobrist_hash: int, depth: int, score: int, bound: int, move: tuple) :
+        index = zobrist_hash & self.mask
+        entry = self.entries[index]
+        if entry is None :
+            self.used_count += 1
+        elif entry[5] == self.generation and entry[1] > depth and entry[0] != zobrist_hash :
+            return
+        self.entries[index] = (zobrist_hash, depth, score, bound, move, self.generation)
+
+def evaluate(board: Board) -> int :
+    """Return the static evaluation of the position in centipawns, for the side to move."""
+    bitboards = board.bitboards
+    score = 0
+    for piece_type_value in range(5) :
+        value = PIECE_VALUES[piece_type_value]
+        score += value * (bin(bitboards[6 + piece_type_value]).count("1") - bin(bitboards[piece_type_value]).count("1"))
+    for piece_type_value in (0, 1) :
+        white_pieces = bitboards[6 + piece_type_value]
+        black_pieces = bitboards[piece_type_value]
+        score += CENTER_BONUS * (bin(white_pieces & CENTER).count("1") - bin(black_pieces & CENTER).count("1"))
+        score += EXTENDED_CENTER_BONUS * (bin(white_pieces & EXTENDED_CENTER).count("1")
+                                          - bin(black_pieces & EXTENDED_CENTER).count("1"))
+    return score if board.turn.value else -score
+
+class Engine() :
+    """
+    Search the best move of a position in a time budget (cf. search).
+    The engine searches on a board of its own: the position of the board given is copied,
+    so that the board can be used by another thread (the Tk thread) during the search.
+    The search ends early when its stop event is set from another thread (cf. search), 
+    or when stop is called.
+    """
+
+    def __init__(self, table_size: int = 1 << 16) :
+        self.board = Board(MoveLines("new"))
+        self.table = TranspositionTable(table_size)
+        # Stop event of the current search
+        self.stop_event = threading.Event()
+        # Two quiet moves which caused a beta cutoff, by ply
+        self.killers = [[None, None] for ply in range(MAX_PLY + 1)]
+        self.node_count = 0
+        self.deadline = None
+        self.can_stop = False
+        self.root_move = None
+
+    def stop(self) :
+        """Stop the current search: the best move of the last iteration completed is returned."""
+        self.stop_event.set()
+
+    def search(self, board: Board, time_budget: float = 1.0, max_depth: int = MAX_PLY, 
+               stop_event: threading.Event = None) -> SearchResult :
+        """
+        Return the best move found for the position of the board given, searched
+        with increasing depths until the time budget (in seconds) is spent or max_depth is reached.
+        The first iteration is always completed.
+        The search also ends when stop_event is set: created by the caller before the search 
+        starts, it can be set before the search starts too (a new event is used if None).
+        """
+        return self.search_position(board.get_position_state(), time_budget, max_depth, stop_event)
+
+    def search_position(self, position_state: tuple, time_budget: float = 1.0, max_depth: int = MAX_PLY, 
+                        stop_event: threading.Event = None) -> SearchResult :
+        """Like search, for a position given by its state (cf. Board.get_position_state): 
+        a copy of the position taken by the thread which owns the board."""
+        start_time = time.perf_counter()
+        self.deadline = start_time + time_budget
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.board.set_position_state(position_state)
+        self.table.new_search()
+        self.killers = [[None, None] for ply in range(MAX_PLY + 1)]
+        self.node_count = 0
+        res = SearchResult(None, 0, 0, 0, 0)
+        for depth in range(1, min(max_depth, MAX_PLY) + 1) :
+            self.can_stop = depth > 1
+            self.root_move = None
+            try :
+                score = self._search(depth, -INFINITE_SCORE, INFINITE_SCORE, 0)
+            except SearchTimeout :
+                break
+            res = SearchResult(self.root_move, score, depth, self.node_count, time.perf_counter() - start_time)
+            # No move, or a mate found: deeper searches won't change anything
+            if self.root_move is None or abs(score) >= MATE_BOUND :
+                break
+            if time.perf_counter() >= self.deadline :
+                break
+        return res._replace(node_count=self.node_count, elapsed_time=time.perf_counter() - start_time)
+
+    def choose_move(self, board: Board, time_budget: float = 1.0) -> tuple :
+        """Return the move tuple (start_square_number, destination_square_number, promotion)
+        of the best move found in the time budget, or None if there is no legal move."""
+        return self.search(board, time_budget).move
+
+    def _check_time(self) :
+        if self.can_stop and (time.perf_counter() >= self.deadline or self.stop_event.is_set()) :
+            raise SearchTimeout()
+
+    def _search(self, depth: int, alpha: int, beta: int, ply: int) -> int :
+        """Return the score of the position for the side to move (negamax with alpha-beta cutoffs)."""
+        self.node_count += 1
+        if not self.node_count % NODES_BETWEEN_CHECKS :
+            self._check_time()
+        board = self.board
+        if ply and board.halfmove_clock >= 100 :
+            return 0
+        zobrist_hash = board.zobrist_hash
+        entry = self.table.get(zobrist_hash)
+        table_move = None
+        if entry is not None :
+            table_move = entry[4]
+            if ply and entry[1] >= depth :
+                score = _score_from_table(entry[2], ply)
+                bound = entry[3]
+                if bound == EXACT or (bound == LOWER_BOUND and score >= beta) or (bound == UPPER_BOUND and score <= alpha) :
+                    return score
+        if depth <= 0 or ply >= MAX_PLY :
+            return self._quiescence(alpha, beta, ply)
+        color_value = board.turn.value
+        original_alpha = alpha
+        best_score = -INFINITE_SCORE
+        best_move = None
+        killers = self.killers[ply]
+        for move in self._order_moves(board._generate_pseudo_legal_moves(), table_move, killers) :
+            undo = board._make_move(*move)
+            try :
+                if board._is_king_attacked(color_value) :
+                    continue
+                score = -self._search(depth - 1, -beta, -alpha, ply + 1)
+            finally :
+                board._unmake_move(undo)
+            if score > best_score :
+                best_score = score
+                best_move = move
+                if score > alpha :
+                    alpha = score
+                    if not ply :
+                        self.root_move = move
+                    if alpha >= beta :
+                        if undo[4] is None and move[2] is None and move != killers[0] :
+                            killers[1] = killers[0]
+                            killers[0] = move
+                        break
+        if best_move is None :
+            # No legal move: checkmate or stalemate
+            return -MATE_SCORE + ply if board._is_king_attacked(color_value) else 0
+        if best_score <= original_alpha :
+            bound = UPPER_BOUND
+        elif best_score >= beta :
+            bound = LOWER_BOUND
+        else :
+            bound = EXACT
+        self.table.put(zobrist_hash, depth, _score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def _quiescence(self, alpha: int, beta: int, ply: int) -> int :
+        """Return the score of the position once the captures (and promotions) are played out."""
+        self.node_count += 1
+        if not self.node_count % NODES_BETWEEN_CHECKS :
+            self._check_time()
+        board = self.board
+        stand_pat = evaluate(board)
+        if stand_pat >= beta :
+            return stand_pat
+        if stand_pat > alpha :
+            alpha = stand_pat
+        color_value = board.turn.value
+        them = board.occupied_co[1 - color_value]
+        if board.ep_square is not None :
+            them |= 1 << board.ep_square
+        moves = [move for move in board._generate_pseudo_legal_moves()
+                 if them & (1 << move[1]) or move[2] == 4]
+        for move in self._order_moves(moves, None, (None, None)) :
+            undo = board._make_move(*move)
+            try :
+                if board._is_king_attacked(color_value) :
+                    continue
+                score = -self._quiescence(-beta, -alpha, ply + 1)
+            finally :
+                board._unmake_move(undo)
+            if score > alpha :
+                if score >= beta :
+                    return score
+                alpha = score
+        return alpha
+
+    def _order_moves(self, moves: list, table_move: tuple, killers: list) -> list :
+        """Return the moves sorted by the order in which they are searched: move of the table,
+        captures (most valuable victim, least valuable attacker first) and promotions, killer moves."""
+        board = self.board
+        get_bitboard_index_at = board.get_bitboard_index_at
+        occupied = board.occupied
+        ordered_moves = []
+        for move in moves :
+            if move == table_move :
+                order = 1000000
+            else :
+                order = 0
+                if occupied & (1 << move[1]) :
+                    order = 100000 + 10*PIECE_VALUES[get_bitboard_index_at(move[1]) % 6] \
+                        - PIECE_VALUES[get_bitboard_index_at(move[0]) % 6] // 100
+                elif move[1] == board.ep_square and get_bitboard_index_at(move[0]) % 6 == 0 :
+                    order = 100000 + 10*PIECE_VALUES[0]
+                if move[2] is not None :
+                    order += PIECE_VALUES[move[2]]
+                elif not order and (move == killers[0] or move == killers[1]) :
+                    order = 50000
+            ordered_moves.append((order, move))
+        ordered_moves.sort(key=lambda ordered_move: ordered_move[0], reverse=True)
+        return [move for order, move in ordered_moves]
+
+def _score_to_table(score: int, ply: int) -> int :
+    # The mate scores are stored as distances from the node
+    if score >= MATE_BOUND :
+        return score + ply
+    if score <= -MATE_BOUND :
+        return score - ply
+    return score
+
+def _score_from_table(score: int, ply: int) -> int :
+    if score >= MATE_BOUND :
+        return score - ply
+    if score <= -MATE_BOUND :
+        return score + ply
+    return score
+
+if __name__ == "__main__" :
+    board = Board(MoveLines("new"))
+    board.set_fen(sys.argv[1])
+    time_budget = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    result = Engine().search(board, time_budget)
+    print(f"move {result.move}, score {result.score}, depth {result.depth}, "
+          f"{result.node_count} nodes in {result.elapsed_time:.2f} s ({result.node_count/max(result.elapsed_time, 1e-9):.0f} nodes/s)")
@@ -0,0 +1,576 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Graphical interface of chessopy, written with tkinter.
+Run it with: python -m chessopy.gui
+"""
+
+from tkinter import Tk, Canvas, PhotoImage, Button, Label, \
+    N, E, S, W, NE, NW, SE, SW, X, Y, BOTH
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import List
+import sys
+import threading
+import time
+
+import chessopy
+from chessopy import Board, COLORS, MoveLines, PieceColor, PieceType, Square, SquareColor
+from chessopy.engine import Engine
+from chessopy.sound import SilentBackend, SoundPlayer
+from chessopy.training import TrainingSession
+
+############ Graphical objects ############
+
+SQUARE_SIZE = 86
+BOARD_SIZE = SQUARE_SIZE * 8
+
+class PieceGui(PhotoImage) :
+    """Image of a piece type and color, shared by all the squares (cf. get_piece_gui)."""
+    
+    def __init__(self, piece_type: PieceType, color: PieceColor, image_path: str) :
+        PhotoImage.__init__(self, file=image_path)
+        self.piece_type = piece_type
+        self.color = color
+
+# Decoded piece images, by (piece type, color, size)
+PIECE_GUI_CACHE = {}
+
+def get_piece_gui(piece_type: PieceType, color: PieceColor, size: int = SQUARE_SIZE) -> PieceGui :
+    """Return the image of the piece given, the file is read only the first time."""
+    cache_key = (piece_type, color, size)
+    piece_gui = PIECE_GUI_CACHE.get(cache_key)
+    if piece_gui is None :
+        image_path = chessopy.FOLDER_PATH + f"images/piece_sets/cburnett/{size}x{size}/" # TODO: relative path...
+        image_file = f"{color.name.lower()}_{piece_type.name.lower()}.png"
+        piece_gui = PieceGui(piece_type, color, image_path + image_file)
+        PIECE_GUI_CACHE[cache_key] = piece_gui
+    return piece_gui
+
+class SquareView(ABC) :
+    """
+    Selection, highlight and click logic of a square of the board, 
+    shared by the renderers (SquareGui and CanvasSquareGui).
+    The subclasses draw the square with set_background and update_piece.
+    """
+
+    DARK_BG = 'lightgrey'
+    LIGHT_BG = 'lightblue'
+
+    SELECTED_COLOR = 'yellow'
+
+    HIGHLIGHTED_COLOR = 'blue'
+
+    def __init__(self, parent, square: Square) :
+        self.parent = parent
+        # Square attribute
+        self.square = square
+        self.selected = False
+        self.highlighted = False
+        # Graphical piece
+        self.piece_gui = None
+        # Square background
+        if self.square.get_color() == SquareColor.DARK.value :
+            self.base_color = SquareView.DARK_BG
+        else :
+            self.base_color = SquareView.LIGHT_BG
+    
+    @abstractmethod
+    def set_background(self, color: str) :
+        """Draw the background of the square with the color given."""
+    
+    @abstractmethod
+    def update_piece(self, piece_gui: PieceGui) :
+        """Replace the piece displayed by the one given (None to clear the square)."""
+    
+    def clear_square(self) :
+        self.update_piece(None)
+    
+    def select(self) :
+        self.selected = True
+        self.point()
+        self.parent.square_gui_selected = self
+
+    def unselect(self) :
+        self.selected = False
+        self.unpoint()
+        self.parent.square_gui_selected = None
+    
+    def point(self) :
+        self.set_background(SquareView.SELECTED_COLOR)
+    
+    def unpoint(self) :
+        if self.highlighted :
+            self.set_background(SquareView.HIGHLIGHTED_COLOR)
+        else :
+            self.set_background(self.base_color)
+    
+    def on_left_click(self, event) :
+        if self.selected :
+            self.unselect()
+        else :
+            if self.parent.square_gui_selected is None :
+                if self.square.has_piece() :
+                    self.select()
+                else :
+                    pass # do nothing
+            else :
+                if self.parent.is_training_session :
+                    self.parent.check_then_make_move(self)
+                else :
+                    self.parent.make_move(self)
+                self.parent.square_gui_selected.unselect()
+    
+    def highlight(self) :
+        self.set_background(SquareView.HIGHLIGHTED_COLOR)
+        self.highlighted = not self.highlighted
+    
+    def unhighlight(self) :
+        if not self.selected :
+            self.set_background(self.base_color)
+        else :
+            self.set_background(SquareView.HIGHLIGHTED_COLOR)
+        self.highlighted = not self.highlighted
+
+    def on_right_click(self, event) :
+        if not self.highlighted :
+            self.highlight()
+        else :
+            self.unhighlight()
+
+class SquareGui(SquareView, Canvas) :
+    """Square drawn in its own canvas widget, placed on the board canvas."""
+
+    def __init__(self, parent, square: Square) :
+        # Init
+        Canvas.__init__(self, parent, width=SQUARE_SIZE, height=SQUARE_SIZE)
+        SquareView.__init__(self, parent, square)
+        # Position on the board canvas
+        x_position = 1/8 * self.square.get_file()
+        y_position = 1 - (1/8 * (self.square.get_rank() + 1))
+        self.place(relx=x_position, rely=y_position)
+        # Configure square background
+        self.configure(bg=self.base_color)
+        # Button bindings
+        self.bind("<Button-1>", self.on_left_click)
+        self.bind("<Button-3>", self.on_right_click)
+    
+    def set_background(self, color: str) :
+        self.configure(bg=color)
+    
+    def update_piece(self, piece_gui: PieceGui) :
+        """Replace the piece displayed by the one given (None to clear the square)."""
+        self.delete("piece")
+        self.piece_gui = piece_gui
+        if piece_gui is not None :
+            self.create_image(0, 0, image=self.piece_gui, anchor=NW, tags="piece")
+
+class CanvasSquareGui(SquareView) :
+    """Square drawn as items of the board canvas (cf. CanvasBoardGui), 
+    tagged with the square number: "square<n>" for the background and "piece<n>" for the piece."""
+
+    def __init__(self, parent, square: Square) :
+        SquareView.__init__(self, parent, square)
+        square_number = square.get_number()
+        self.square_tag = f"square{square_number}"
+        self.piece_tag = f"piece{square_number}"
+        self.x_position = SQUARE_SIZE * square.get_file()
+        self.y_position = SQUARE_SIZE * (7 - square.get_rank())
+        parent.create_rectangle(self.x_position, self.y_position, 
+                                self.x_position + SQUARE_SIZE, self.y_position + SQUARE_SIZE, 
+                                fill=self.base_color, width=0, tags=(self.square_tag, "square"))
+    
+    def set_background(self, color: str) :
+        self.parent.itemconfigure(self.square_tag, fill=color)
+    
+    def update_piece(self, piece_gui: PieceGui) :
+        """Replace the piece displayed by the one given (None to clear the square)."""
+        self.parent.delete(self.piece_tag)
+        self.piece_gui = piece_gui
+        if piece_gui is not None :
+            self.parent.create_image(self.x_position, self.y_position, image=piece_gui, anchor=NW, 
+                                     tags=(self.piece_tag, "piece"))
+
+# False to play the moves without sound
+SOUNDS_ENABLED = True
+
+# Delay (ms) before the computer reply, so that the move of the user is seen first
+COMPUTER_REPLY_DELAY = 200
+
+# Time (s) of the engine search of the computer replies out of the move lines, None to never use the engine
+ENGINE_TIME_BUDGET = 1.0
+
+class ComputerReply() :
+    """
+    Computer reply of a board gui, without blocking the Tk mainloop: the reply is chosen 
+    on a worker thread (the reply source can be slow, a big book or an engine for instance), 
+    the Tk thread polls the result with after() callbacks and plays it once the delay is over.
+    A pending reply can be cancelled (Undo, Stop training...).
+    """
+
+    POLL_DELAY = 10 # ms
+
+    def __init__(self, board_gui, reply_source, delay: int = COMPUTER_REPLY_DELAY, executor: Executor = None) :
+        """reply_source is called on the Tk thread when a reply is scheduled, with the stop event 
+        (threading.Event) of the reply, set if the reply is cancelled while it is computed 
+        (to end an engine search for instance). It returns the function (without argument) 
+        called on a worker thread of the executor (a single thread by default), 
+        which returns a move tuple (start_square_number, destination_square_number, promotion) or None. 
+        This function must not read the board, which the Tk thread can change meanwhile, 
+        but a copy of what it needs (cf. TrainingSession.prepare_reply)."""
+        self.board_gui = board_gui
+        self.reply_source = reply_source
+        # A new stop event for each reply: the stop of a reply cannot be lost or stop the next one
+        self.stop_event = None
+        self.delay = delay
+        self.executor = executor
+        self.future = None
+        self.after_id = None
+        self.start_time = None
+        self.current_delay = delay
+    
+    def is_pending(self) -> bool :
+        return self.future is not None
+    
+    def schedule(self, delay: int = None) :
+        """Start choosing a reply, it will be played after the delay given (ms, the default delay if None)."""
+        self.cancel()
+        if self.executor is None :
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.start_time = time.perf_counter()
+        self.current_delay = self.delay if delay is None else delay
+        self.stop_event = threading.Event()
+        self.future = self.executor.submit(self.reply_source(self.stop_event))
+        self.after_id = self.board_gui.after(min(self.POLL_DELAY, self.current_delay), self.poll)
+    
+    def poll(self) :
+        """Play the reply if it is ready and the delay is over, otherwise poll again later."""
+        self.after_id = None
+        remaining_delay = self.current_delay - int((time.perf_counter() - self.start_time) * 1000)
+        if not self.future.done() :
+            self.after_id = self.board_gui.after(self.POLL_DELAY, self.poll)
+        elif remaining_delay > 0 :
+            self.after_id = self.board_gui.after(remaining_delay, self.poll)
+        else :
+            future = self.future
+            self.future = None
+            self.board_gui.play_computer_reply(future.result())
+    
+    def cancel(self) :
+        if self.after_id is not None :
+            self.board_gui.after_cancel(self.after_id)
+            self.after_id = None
+        if self.future is not None :
+            # The result of a reply already being computed is ignored, and its computation stopped
+            if not self.future.cancel() and not self.future.done() :
+                self.stop_event.set()
+            self.future = None
+    
+    def shutdown(self) :
+        self.cancel()
+        if self.executor is not None :
+            self.executor.shutdown(wait=False)
+
+class BoardGui(Canvas) :
+    """Board drawn with a canvas widget for each square (cf. SquareGui)."""
+    
+    def __init__(self, parent) :
+        Canvas.__init__(self, parent, width=BOARD_SIZE, height=BOARD_SIZE)
+        self.parent = parent
+        # The move lines are loaded in the background once the window is displayed (cf. load_move_lines)
+        self.board = Board(MoveLines("new"))
+        self.are_lines_loaded = False
+        self.move_lines_future = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.squares_gui = []
+        for square in self.board.squares :
+            self.squares_gui.append(self.create_square_gui(square))
+        #
+        self.square_gui_selected = None
+        # Bitboard index (cf. Board.get_bitboard_index_at) of the piece displayed on each square
+        self.displayed_pieces = [None] * 64
+        # Training logic (without tkinter)
+        # The engine replies once the line is finished
+        self.engine = Engine() if ENGINE_TIME_BUDGET is not None else None
+        self.training_session = TrainingSession(self.board, engine=self.engine, engine_time_budget=ENGINE_TIME_BUDGET)
+        self.computer_reply = ComputerReply(self, self.training_session.prepare_reply, executor=self.executor)
+        # Sounds of the moves (played on a background thread)
+        self.sound_player = SoundPlayer(None if SOUNDS_ENABLED else SilentBackend())
+        # self.training_list = [ #this list will be replaced by board.move_lines
+        #     (12,28),
+        #     (52,44),
+        #     (11,27),
+        #     (51,35),
+        #     (28,36),
+        #     (50,34)
+        #     ]
+        # self.move_number = 0
+        self.bind("<Map>", self.on_map)
+    
+    def create_square_gui(self, square: Square) -> SquareView :
+        return SquareGui(self, square)
+    
+    def on_map(self, event) :
+        if not self.are_lines_loaded and self.move_lines_future is None :
+            self.load_move_lines(chessopy.LINES_TO_BE_LOADED)
+    
+    def load_move_lines(self, lines_name: str) :
+        """Load the move lines given on a worker thread, the mainloop goes on in the meantime."""
+        self.are_lines_loaded = False
+        self.parent.start_button.configure(state="disabled")
+        self.move_lines_future = self.executor.submit(MoveLines, lines_name)
+        self.after(ComputerReply.POLL_DELAY, self.poll_move_lines)
+    
+    def poll_move_lines(self) :
+        if not self.move_lines_future.done() :
+            self.after(ComputerReply.POLL_DELAY, self.poll_move_lines)
+            return
+        try :
+            move_lines = self.move_lines_future.result()
+        except (OSError, ValueError) as exception :
+            print(f"The move lines could not be loaded: {exception}")
+            move_lines = self.board.move_lines
+        # The moves played while the lines were loading are recorded in the lines loaded 
+        # (except the moves out of the lines, cf. Board.move_piece)
+        if move_lines is not self.board.move_lines :
+            move_lines.go_to_root()
+            for move in self.board.move_played[:len(self.board.move_played) - self.board.unrecorded_move_count] :
+                move_lines.add_move(move)
+            self.board.move_lines = move_lines
+        self.are_lines_loaded = True
+        self.parent.start_button.configure(state="normal")
+    
+    @property
+    def is_training_session(self) -> bool :
+        return self.training_session.is_started
+    
+    def display_all_pieces(self) :
+        """Display the pieces of the board. Only the squares whose piece changed 
+        since the last display (the dirty squares) are redrawn."""
+        for square_number in self.get_dirty_squares() :
+            self.update_square(square_number)
+    
+    def get_dirty_squares(self) -> List[int] :
+        """Return the numbers of the squares where the piece displayed is not the piece on the board."""
+        get_bitboard_index_at = self.board.get_bitboard_index_at
+        displayed_pieces = self.displayed_pieces
+        return [square_number for square_number in range(64) 
+                if get_bitboard_index_at(square_number) != displayed_pieces[square_number]]
+    
+    def update_square(self, square_number: int) :
+        """Display the piece of the board on the square given."""
+        index = self.board.get_bitboard_index_at(square_number)
+        if index is None :
+            piece_gui = None
+        else :
+            piece_gui = get_piece_gui(PieceType(index % 6), COLORS[index // 6])
+        self.squares_gui[square_number].update_piece(piece_gui)
+        self.displayed_pieces[square_number] = index
+
+    def clear_board(self) :
+        for square_gui in self.squares_gui :
+            square_gui.clear_square()
+        self.displayed_pieces = [None] * 64
+    
+    def reset_position(self) :
+        self.computer_reply.cancel()
+        self.board.set_new_game()
+        self.display_all_pieces()
+
+    def check_then_make_move(self, square_gui: SquareView) :
+        """Play the move of the user in the training session: it is only made if it is in the lines 
+        (cf. TrainingSession.play_user_move)."""
+        start_square_number = self.square_gui_selected.square.get_number()
+        destination_square_number = square_gui.square.get_number()
+        self.computer_reply.cancel()
+        if not self.training_session.play_user_move(start_square_number, destination_square_number) :
+            print("T'es pas dans le coup.")
+            return
+        self.show_move_played()
+
+    def make_move(self, square_gui: SquareView) :
+        self.computer_reply.cancel()
+        self.board.move_piece(self.square_gui_selected.square.piece, square_gui.square)
+        self.show_move_played()
+    
+    def show_move_played(self) :
+        """Display the last move played by the user, and schedule the computer reply during a training."""
+        self.parent.undo_button.configure(state="normal")
+        self.display_all_pieces()
+        self.sound_player.play_move_sound(self.board.move_played[-1])
+        #
+        if self.is_training_session :
+            self.square_gui_selected.unpoint()
+            # The reply is played later, the mainloop goes on in the meantime
+            self.computer_reply.schedule()
+    
+    def make_computer_move(self, start_square_number: int, destination_square_number: int, promotion: PieceType = None) :
+        """Make a move without using the square_gui_selected attribute 
+        (a move of the engine is not added to the move lines, cf. TrainingSession.make_reply)."""
+        self.training_session.make_reply((start_square_number, destination_square_number, promotion))
+        self.display_all_pieces()
+        self.sound_player.play_move_sound(self.board.move_played[-1])
+    
+    def undo_last_move(self, event) :
+        self.computer_reply.cancel()
+        if not self.board.move_played == [] :
+            # In case of a square was selected while the user clicked 'Undo'
+            if self.square_gui_selected is not None :
+                self.square_gui_selected.unselect()
+            #
+            self.board.pop_last_move()
+            self.display_all_pieces()
+        if self.board.move_played == [] :
+            self.parent.undo_button.configure(state="disabled")
+    
+    def start_training(self, event) :
+        # The button is disabled while the lines are loading, but its binding is still called
+        if not self.are_lines_loaded :
+            return
+        if not self.is_training_session :
+            self.training_session.start()
+            self.display_all_pieces()
+            self.parent.start_button.configure(text="Stop training")
+        else :
+            self.computer_reply.cancel()
+            self.training_session.stop()
+            self.parent.start_button.configure(text="Start training")
+    
+    def play_random_move(self, event=None) :
+        """Play a computer reply: immediately if the user asked for it (event), 
+        after the reply delay otherwise. The mainloop is not blocked."""
+        self.computer_reply.schedule(0 if event is not None else None)
+    
+    def play_computer_reply(self, reply: tuple) :
+        """Callback of computer_reply, on the Tk thread."""
+        if reply is None :
+            print("No more move on the current line.")
+        else :
+            self.make_computer_move(*reply)
+            self.parent.undo_button.configure(state="normal")
+    
+    def print_some_stuff(self, event) :
+        print("Moves in move_played : ")
+        for move in self.board.move_played :
+            print(move)
+        print("Move lines : ")
+        print(self.board.move_lines)
+        
+    def save_current_move_lines(self, event) : 
+        #TODO: add a database_name argument to let the user control it from the gui
+        """Save the move lines in their database, only the moves added since the last save 
+        are written (cf. MoveLines.add_curent_lines_to_database)."""
+        self.board.move_lines.add_curent_lines_to_database()
+
+class CanvasBoardGui(BoardGui) :
+    """
+    Board drawn on a single canvas: the squares and the pieces are canvas items 
+    (cf. CanvasSquareGui), and the clicks are mapped from pixels to squares.
+    """
+
+    def __init__(self, parent) :
+        BoardGui.__init__(self, parent)
+        # No border, so that the pixels of the canvas are the pixels of the board
+        self.configure(highlightthickness=0)
+        self.bind("<Button-1>", self.on_left_click)
+        self.bind("<Button-3>", self.on_right_click)
+    
+    def create_square_gui(self, square: Square) -> SquareView :
+        return CanvasSquareGui(self, square)
+    
+    def get_square_gui_at(self, x: int, y: int) -> SquareView :
+        """Return the square at the pixel given, or None if it is out of the board."""
+        file_number = x // SQUARE_SIZE
+        rank_number = 7 - y // SQUARE_SIZE
+        if not (0 <= file_number < 8 and 0 <= rank_number < 8) :
+            return None
+        return self.squares_gui[rank_number*8 + file_number]
+    
+    def on_left_click(self, event) :
+        square_gui = self.get_square_gui_at(event.x, event.y)
+        if square_gui is not None :
+            square_gui.on_left_click(event)
+    
+    def on_right_click(self, event) :
+        square_gui = self.get_square_gui_at(event.x, event.y)
+        if square_gui is not None :
+            square_gui.on_right_click(event)
+
+# Board renderers which can be chosen with the RENDERER variable (or the argument of ChessGuiApp)
+RENDERERS = {
+    "widgets": BoardGui,
+    "canvas": CanvasBoardGui,
+}
+RENDERER = "widgets"
+
+############ Main ############
+
+class ChessGuiApp(Tk) :
+    
+    def __init__(self, renderer: str = None) :
+        # Define the window
+        Tk.__init__(self)
+        self.title("ChessOpy")
+        # 
+        self.board_gui = RENDERERS[renderer or RENDERER](self)
+        self.board_gui.display_all_pieces()
+        self.board_gui.grid(row=0, column=0)
+        #
+        self.side_canvas = Canvas(self, width=BOARD_SIZE//4, height=BOARD_SIZE, bg='ivory')
+        self.side_canvas.grid(row=0, column=1, sticky='ns')
+        #
+        # self.buttons_canvas = Canvas(self.side_canvas, bg='ivory')
+        # self.buttons_canvas.pack(fill=X)
+        #
+        self.create_buttons()
+        #
+        # self.display_canvas = Canvas(self.side_canvas, bg='lightgreen')
+        # self.display_canvas.pack(expand=True)
+        #
+        self.display_label= Label(self.side_canvas, text="Bienvenue !", bg='lightgreen')
+        self.display_label.pack(expand=True)
+    
+    def destroy(self) :
+        self.board_gui.computer_reply.shutdown() # and its executor, shared with the loading of the lines
+        self.board_gui.sound_player.close()
+        # The cached images belong to the Tk interpreter of the window
+        PIECE_GUI_CACHE.clear()
+        Tk.destroy(self)
+    
+    def create_buttons(self) :
+        #
+        self.undo_button = Button(self.side_canvas, text="Undo", state="disabled")
+        self.undo_button.bind("<Button-1>", self.board_gui.undo_last_move)
+        self.undo_button.pack(fill=X)
+        #
+        self.start_button = Button(self.side_canvas, text="Start training", state="disabled")
+        self.start_button.bind("<Button-1>", self.board_gui.start_training)
+        self.start_button.pack(fill=X)
+        #
+        self.save_button = Button(self.side_canvas, text="Save move lines")
+        self.save_button.bind("<Button-1>", self.board_gui.save_current_move_lines)
+        self.save_button.pack(fill=X)
+        #
+        self.play_button = Button(self.side_canvas, text="Play random move")
+        self.play_button.bind("<Button-1>", self.board_gui.play_random_move)
+        self.play_button.pack(fill=X)
+
+if __name__ == "__main__" :
+    # Optional argument: name of the renderer (cf. RENDERERS)
+    root = ChessGuiApp(*sys.argv[1:2])
+    # root.geometry(f'{int(BOARD_SIZE*1.25)}x{BOARD_SIZE}+40+20')
+    root.mainloop()
@@ -0,0 +1,128 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Library of the repertoires ("french", "sicilian"...) of the databases folder.
+
+The databases are indexed by name without being read, a repertoire is loaded
+the first time it is asked, and only the last ones used are kept in memory (LRU).
+"""
+
+from collections import OrderedDict
+from typing import List
+import os
+import threading
+
+import chessopy
+from chessopy import MoveLines
+from chessopy.analysis import has_unsaved_moves
+from chessopy.binary_database import BinaryMoveLines
+
+# Database files: suffix -> MoveLines class
+DATABASE_CLASSES = {
+    "_database.json": MoveLines,
+    "_database.bin": BinaryMoveLines,
+}
+
+class UnknownRepertoireException(Exception) :
+    pass
+
+class RepertoireLibrary() :
+    """
+    Named move lines of the databases folder (<name>_database.json or <name>_database.bin).
+    At most max_loaded repertoires are kept in memory: the least recently used one
+    is dropped when another one is loaded, except for the repertoires pinned (the current one 
+    for instance). The unsaved moves of a dropped repertoire are saved first.
+    """
+
+    def __init__(self, max_loaded: int = 4) :
+        self.max_loaded = max_loaded
+        # name -> (file path, MoveLines class)
+        self.index = {}
+        # name -> (move lines, modification time of the file when loaded), least recently used first
+        self.loaded = OrderedDict()
+        self.pinned_names = set()
+        self.lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self) :
+        """Index the database files of the folder, none of them is read."""
+        folder_path = chessopy.FOLDER_PATH + "databases/"
+        file_names = sorted(os.listdir(folder_path))
+        index = {}
+        # JSON files first, if a repertoire has both files
+        for suffix, move_lines_class in DATABASE_CLASSES.items() :
+            for file_name in file_names :
+                if file_name.endswith(suffix) :
+                    index.setdefault(file_name[:-len(suffix)], (folder_path + file_name, move_lines_class))
+        with self.lock :
+            self.index = index
+
+    def get_names(self) -> List[str] :
+        return sorted(self.index)
+
+    def __contains__(self, name: str) :
+        return name in self.index
+
+    def __len__(self) :
+        return len(self.index)
+
+    def is_loaded(self, name: str) -> bool :
+        return name in self.loaded
+
+    def get(self, name: str) -> MoveLines :
+        """Return the move lines of the name given, loaded if needed (or if the file changed since, 
+        unless the repertoire is pinned: its move lines are in use, and the compaction 
+        of their journal changes the file)."""
+        with self.lock :
+            if name not in self.index :
+                raise UnknownRepertoireException(name)
+            file_path, move_lines_class = self.index[name]
+            if name in self.loaded :
+                move_lines, loaded_modification_time = self.loaded[name]
+                if name in self.pinned_names or loaded_modification_time == os.path.getmtime(file_path) :
+                    self.loaded.move_to_end(name)
+                    return move_lines
+                self._drop(name)
+            # After _drop, which may save the moves in the file
+            modification_time = os.path.getmtime(file_path)
+            move_lines = move_lines_class(name)
+            self.loaded[name] = (move_lines, modification_time)
+            self._evict()
+            return move_lines
+
+    def pin(self, name: str) :
+        """Keep the repertoire given in memory until unpin is called."""
+        self.pinned_names.add(name)
+
+    def unpin(self, name: str) :
+        self.pinned_names.discard(name)
+        with self.lock :
+            self._evict()
+
+    def _evict(self) :
+        for name in list(self.loaded) :
+            if len(self.loaded) <= self.max_loaded :
+                break
+            if name not in self.pinned_names :
+                self._drop(name)
+
+    def _drop(self, name: str) :
+        move_lines, modification_time = self.loaded.pop(name)
+        if has_unsaved_moves(move_lines) :
+            move_lines.add_curent_lines_to_database()
+        if hasattr(move_lines, "close") : # the file of a binary database is still open
+            move_lines.close()
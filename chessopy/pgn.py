@@ -0,0 +1,242 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Streaming PGN reader, and importer of PGN games in MoveLines.
+
+The file is read line by line and the games are yielded one by one, 
+so that big PGN files never have to be loaded in memory.
+"""
+
+from typing import Iterator, List, TextIO
+import re
+
+from chessopy import Board, MoveLines, NotValidSanMoveException, PieceType, key_to_move
+
+HEADER_PATTERN = re.compile(r'^\[\s*(\w+)\s+"(.*)"\s*\]\s*$')
+
+# Groups: comment, line comment, variation start, variation end, NAG, result, move number, san move
+# A move number is followed by dots or by a separator: "0-0" is a castling, not the move number "0"
+TOKEN_PATTERN = re.compile(r"""
+      \{([^}]*)\}?
+    | ;([^\n]*)
+    | (\()
+    | (\))
+    | (\$\d+)
+    | (1-0|0-1|1/2-1/2|\*)
+    | (\d+(?:\.+|(?![^\s(){};$])))
+    | ([^\s(){};$]+)
+""", re.VERBOSE)
+
+class PgnNode() :
+    """
+    Node of the move tree of a PGN game.
+    The first child is the main line, the others are the variations.
+    The root node of a game has no san move.
+    """
+
+    def __init__(self, san: str = None, parent=None) :
+        self.san = san
+        self.parent = parent
+        self.children = []
+        self.comment = None
+    
+    def add_child(self, san: str) :
+        """Add a move after this node and return the new node."""
+        child = PgnNode(san, self)
+        self.children.append(child)
+        return child
+    
+    def get_main_line(self) -> List[str] :
+        """Return the list of the san moves of the main line from this node."""
+        res = []
+        node = self
+        while node.children :
+            node = node.children[0]
+            res.append(node.san)
+        return res
+
+class PgnGame() :
+    """A PGN game: the headers (dict of the tag pairs) and the tree of the moves."""
+
+    def __init__(self) :
+        self.headers = {}
+        self.root = PgnNode()
+        self.result = None
+    
+    def parse_movetext(self, movetext: str) :
+        """Build the move tree from the movetext of the game (moves, variations and comments)."""
+        current_node = self.root
+        variation_stack = []
+        for comment, line_comment, variation_start, variation_end, nag, result, move_number, san \
+                in TOKEN_PATTERN.findall(movetext) :
+            if san :
+                current_node = current_node.add_child(san.rstrip("!?"))
+            elif variation_start :
+                # A variation replaces the last move
+                variation_stack.append(current_node)
+                if current_node.parent is not None :
+                    current_node = current_node.parent
+            elif variation_end :
+                if variation_stack :
+                    current_node = variation_stack.pop()
+            elif result :
+                self.result = result
+            elif comment or line_comment :
+                text = (comment or line_comment).strip()
+                current_node.comment = text if current_node.comment is None else current_node.comment + " " + text
+
+def read_games(pgn_file: TextIO) -> Iterator[PgnGame] :
+    """
+    Generator over the games of the PGN file given (an open text file).
+    Only one game at a time is kept in memory.
+    """
+    game = None
+    movetext_lines = []
+    in_comment = False
+    for line in pgn_file :
+        if not in_comment :
+            header_match = HEADER_PATTERN.match(line)
+            if header_match :
+                # Headers after some movetext start a new game
+                if game is not None and movetext_lines :
+                    game.parse_movetext("".join(movetext_lines))
+                    yield game
+                    game = None
+                    movetext_lines = []
+                if game is None :
+                    game = PgnGame()
+                game.headers[header_match.group(1)] = header_match.group(2)
+                continue
+            if line.startswith('%') : # escape mechanism
+                continue
+        if game is None :
+            if not line.strip() :
+                continue
+            game = PgnGame()
+        movetext_lines.append(line)
+        # Comments can contain new lines (and lines looking like headers)
+        comment_start, comment_end = line.rfind('{'), line.rfind('}')
+        if comment_start != comment_end :
+            in_comment = comment_start > comment_end
+    if game is not None :
+        game.parse_movetext("".join(movetext_lines))
+        yield game
+
+class PgnImporter() :
+    """
+    Add the moves of PGN games (variations included) to a MoveLines.
+    The san moves are replayed on a board with Board.move_from_san.
+
+    max_plies: the moves after this number of plies are ignored.
+    min_occurrences: a move is kept only if at least this number of games 
+    contain it (with the same moves before). With the default value 1, the moves 
+    are added as the games are read, otherwise they are counted first, then the 
+    moves kept are added by the finish method.
+    
+    Games with an illegal move are kept up to this move, games starting 
+    from another position than the initial one (FEN header) are skipped.
+    """
+
+    def __init__(self, move_lines: MoveLines, max_plies: int = None, min_occurrences: int = 1) :
+        self.move_lines = move_lines
+        self.max_plies = max_plies
+        self.min_occurrences = min_occurrences
+        # Moves are counted in a MoveLines tree, the counts are indexed by id of the nodes
+        if min_occurrences > 1 :
+            self.counting_lines = MoveLines("new")
+            self.counts = {}
+        else :
+            self.counting_lines = None
+        self.board = Board(self.counting_lines if self.counting_lines is not None else move_lines)
+        self.game_count = 0
+        self.skipped_game_count = 0
+        self.error_count = 0
+    
+    def import_file(self, pgn_path: str, encoding: str = "utf-8") -> MoveLines :
+        """Import all the games of the PGN file, then call finish and return the move lines."""
+        with open(pgn_path, encoding=encoding, errors="replace") as pgn_file :
+            self.import_games(read_games(pgn_file))
+        return self.finish()
+    
+    def import_games(self, games: Iterator[PgnGame]) :
+        for game in games :
+            self.import_game(game)
+    
+    def import_game(self, game: PgnGame) :
+        """Replay the moves of the game and its variations (depth-first, without recursion)."""
+        if "FEN" in game.headers :
+            self.skipped_game_count += 1
+            return
+        self.game_count += 1
+        board = self.board
+        board.set_new_game()
+        counted_nodes = set()
+        # The stack contains the iterators on the children of the nodes of the current line
+        stack = [iter(game.root.children)]
+        while stack :
+            node = next(stack[-1], None)
+            if node is None :
+                stack.pop()
+                if stack :
+                    board.pop_last_move()
+                continue
+            if self.max_plies is not None and len(stack) > self.max_plies :
+                continue
+            try :
+                board.move_from_san(node.san)
+            except NotValidSanMoveException :
+                self.error_count += 1
+                continue
+            if self.counting_lines is not None :
+                node_id = id(self.counting_lines.current_node)
+                if node_id not in counted_nodes :
+                    counted_nodes.add(node_id)
+                    self.counts[node_id] = self.counts.get(node_id, 0) + 1
+            stack.append(iter(node.children))
+    
+    def finish(self) -> MoveLines :
+        """Add the moves counted at least min_occurrences times to the move lines and return them."""
+        if self.counting_lines is not None :
+            board = Board(self.move_lines)
+            # Depth-first traversal of the counting tree, keeping the moves frequent enough
+            stack = [iter(self.counting_lines["move_lines"].items())]
+            while stack :
+                child = next(stack[-1], None)
+                if child is None :
+                    stack.pop()
+                    if stack :
+                        board.pop_last_move()
+                    continue
+                key, subtree = child
+                if self.counts.get(id(subtree), 0) < self.min_occurrences :
+                    continue
+                start_square_number, destination_square_number, promotion = key_to_move(key)
+                board.move_from_numbers(start_square_number, destination_square_number, 
+                                        PieceType(promotion) if promotion is not None else None)
+                stack.append(iter(subtree.items()))
+            self.counting_lines = MoveLines("new")
+            self.counts = {}
+            self.board.move_lines = self.counting_lines
+        self.move_lines.go_to_root()
+        return self.move_lines
+
+def import_pgn(pgn_path: str, move_lines: MoveLines = None, max_plies: int = None, 
+               min_occurrences: int = 1) -> MoveLines :
+    """Import the games of a PGN file in the move lines given (new ones if None) and return them."""
+    if move_lines is None :
+        move_lines = MoveLines("new")
+    return PgnImporter(move_lines, max_plies, min_occurrences).import_file(pgn_path)
@@ -0,0 +1,292 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Reader and writer of PolyGlot opening books (.bin files).
+cf. http://hgm.nubati.net/book_format.html
+
+A book is a list of 16 bytes entries sorted by key (big-endian):
+    key (uint64, Zobrist hash of the position, cf. Board.zobrist_hash), 
+    move (uint16), weight (uint16), learn (uint32)
+The book is read with mmap and the entries of a position are found 
+by binary search, so big books are never loaded in memory.
+"""
+
+from collections import namedtuple
+from random import Random
+from typing import Iterable, List
+import mmap
+import struct
+
+from chessopy import Board, IllegalMoveException, MoveLines, PieceType, STARTING_FEN, move_key, write_file_atomically
+from chessopy.validation import BadEdge, parse_key, play_key
+
+ENTRY_STRUCT = struct.Struct(">QHHI")
+KEY_STRUCT = struct.Struct(">Q")
+
+PolyglotEntry = namedtuple("PolyglotEntry", ["key", "raw_move", "weight", "learn"])
+
+class NotValidPolyglotBookException(Exception) :
+    pass
+
+def decode_polyglot_move(raw_move: int, board: Board) -> tuple :
+    """
+    Return the move tuple (start_square_number, destination_square_number, promotion) 
+    of a PolyGlot move in the position of the board given (promotion is a PieceType value or None).
+    PolyGlot castling moves are king takes rook (e1h1), they are converted to king moves of two squares.
+    """
+    destination_square_number = raw_move & 63
+    start_square_number = (raw_move >> 6) & 63
+    promotion = (raw_move >> 12) & 7 or None
+    if start_square_number in (4, 60) and board.get_piece_type_at(start_square_number) is PieceType.KING :
+        if destination_square_number == start_square_number + 3 :
+            destination_square_number = start_square_number + 2
+        elif destination_square_number == start_square_number - 4 :
+            destination_square_number = start_square_number - 2
+    return (start_square_number, destination_square_number, promotion)
+
+def encode_polyglot_move(start_square_number: int, destination_square_number: int, promotion: int, 
+                         board: Board) -> int :
+    """Return the PolyGlot move of the move given, in the position of the board given 
+    (the move must not have been played). Pawn moves to the last rank without promotion are queen promotions."""
+    piece_type = board.get_piece_type_at(start_square_number)
+    if piece_type is PieceType.KING and start_square_number in (4, 60) \
+            and abs(destination_square_number - start_square_number) == 2 :
+        if destination_square_number > start_square_number :
+            destination_square_number = start_square_number + 3
+        else :
+            destination_square_number = start_square_number - 4
+    if piece_type is PieceType.PAWN and destination_square_number >> 3 in (0, 7) and promotion is None :
+        promotion = PieceType.QUEEN.value
+    return destination_square_number | start_square_number << 6 | (promotion or 0) << 12
+
+def write_book(entries: Iterable[PolyglotEntry], book_path: str) :
+    """Write the entries given in a PolyGlot book, sorted by key (then by decreasing weight). 
+    The book is written in a temporary file then renamed (cf. write_file_atomically)."""
+    sorted_entries = sorted(entries, key=lambda entry: (entry.key, -entry.weight, entry.raw_move))
+    write_file_atomically(book_path, b"".join(ENTRY_STRUCT.pack(*entry) for entry in sorted_entries), 'wb')
+
+def choose_weighted_entry(entries: List[PolyglotEntry], random_generator=None) -> PolyglotEntry :
+    """Return an entry chosen at random with a probability proportional to its weight 
+    (uniform if all the weights are 0). Return None if there is no entry."""
+    if not entries :
+        return None
+    random_generator = random_generator or Random()
+    total_weight = sum(entry.weight for entry in entries)
+    if total_weight == 0 :
+        return entries[random_generator.randrange(len(entries))]
+    choice = random_generator.randrange(total_weight)
+    for entry in entries :
+        choice -= entry.weight
+        if choice < 0 :
+            return entry
+
+class PolyglotBook() :
+    """Read-only access to a PolyGlot book through mmap."""
+
+    def __init__(self, book_path: str) :
+        self.book_path = book_path
+        self.book_file = open(book_path, 'rb')
+        try :
+            self.buffer = mmap.mmap(self.book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError : # empty file
+            self.buffer = b""
+        if len(self.buffer) % ENTRY_STRUCT.size :
+            self.close()
+            raise NotValidPolyglotBookException()
+        self.entry_count = len(self.buffer) // ENTRY_STRUCT.size
+    
+    def __enter__(self) :
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) :
+        self.close()
+    
+    def __len__(self) :
+        return self.entry_count
+    
+    def close(self) :
+        if isinstance(self.buffer, mmap.mmap) :
+            self.buffer.close()
+        self.book_file.close()
+    
+    def get_entry(self, index: int) -> PolyglotEntry :
+        return PolyglotEntry(*ENTRY_STRUCT.unpack_from(self.buffer, index*ENTRY_STRUCT.size))
+    
+    def _find_first_index(self, key: int) -> int :
+        """Return the index of the first entry whose key is not lower than the key given (binary search)."""
+        low, high = 0, self.entry_count
+        unpack_from = KEY_STRUCT.unpack_from
+        while low < high :
+            middle = (low + high) // 2
+            if unpack_from(self.buffer, middle*ENTRY_STRUCT.size)[0] < key :
+                low = middle + 1
+            else :
+                high = middle
+        return low
+    
+    def get_entries(self, key: int) -> List[PolyglotEntry] :
+        """Return the entries of the position of the given key."""
+        res = []
+        index = self._find_first_index(key)
+        while index < self.entry_count :
+            entry = self.get_entry(index)
+            if entry.key != key :
+                break
+            res.append(entry)
+            index += 1
+        return res
+    
+    def get_moves(self, board: Board) -> List[tuple] :
+        """Return the list of the tuples (move tuple, weight) of the position of the board."""
+        return [(decode_polyglot_move(entry.raw_move, board), entry.weight) 
+                for entry in self.get_entries(board.get_zobrist_hash())]
+    
+    def choose_move(self, board: Board, random_generator=None) -> tuple :
+        """Return a move tuple of the position of the board chosen at random with the weights, 
+        or None if the position is not in the book."""
+        entry = choose_weighted_entry(self.get_entries(board.get_zobrist_hash()), random_generator)
+        if entry is None :
+            return None
+        return decode_polyglot_move(entry.raw_move, board)
+
+class PolyglotMoveLines(MoveLines) :
+    """
+    MoveLines backed by a PolyGlot book, which can replace MoveLines for the training.
+    The moves followed are replayed on an internal board, the current node contains 
+    the moves of the book for the position reached: {move key: weight}.
+    The book is read-only: moves out of the book lead to positions without moves 
+    (unless the position transposes back into the book).
+    """
+
+    def __init__(self, book_path: str, random_generator=None) :
+        #
+        dict.__init__(self)
+        self.lines_name = book_path
+        self.book = PolyglotBook(book_path)
+        self.random_generator = random_generator or Random()
+        self.board = Board(MoveLines("new"))
+        self.undo_stack = []
+        #
+        self.go_to_root()
+    
+    def load_from_database(self, book_path: str) :
+        self.book.close()
+        self.book = PolyglotBook(book_path)
+        self.lines_name = book_path
+        self.go_to_root()
+    
+    def save_new_database(self, database_name=None) :
+        """Nothing is saved, PolyGlot books are read-only."""
+        pass
+    
+    def add_curent_lines_to_database(self) :
+        pass
+    
+    def close(self) :
+        self.book.close()
+    
+    def _load_current_node(self) :
+        self.current_node = {}
+        for move, weight in self.book.get_moves(self.board) :
+            key = move_key(*move)
+            self.current_node[key] = self.current_node.get(key, 0) + weight
+    
+    def go_to_root(self) :
+        # The root is the initial position, unless a root FEN is set (cf. MoveLines.set_root_fen)
+        self.board.set_fen(self.root_fen or STARTING_FEN)
+        self.current_line = []
+        self.undo_stack = []
+        self._load_current_node()
+    
+    def go_to_child(self, key, position_hash: int = None) :
+        """Play the move of the given key on the internal board, 
+        the current node is loaded from the book. 
+        IllegalMoveException is raised if the move is not legal, the current node is unchanged."""
+        undo, reason = play_key(self.board, key)
+        if undo is None :
+            raise IllegalMoveException(reason)
+        self.undo_stack.append(undo)
+        self.current_line.append(key)
+        self._load_current_node()
+    
+    def go_to_parent(self) :
+        if self.current_line != [] :
+            self.current_line.pop()
+            self.board._unmake_move(self.undo_stack.pop())
+            self._load_current_node()
+        else :
+            print("MoveRecord: Warning: already at the top node.")
+    
+    def add_move(self, move, position_hash: int = None) :
+        self.go_to_child(move.get_key())
+    
+    def choose_random_child(self) -> int :
+        """Return the key of a move of the current node chosen at random with the weights of the book."""
+        if not self.current_node :
+            return None
+        keys = list(self.current_node)
+        weights = list(self.current_node.values())
+        # Uniform if all the weights are 0, like choose_weighted_entry
+        if not any(weights) :
+            return self.random_generator.choice(keys)
+        return self.random_generator.choices(keys, weights)[0]
+
+def export_move_lines(move_lines: MoveLines, book_path: str, weight: int = 1) -> List[BadEdge] :
+    """
+    Write the moves of the move lines given (any MoveLines class) in a PolyGlot book, 
+    from the root position of the move lines (cf. MoveLines.set_root_fen).
+    Each move of each position gets the given weight. Positions reached by transposition 
+    are exported only once. The moves which are not valid or not legal (cf. validation.play_key) 
+    are skipped with the moves after them, and returned as a list of BadEdge.
+    """
+    board = Board(MoveLines("new"))
+    board.set_fen(move_lines.root_fen or STARTING_FEN)
+    entries = {}
+    bad_edges = []
+    move_lines.go_to_root()
+    expanded_positions = {board.get_zobrist_hash()}
+    # Depth-first traversal without recursion
+    stack = [iter(list(move_lines.current_node))]
+    undo_stack = []
+    while stack :
+        key = next(stack[-1], None)
+        if key is None :
+            stack.pop()
+            if stack :
+                move_lines.go_to_parent()
+                board._unmake_move(undo_stack.pop())
+            continue
+        undo, reason = play_key(board, key)
+        if undo is None :
+            bad_edges.append(BadEdge(tuple(move_lines.current_line) + (key,), reason))
+            continue
+        # The PolyGlot move is encoded in the position before the move
+        board._unmake_move(undo)
+        move = parse_key(key)
+        raw_move = encode_polyglot_move(*move, board)
+        entries[(board.get_zobrist_hash(), raw_move)] = PolyglotEntry(board.get_zobrist_hash(), raw_move, weight, 0)
+        move_lines.go_to_child(key)
+        undo_stack.append(board._make_move(*move))
+        if board.get_zobrist_hash() in expanded_positions :
+            move_lines.go_to_parent()
+            board._unmake_move(undo_stack.pop())
+            continue
+        expanded_positions.add(board.get_zobrist_hash())
+        stack.append(iter(list(move_lines.current_node)))
+    move_lines.go_to_root()
+    write_book(entries.values(), book_path)
+    return bad_edges
@@ -0,0 +1,238 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Spaced repetition (SM-2) scheduler over the moves of move lines.
+
+Each move of the user in the move lines is a card, identified by its line
+(tuple of the keys from the root, the move included). A card is reviewed
+each time the move has to be found in training: the card interval grows when
+the move is found, and the card is due again a few minutes later when it is not.
+cf. https://www.supermemo.com/en/archives1990-2015/english/ol/sm2
+
+The cards are indexed in a heap ordered by (due date, error rate), so that
+the most urgent line is found in O(log n). The computer replies follow this line,
+and then the replies leading to the most urgent moves.
+"""
+
+from random import Random
+import heapq
+import json
+import math
+import time
+
+from chessopy import MoveLines, PieceColor, key_from_json, key_to_string
+
+DAY = 86400 # seconds
+
+class ReviewState() :
+    """SM-2 state of a card."""
+
+    INITIAL_EASE = 2.5
+    MINIMUM_EASE = 1.3
+    LAPSE_DELAY = 600 # seconds before a failed card is due again
+
+    def __init__(self, due: float = 0, ease: float = INITIAL_EASE, interval: float = 0,
+                 repetition_count: int = 0, review_count: int = 0, lapse_count: int = 0) :
+        self.due = due
+        self.ease = ease
+        self.interval = interval # days
+        self.repetition_count = repetition_count # successful reviews in a row
+        self.review_count = review_count
+        self.lapse_count = lapse_count
+
+    def get_error_rate(self) -> float :
+        if self.review_count == 0 :
+            return 0
+        return self.lapse_count / self.review_count
+
+    def review(self, quality: int, now: float) :
+        """Update the state after a review of the given quality (0 to 5, 3 or more is a success)."""
+        self.review_count += 1
+        if quality >= 3 :
+            if self.repetition_count == 0 :
+                self.interval = 1
+            elif self.repetition_count == 1 :
+                self.interval = 6
+            else :
+                self.interval *= self.ease
+            self.repetition_count += 1
+            self.due = now + self.interval * DAY
+        else :
+            self.lapse_count += 1
+            self.repetition_count = 0
+            self.interval = 0
+            self.due = now + ReviewState.LAPSE_DELAY
+        self.ease = max(ReviewState.MINIMUM_EASE, self.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+    def to_list(self) -> list :
+        return [self.due, self.ease, self.interval, self.repetition_count, self.review_count, self.lapse_count]
+
+class RepetitionScheduler() :
+    """
+    Review states of the moves of the user, and choice of the computer replies.
+    user_color is the color played by the user: only the moves of this color are cards.
+    """
+
+    SUCCESS_QUALITY = 4
+    FAILURE_QUALITY = 1
+
+    def __init__(self, user_color: PieceColor = PieceColor.WHITE, clock=time.time, random_generator=None) :
+        self.user_color = user_color
+        self.clock = clock
+        self.random_generator = random_generator or Random()
+        # Review state of each card (line of the move)
+        self.states = {}
+        # Cards of the user moves following each line of a computer reply
+        self.cards_after_reply = {}
+        # Heap of (due, -error rate, tie breaker, line), the entries of the cards
+        # updated after their push are skipped (lazy deletion)
+        self.heap = []
+        self.target_line = None
+        # Color of the first move of the lines (cf. MoveLines.root_fen)
+        self.first_color = PieceColor.WHITE
+
+    def __len__(self) :
+        return len(self.states)
+
+    def is_user_move(self, line: tuple) -> bool :
+        """Return True if the last move of the line is a move of the user."""
+        return (len(line) - 1) % 2 == (0 if self.user_color == self.first_color else 1)
+
+    def add_card(self, line: tuple, state: ReviewState = None) :
+        """Add the card of the user move line given (due now if no state is given)."""
+        line = tuple(line)
+        if line in self.states :
+            return
+        self.states[line] = state or ReviewState()
+        if len(line) > 1 :
+            self.cards_after_reply.setdefault(line[:-1], []).append(line)
+        self._push(line)
+
+    def index_move_lines(self, move_lines: MoveLines, max_plies: int = None) :
+        """Add the cards of all the user moves of the move lines (any MoveLines class).
+        The current node of the move lines is reset to the root."""
+        if move_lines.root_fen is not None :
+            self.first_color = PieceColor.WHITE if move_lines.root_fen.split()[1] == 'w' else PieceColor.BLACK
+        move_lines.go_to_root()
+        # Depth-first traversal without recursion
+        stack = [iter(list(move_lines.current_node))]
+        while stack :
+            key = next(stack[-1], None)
+            if key is None :
+                stack.pop()
+                if stack :
+                    move_lines.go_to_parent()
+                continue
+            move_lines.go_to_child(key)
+            line = tuple(move_lines.current_line)
+            if self.is_user_move(line) :
+                self.add_card(line)
+            if max_plies is not None and len(line) >= max_plies :
+                move_lines.go_to_parent()
+                continue
+            stack.append(iter(list(move_lines.current_node)))
+        move_lines.go_to_root()
+
+    def _push(self, line: tuple) :
+        state = self.states[line]
+        heapq.heappush(self.heap, (state.due, -state.get_error_rate(), self.random_generator.random(), line))
+        # Rebuild the heap when there are too many outdated entries
+        if len(self.heap) > 2*len(self.states) + 64 :
+            self.heap = [(state.due, -state.get_error_rate(), self.random_generator.random(), line)
+                         for line, state in self.states.items()]
+            heapq.heapify(self.heap)
+
+    def _is_up_to_date(self, entry: tuple) -> bool :
+        state = self.states[entry[3]]
+        return entry[0] == state.due and entry[1] == -state.get_error_rate()
+
+    def get_next_line(self) -> tuple :
+        """Return the line of the most urgent card (earliest due date, then highest error rate),
+        or None if there is no card."""
+        heap = self.heap
+        while heap and not self._is_up_to_date(heap[0]) :
+            heapq.heappop(heap)
+        if not heap :
+            return None
+        return heap[0][3]
+
+    def get_due_count(self, now: float = None) -> int :
+        now = self.clock() if now is None else now
+        return sum(1 for state in self.states.values() if state.due <= now)
+
+    def review(self, line: tuple, success: bool) :
+        """Record a review of the card of the line given (the card is added if it is new)."""
+        line = tuple(line)
+        self.add_card(line)
+        quality = RepetitionScheduler.SUCCESS_QUALITY if success else RepetitionScheduler.FAILURE_QUALITY
+        self.states[line].review(quality, self.clock())
+        self._push(line)
+
+    def review_mistake(self, move_lines: MoveLines) :
+        """Record a failure for the moves of the current node of the move lines
+        (the user played a move which is not in the lines)."""
+        current_line = tuple(move_lines.current_line)
+        for key in list(move_lines.current_node) :
+            self.review(current_line + (key,), False)
+
+    def _get_reply_priority(self, reply_line: tuple) -> tuple :
+        """Return the priority of the most urgent user move after the computer reply given."""
+        cards = self.cards_after_reply.get(reply_line)
+        if cards is None :
+            return (math.inf, 0)
+        return min((self.states[line].due, -self.states[line].get_error_rate()) for line in cards)
+
+    def choose_reply(self, move_lines: MoveLines) -> int :
+        """
+        Return the key of the computer reply in the current node of the move lines
+        (None if the node has no child): the reply follows the line of the most urgent card
+        if it goes through the current node, otherwise the reply leading to the most urgent move is chosen.
+        """
+        keys = list(move_lines.current_node)
+        if not keys :
+            return None
+        current_line = tuple(move_lines.current_line)
+        if not self._is_in_line(current_line, self.target_line) :
+            next_line = self.get_next_line()
+            self.target_line = next_line if self._is_in_line(current_line, next_line) else None
+        if self.target_line is not None and self.target_line[len(current_line)] in move_lines.current_node :
+            return self.target_line[len(current_line)]
+        return min(keys, key=lambda key: self._get_reply_priority(current_line + (key,)))
+
+    @staticmethod
+    def _is_in_line(current_line: tuple, line: tuple) -> bool :
+        """Return True if the line given goes on after the current line."""
+        return line is not None and len(line) > len(current_line) and line[:len(current_line)] == current_line
+
+    def save(self, file_path: str) :
+        saved_dict = {
+            "user_color": self.user_color.name,
+            "first_color": self.first_color.name,
+            "states": {"/".join(key_to_string(key) for key in line): state.to_list() for line, state in self.states.items()}
+        }
+        with open(file_path, 'w') as json_file :
+            json.dump(saved_dict, json_file)
+
+    @classmethod
+    def load(cls, file_path: str, clock=time.time, random_generator=None) -> "RepetitionScheduler" :
+        with open(file_path) as json_file :
+            loaded_dict = json.load(json_file)
+        scheduler = cls(PieceColor[loaded_dict["user_color"]], clock, random_generator)
+        scheduler.first_color = PieceColor[loaded_dict.get("first_color", "WHITE")]
+        for line, values in loaded_dict["states"].items() :
+            scheduler.add_card(tuple(key_from_json(key) for key in line.split("/")), ReviewState(*values))
+        return scheduler
@@ -0,0 +1,182 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Sounds of the moves, played without blocking the caller.
+
+The clips are loaded once when the player is created, then SoundPlayer.play
+only puts the name of the clip in a queue: a background thread plays them.
+The standard library has no mp3 decoder, so the backends use what the system provides:
+    - WindowsMciBackend: the Windows multimedia API (winmm, through ctypes),
+    the clips are opened once and played from the start each time,
+    - CommandBackend: a command line player (ffplay, mpg123 or afplay),
+    the clip is read once and written to the standard input of the player,
+    - SilentBackend: no sound (headless use, tests...), the clips played are only counted.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, List
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+
+import chessopy
+
+# Clips of the moves: name -> path from FOLDER_PATH
+SOUND_FILES = {
+    "move": "sounds/Move.mp3",
+    "capture": "sounds/Capture.mp3",
+}
+
+class SoundBackend(ABC) :
+    """Base class of the backends, which are only used by the thread of the player."""
+
+    @abstractmethod
+    def load(self, name: str, file_path: str) :
+        """Load the sound file given, played later with the name given."""
+
+    @abstractmethod
+    def play(self, name: str) :
+        """Play the sound of the name given (cf. load), without waiting for its end."""
+
+    def close(self) :
+        pass
+
+class SilentBackend(SoundBackend) :
+
+    def __init__(self) :
+        self.played_names = []
+
+    def load(self, name: str, file_path: str) :
+        pass
+
+    def play(self, name: str) :
+        self.played_names.append(name)
+
+class WindowsMciBackend(SoundBackend) :
+
+    def __init__(self) :
+        import ctypes
+        self.send_string = ctypes.windll.winmm.mciSendStringW
+        self.names = []
+
+    def load(self, name: str, file_path: str) :
+        self.send_string(f'open "{file_path}" type mpegvideo alias chessopy_{name}', None, 0, None)
+        self.names.append(name)
+
+    def play(self, name: str) :
+        self.send_string(f"play chessopy_{name} from 0", None, 0, None)
+
+    def close(self) :
+        for name in self.names :
+            self.send_string(f"close chessopy_{name}", None, 0, None)
+
+class CommandBackend(SoundBackend) :
+
+    # Players which read the clip on their standard input, or from the file (None)
+    COMMANDS = [
+        ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-"],
+        ["mpg123", "-q", "-"],
+        ["afplay", None],
+    ]
+
+    def __init__(self, command: List[str]) :
+        self.command = command
+        self.clips = {}
+        self.file_paths = {}
+
+    @classmethod
+    def find_command(cls) -> List[str] :
+        """Return the first player command available on the system, or None."""
+        for command in cls.COMMANDS :
+            if shutil.which(command[0]) is not None :
+                return command
+        return None
+
+    def load(self, name: str, file_path: str) :
+        with open(file_path, 'rb') as clip_file :
+            self.clips[name] = clip_file.read()
+        self.file_paths[name] = file_path
+
+    def play(self, name: str) :
+        if self.command[-1] is None :
+            subprocess.Popen(self.command[:-1] + [self.file_paths[name]],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return
+        process = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # The player reads the clip while the next sounds are queued
+        threading.Thread(target=process.communicate, args=(self.clips[name],), daemon=True).start()
+
+def get_default_backend() -> SoundBackend :
+    """Return the backend available on the system (SilentBackend if there is none)."""
+    if sys.platform == "win32" :
+        return WindowsMciBackend()
+    command = CommandBackend.find_command()
+    if command is not None :
+        return CommandBackend(command)
+    return SilentBackend()
+
+class SoundPlayer() :
+    """Play the clips of SOUND_FILES on a background thread."""
+
+    def __init__(self, backend: SoundBackend = None, sound_files: Dict[str, str] = None) :
+        self.backend = backend or get_default_backend()
+        self.sound_files = sound_files or SOUND_FILES
+        self.queue = queue.Queue(maxsize=8)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        # Loaded by the thread, the caller doesn't wait for the files
+        for name, file_path in self.sound_files.items() :
+            self.queue.put(("load", name, os.path.join(chessopy.FOLDER_PATH, file_path)))
+
+    def run(self) :
+        while True :
+            action, name, file_path = self.queue.get()
+            try :
+                if action == "load" :
+                    self.backend.load(name, file_path)
+                elif action == "play" :
+                    self.backend.play(name)
+                else :
+                    self.backend.close()
+                    return
+            except Exception as exception : # a sound is never worth a crash
+                print(f"Sound {name}: {exception}")
+            finally :
+                self.queue.task_done()
+
+    def play(self, name: str) :
+        """Ask for the clip given to be played, without waiting.
+        The sound is dropped if too many sounds are already waiting."""
+        try :
+            self.queue.put_nowait(("play", name, None))
+        except queue.Full :
+            pass
+
+    def play_move_sound(self, move) :
+        """Play the sound of the move given (chessopy.Move) once it is played."""
+        self.play("capture" if move.piece_taken_index is not None or move.en_passant else "move")
+
+    def wait(self) :
+        """Wait until the queued sounds have been sent to the backend."""
+        self.queue.join()
+
+    def close(self) :
+        self.queue.put(("close", None, None))
@@ -0,0 +1,178 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Training logic, without graphical interface (no tkinter import).
+
+The user plays moves, which are accepted only if they are in the move lines, 
+and the computer replies with a move of the move lines chosen at random.
+With an engine (cf. chessopy.engine), the game goes on once the line is finished: 
+the engine replies and the user plays freely, these moves are not added to the move lines.
+BoardGui drives a TrainingSession, but it can also be used alone, for instance:
+
+    session = TrainingSession(Board(MoveLines("french")))
+    session.start()
+    result = session.play_move(12, 28) # 1.e4
+    if result.accepted and result.reply is not None :
+        start_square_number, destination_square_number, promotion = result.reply
+"""
+
+from collections import namedtuple
+from functools import partial
+import threading
+
+from chessopy import Board, MoveLines, PieceType, key_to_move, move_key
+
+TrainingMoveResult = namedtuple("TrainingMoveResult", ["accepted", "reply", "line_finished"])
+# accepted: the move of the user is in the lines
+# reply: tuple (start_square_number, destination_square_number, promotion) of the computer move, or None
+# line_finished: there is no more move on the current line (or the position is out of the lines)
+
+class TrainingSession() :
+    """A training on the move lines of a board."""
+
+    def __init__(self, board: Board = None, scheduler=None, engine=None, engine_time_budget: float = 1.0) :
+        if board is None :
+            board = Board()
+        self.board = board
+        # Spaced repetition scheduler (cf. chessopy.scheduler), the replies are random if None
+        self.scheduler = scheduler
+        # Engine of the replies once the line is finished (cf. chessopy.engine.Engine), 
+        # searching engine_time_budget seconds; there is no reply if None
+        self.engine = engine
+        self.engine_time_budget = engine_time_budget
+        self.is_started = False
+        self.move_count = 0
+        self.mistake_count = 0
+    
+    @property
+    def move_lines(self) -> MoveLines :
+        return self.board.move_lines
+    
+    def start(self) :
+        """Start a new training from the root position of the move lines."""
+        self.board.set_new_game()
+        self.is_started = True
+        self.move_count = 0
+        self.mistake_count = 0
+    
+    def stop(self) :
+        self.is_started = False
+    
+    def is_line_finished(self) -> bool :
+        return bool(self.board.unrecorded_move_count) or not self.move_lines.current_node
+    
+    def check_move(self, start_square_number: int, destination_square_number: int, 
+                   promotion: PieceType = None) -> bool :
+        """Return True if the move given is in the current node of the move lines
+        (a promotion is a queen promotion if promotion is None)."""
+        return _get_key(start_square_number, destination_square_number, promotion) in self.move_lines.current_node
+    
+    def play_user_move(self, start_square_number: int, destination_square_number: int, 
+                       promotion: PieceType = None) -> bool :
+        """Make the move of the user on the board if it is in the lines.
+        Return False (and count a mistake) if it is not.
+        Once the line is finished, with an engine, any legal move is made (out of the lines)."""
+        if self.engine is not None and self.is_line_finished() :
+            return self._play_free_move(start_square_number, destination_square_number, promotion)
+        if not self.check_move(start_square_number, destination_square_number, promotion) :
+            self.mistake_count += 1
+            if self.scheduler is not None :
+                self.scheduler.review_mistake(self.move_lines)
+            return False
+        if self.scheduler is not None :
+            line = tuple(self.move_lines.current_line) + (_get_key(start_square_number, destination_square_number, promotion),)
+            if self.scheduler.is_user_move(line) :
+                self.scheduler.review(line, True)
+        self.board.move_from_numbers(start_square_number, destination_square_number, promotion)
+        self.move_count += 1
+        return True
+    
+    def _play_free_move(self, start_square_number: int, destination_square_number: int, 
+                        promotion: PieceType = None) -> bool :
+        """Make the move given out of the lines if it is legal, return False otherwise."""
+        promotion_value = promotion.value if promotion is not None else None
+        if self.board.get_piece_at(start_square_number) is None \
+                or not self.board.is_legal(self.board._create_move((start_square_number, destination_square_number, promotion_value))) :
+            return False
+        self.board.move_from_numbers(start_square_number, destination_square_number, promotion, record=False)
+        self.move_count += 1
+        return True
+    
+    def choose_reply(self) -> tuple :
+        """Return the move tuple (start_square_number, destination_square_number, promotion) 
+        of a move of the current node chosen at random (or by the scheduler), 
+        or once the line is finished the move of the engine (None without engine, or without legal move).
+        promotion is a PieceType, None for a queen promotion."""
+        return self.prepare_reply()()
+    
+    def prepare_reply(self, stop_event: threading.Event = None) :
+        """
+        Return a function without argument which returns the reply (cf. choose_reply).
+        The move of the lines is chosen now, the search of the engine is done when the function 
+        is called, on a copy of the position taken now: the function does not read the board 
+        or the move lines. BoardGui calls it on a worker thread, the search can be long: 
+        it ends early when stop_event is set (cf. Engine.search)."""
+        key = None
+        if not self.board.unrecorded_move_count :
+            if self.scheduler is not None :
+                key = self.scheduler.choose_reply(self.move_lines)
+            else :
+                key = self.move_lines.choose_random_child()
+        if key is not None :
+            reply = _get_reply(key_to_move(key))
+            return lambda: reply
+        if self.engine is None :
+            return lambda: None
+        return partial(self._search_reply, self.board.get_position_state(), stop_event)
+    
+    def _search_reply(self, position_state: tuple, stop_event: threading.Event) -> tuple :
+        return _get_reply(self.engine.search_position(position_state, self.engine_time_budget, stop_event=stop_event).move)
+    
+    def make_reply(self, reply: tuple) :
+        """Make the reply given (cf. choose_reply) on the board. 
+        A reply of the engine is not added to the move lines."""
+        self.board.move_from_numbers(*reply, record=not self.is_line_finished())
+    
+    def play_reply(self) -> tuple :
+        """Make a move of the computer on the board and return it (None if there is no reply)."""
+        reply = self.choose_reply()
+        if reply is not None :
+            self.make_reply(reply)
+        return reply
+    
+    def play_move(self, start_square_number: int, destination_square_number: int, 
+                  promotion: PieceType = None) -> TrainingMoveResult :
+        """Play the move of the user, then the reply of the computer if the move is in the lines."""
+        if not self.play_user_move(start_square_number, destination_square_number, promotion) :
+            return TrainingMoveResult(False, None, self.is_line_finished())
+        reply = self.play_reply()
+        return TrainingMoveResult(True, reply, self.is_line_finished())
+    
+    def undo(self) :
+        """Undo the last move (of the user or of the computer)."""
+        if self.board.move_played :
+            self.board.pop_last_move()
+
+def _get_reply(move: tuple) -> tuple :
+    """Return the reply of the move tuple given, with a PieceType promotion (None if move is None)."""
+    if move is None :
+        return None
+    start_square_number, destination_square_number, promotion = move
+    return (start_square_number, destination_square_number, PieceType(promotion) if promotion is not None else None)
+
+def _get_key(start_square_number: int, destination_square_number: int, promotion: PieceType = None) -> int :
+    return move_key(start_square_number, destination_square_number, promotion.value if promotion is not None else None)
@@ -0,0 +1,329 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Annotation of move lines with the evaluations of a UCI engine (Stockfish...),
+to find the dubious moves of a repertoire.
+
+A pool of engine processes analyses the positions concurrently (asyncio subprocesses):
+every node of the tree is replayed on a board, and each position is analysed once,
+the results being cached by Zobrist hash (the lines which transpose share their analysis).
+Usage: python -m chessopy.uci <lines_name> white|black <engine command> [process_count] [depth]
+"""
+
+from collections import namedtuple
+from typing import Dict, List
+import asyncio
+import os
+import shlex
+import sys
+
+from chessopy import Board, MoveLines, PieceColor, SQUARE_NAMES, PROMOTION_VALUES, move_key, key_to_string
+from chessopy.engine import MATE_SCORE
+from chessopy.validation import play_key
+
+Evaluation = namedtuple("Evaluation", ["score", "mate", "best_move", "depth", "turn"])
+# score: centipawns for White (+/- MATE_SCORE if a side is checkmated), or None if a mate is found
+# mate: number of moves of the mate found (> 0 if White mates, < 0 if Black mates), or None
+# best_move: key of the best move (cf. chessopy.move_key), None if there is no legal move
+# depth: depth of the analysis
+# turn: PieceColor of the side to move in the position
+
+class UciException(Exception) :
+    pass
+
+def uci_to_key(uci_move: str) -> int :
+    """Return the key of a move in UCI notation ("e2e4", "e7e8n"), or None for the null move "0000"."""
+    if uci_move in ("0000", "(none)") :
+        return None
+    promotion = None
+    if len(uci_move) == 5 and uci_move[4] != 'q' :
+        promotion = PROMOTION_VALUES[uci_move[4]]
+    return move_key(SQUARE_NAMES.index(uci_move[:2]), SQUARE_NAMES.index(uci_move[2:4]), promotion)
+
+def get_white_score(evaluation: Evaluation) -> int :
+    """Return the score of the evaluation for White in centipawns, the mates being
+    +/- (MATE_SCORE - number of moves)."""
+    if evaluation.mate is None :
+        return evaluation.score
+    if evaluation.mate > 0 :
+        return MATE_SCORE - evaluation.mate
+    return -MATE_SCORE - evaluation.mate
+
+class UciEngine() :
+    """A UCI engine process, driven with asyncio (cf. analyse).
+    The options given ({name: value}, "Hash" for instance) are set when it starts."""
+
+    def __init__(self, command: List[str], options: Dict[str, str] = None) :
+        self.command = command
+        self.options = options or {}
+        self.process = None
+        self.name = None
+        self.analysed_count = 0
+
+    async def start(self) :
+        self.process = await asyncio.create_subprocess_exec(*self.command, stdin=asyncio.subprocess.PIPE,
+                                                            stdout=asyncio.subprocess.PIPE)
+        self._send("uci")
+        for line in await self._read_until("uciok") :
+            if line.startswith("id name ") :
+                self.name = line[len("id name "):]
+        for name, value in self.options.items() :
+            self._send(f"setoption name {name} value {value}")
+        await self.wait_ready()
+
+    def _send(self, line: str) :
+        self.process.stdin.write((line + "\n").encode())
+
+    async def _read_until(self, last_word: str) -> List[str] :
+        """Return the lines written by the engine, until the one which starts with last_word."""
+        await self.process.stdin.drain()
+        res = []
+        while True :
+            line = await self.process.stdout.readline()
+            if not line :
+                raise UciException(f"{self.command[0]} stopped")
+            line = line.decode().strip()
+            res.append(line)
+            if line.split(" ", 1)[0] == last_word :
+                return res
+
+    async def wait_ready(self) :
+        self._send("isready")
+        await self._read_until("readyok")
+
+    async def analyse(self, fen: str, depth: int = None, movetime: int = None) -> Evaluation :
+        """Return the evaluation of the position of the FEN given, searched to the depth given,
+        or during movetime milliseconds."""
+        self._send(f"position fen {fen}")
+        if movetime is not None :
+            self._send(f"go movetime {movetime}")
+        else :
+            self._send(f"go depth {depth or 10}")
+        lines = await self._read_until("bestmove")
+        self.analysed_count += 1
+        score, mate, analysis_depth = 0, None, 0
+        # The score of the last info line with a score
+        for line in lines :
+            words = line.split()
+            if not words or words[0] != "info" or "score" not in words :
+                continue
+            score_index = words.index("score")
+            if words[score_index + 1] == "cp" :
+                score, mate = int(words[score_index + 2]), None
+            elif words[score_index + 1] == "mate" :
+                score, mate = None, int(words[score_index + 2])
+                if not mate : # the side to move is checkmated
+                    score, mate = -MATE_SCORE, None
+            if "depth" in words :
+                analysis_depth = int(words[words.index("depth") + 1])
+        # The scores are given for the side to move
+        turn = PieceColor.WHITE if fen.split()[1] == 'w' else PieceColor.BLACK
+        if turn is PieceColor.BLACK :
+            score = None if score is None else -score
+            mate = None if mate is None else -mate
+        best_move = uci_to_key(lines[-1].split()[1]) if len(lines[-1].split()) > 1 else None
+        return Evaluation(score, mate, best_move, analysis_depth, turn)
+
+    async def quit(self) :
+        if self.process is None or self.process.returncode is not None :
+            return
+        try :
+            self._send("quit")
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) :
+            pass
+        try :
+            await asyncio.wait_for(self.process.wait(), 1)
+        except asyncio.TimeoutError :
+            self.process.kill()
+            await self.process.wait()
+
+class UciEnginePool() :
+    """
+    Pool of process_count engine processes (os.cpu_count() by default), each analysing
+    one position at a time. The evaluations are cached by Zobrist hash: a position
+    asked again, even while it is analysed, is not analysed twice. An engine which fails 
+    is replaced by a new process, and the position is not cached.
+    Use it in an async with block, or call start and close.
+    The options given are set on each engine (cf. UciEngine).
+    """
+
+    def __init__(self, command: List[str], process_count: int = None, depth: int = 10, movetime: int = None, 
+                 options: Dict[str, str] = None) :
+        self.command = command
+        self.options = options
+        self.process_count = process_count or os.cpu_count() or 1
+        self.depth = depth
+        self.movetime = movetime
+        self.engines = []
+        self.idle_engines = None
+        # Zobrist hash -> future of the Evaluation of the position
+        self.cache = {}
+        # To compute the hashes of the FEN given without one
+        self.board = Board(MoveLines("new"))
+
+    async def start(self) :
+        self.engines = [UciEngine(self.command, self.options) for k in range(self.process_count)]
+        await asyncio.gather(*(engine.start() for engine in self.engines))
+        self.idle_engines = asyncio.Queue()
+        for engine in self.engines :
+            self.idle_engines.put_nowait(engine)
+
+    async def close(self) :
+        await asyncio.gather(*(engine.quit() for engine in self.engines))
+
+    async def __aenter__(self) :
+        await self.start()
+        return self
+
+    async def __aexit__(self, exception_type, exception, traceback) :
+        await self.close()
+
+    def get_analysed_count(self) -> int :
+        return sum(engine.analysed_count for engine in self.engines)
+
+    async def analyse(self, fen: str, zobrist_hash: int = None) -> Evaluation :
+        """Return the evaluation of the position of the FEN given (by the first idle engine).
+        zobrist_hash is the hash of the position, computed from the FEN if None."""
+        if zobrist_hash is None :
+            self.board.set_fen(fen)
+            zobrist_hash = self.board.zobrist_hash
+        future = self.cache.get(zobrist_hash)
+        if future is None :
+            future = self.cache[zobrist_hash] = asyncio.ensure_future(self._analyse(fen))
+        try :
+            return await asyncio.shield(future)
+        except Exception :
+            # Not kept in the cache, the position can be asked again
+            if self.cache.get(zobrist_hash) is future :
+                del self.cache[zobrist_hash]
+            raise
+
+    async def _analyse(self, fen: str) -> Evaluation :
+        engine = await self.idle_engines.get()
+        try :
+            return await engine.analyse(fen, self.depth, self.movetime)
+        except Exception :
+            # The engine stopped, or its output is not the one expected
+            engine = await self._restart(engine)
+            raise
+        finally :
+            self.idle_engines.put_nowait(engine)
+
+    async def _restart(self, engine: UciEngine) -> UciEngine :
+        """Stop the engine given, which failed, and return the new engine which replaces it 
+        (the engine given if the new one cannot start: the next analysis will restart it again)."""
+        await engine.quit()
+        new_engine = UciEngine(self.command, self.options)
+        try :
+            await new_engine.start()
+        except (OSError, UciException) :
+            await new_engine.quit()
+            return engine
+        # The analyses of the pool are still counted
+        new_engine.analysed_count = engine.analysed_count
+        self.engines[self.engines.index(engine)] = new_engine
+        return new_engine
+
+def get_positions(move_tree: dict, root_fen: str = None) -> tuple :
+    """
+    Replay the nodes of the nested dict of moves given (like the "move_lines" item of MoveLines)
+    from the position of root_fen (the initial position by default).
+    Return the dict {line (tuple of keys): zobrist hash of its position} of the nodes,
+    and the dict {zobrist hash: FEN} of the positions. The nodes after an illegal move are skipped.
+    """
+    board = Board(MoveLines("new"))
+    if root_fen is not None :
+        board.set_fen(root_fen)
+    node_positions = {(): board.zobrist_hash}
+    fens = {board.zobrist_hash: board.get_fen()}
+    # Depth-first traversal without recursion: the stack contains the line, the iterator
+    # on the children of each node, and the undo of its move (None for the root)
+    stack = [((), iter(move_tree.items()), None)]
+    while stack :
+        line, children, undo = stack[-1]
+        child = next(children, None)
+        if child is None :
+            stack.pop()
+            if undo is not None :
+                board._unmake_move(undo)
+            continue
+        key, subtree = child
+        child_undo = play_key(board, key)[0]
+        if child_undo is None :
+            continue
+        child_line = line + (key,)
+        zobrist_hash = board.zobrist_hash
+        node_positions[child_line] = zobrist_hash
+        if zobrist_hash not in fens :
+            fens[zobrist_hash] = board.get_fen()
+        stack.append((child_line, iter(subtree.items()), child_undo))
+    return node_positions, fens
+
+async def annotate_move_tree(pool: UciEnginePool, move_tree: dict, root_fen: str = None) -> Dict[tuple, Evaluation] :
+    """Return the evaluations of the nodes of the move tree given: {line (tuple of keys): Evaluation}."""
+    node_positions, fens = get_positions(move_tree, root_fen)
+    zobrist_hashes = list(fens)
+    evaluations = await asyncio.gather(*(pool.analyse(fens[zobrist_hash], zobrist_hash) for zobrist_hash in zobrist_hashes))
+    evaluations = dict(zip(zobrist_hashes, evaluations))
+    return {line: evaluations[zobrist_hash] for line, zobrist_hash in node_positions.items()}
+
+def annotate_move_lines(move_lines: MoveLines, command: List[str], process_count: int = None,
+                        depth: int = 10, options: Dict[str, str] = None) -> Dict[tuple, Evaluation] :
+    """
+    Return the evaluations of the nodes of the move lines given (MoveLines, or any class
+    with a to_move_tree method) by a pool of process_count engines of the command given.
+    """
+    if hasattr(move_lines, "to_move_tree") :
+        move_tree = move_lines.to_move_tree()
+    else :
+        move_tree = move_lines["move_lines"]
+    async def annotate() :
+        async with UciEnginePool(command, process_count, depth, options=options) as pool :
+            return await annotate_move_tree(pool, move_tree, move_lines.root_fen)
+    return asyncio.run(annotate())
+
+def get_dubious_moves(evaluations: Dict[tuple, Evaluation], user_color: PieceColor,
+                      threshold: int = 100) -> List[tuple] :
+    """
+    Return the lines ending with a dubious move of the user: the evaluation for the user
+    after the move is lower than the evaluation of the position before the move (with the best move)
+    by more than threshold centipawns. The lines are sorted by loss, the worst first.
+    """
+    sign = 1 if user_color is PieceColor.WHITE else -1
+    res = []
+    for line, evaluation in evaluations.items() :
+        parent_evaluation = evaluations.get(line[:-1]) if line else None
+        if parent_evaluation is None or parent_evaluation.turn is not user_color :
+            continue
+        loss = sign * (get_white_score(parent_evaluation) - get_white_score(evaluation))
+        if loss > threshold :
+            res.append((loss, line))
+    res.sort(key=lambda loss_line: -loss_line[0])
+    return [line for loss, line in res]
+
+if __name__ == "__main__" :
+    lines_name = sys.argv[1]
+    user_color = PieceColor[sys.argv[2].upper()]
+    command = shlex.split(sys.argv[3])
+    process_count = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    depth = int(sys.argv[5]) if len(sys.argv) > 5 else 10
+    evaluations = annotate_move_lines(MoveLines(lines_name), command, process_count, depth)
+    print(f"{len(evaluations)} nodes, {len(set(evaluations.values()))} evaluations")
+    for line in get_dubious_moves(evaluations, user_color) :
+        loss = abs(get_white_score(evaluations[line[:-1]]) - get_white_score(evaluations[line]))
+        print(f"{' '.join(key_to_string(key) for key in line)}: -{loss}")
@@ -0,0 +1,179 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Validation of move lines: every line is replayed on a board, and the edges
+which are not legal moves are reported with their path (keys from the root).
+The moves after a bad edge can't be replayed, they are not checked.
+
+Big trees are split into subtrees, validated in parallel by a pool of processes.
+Usage: python -m chessopy.validation <lines_name> [process_count]
+"""
+
+from collections import namedtuple
+from multiprocessing import Pool
+from typing import List
+import os
+import sys
+
+from chessopy import Board, MoveLines, PieceType, PROMOTION_TYPES, key_from_string, key_to_move, key_to_string
+
+BadEdge = namedtuple("BadEdge", ["path", "reason"])
+
+NOT_A_MOVE_KEY = "not a move key"
+NO_PIECE_ON_START_SQUARE = "no piece on the start square"
+NOT_THE_SIDE_TO_MOVE = "piece of the side not to move"
+ILLEGAL_MOVE = "illegal move"
+
+PAWN_VALUE = PieceType.PAWN.value
+QUEEN_VALUE = PieceType.QUEEN.value
+
+def parse_key(key) -> tuple :
+    """Return the move tuple (start_square_number, destination_square_number, promotion) of the key 
+    (cf. chessopy.move_key), or None if it is not valid. The keys of the json files ("52,44") are accepted."""
+    if isinstance(key, str) :
+        key = key_from_string(key)
+    if not isinstance(key, int) or not 0 <= key < 1 << 15 :
+        return None
+    move = key_to_move(key)
+    if move[2] is not None and (move[2] not in PROMOTION_TYPES or move[2] == QUEEN_VALUE) :
+        return None
+    return move
+
+def play_key(board: Board, key) -> tuple :
+    """Make the move of the key on the board if it is legal and return the tuple (undo, None)
+    (cf. Board._unmake_move), otherwise return (None, reason) and the board is unchanged."""
+    move = parse_key(key)
+    if move is None :
+        return (None, NOT_A_MOVE_KEY)
+    start_square_number, destination_square_number, promotion = move
+    index = board.get_bitboard_index_at(start_square_number)
+    if index is None :
+        return (None, NO_PIECE_ON_START_SQUARE)
+    color_value = index // 6
+    if color_value != board.turn.value :
+        return (None, NOT_THE_SIDE_TO_MOVE)
+    if promotion is None and index % 6 == PAWN_VALUE and destination_square_number >> 3 in (0, 7) :
+        promotion = QUEEN_VALUE
+    move = (start_square_number, destination_square_number, promotion)
+    if not board._is_pseudo_legal_tuple(move) :
+        return (None, ILLEGAL_MOVE)
+    undo = board._make_move(*move)
+    if board._is_king_attacked(color_value) :
+        board._unmake_move(undo)
+        return (None, ILLEGAL_MOVE)
+    return (undo, None)
+
+def validate_move_tree(move_tree: dict, path: tuple = (), root_fen: str = None) -> List[BadEdge] :
+    """
+    Return the bad edges of the nested dict of moves given (like the "move_lines" item of MoveLines),
+    which starts after the moves of the path given (they must be legal) from the position
+    of root_fen (the initial position by default).
+    """
+    path = tuple(path)
+    board = Board(MoveLines("new"))
+    if root_fen is not None :
+        board.set_fen(root_fen)
+    for key in path :
+        board._make_move(*parse_key(key))
+    res = []
+    # Depth-first traversal without recursion: the stack contains the path
+    # and the iterator on the children of each node
+    stack = [(path, iter(move_tree.items()))]
+    undo_stack = []
+    while stack :
+        node_path, children = stack[-1]
+        child = next(children, None)
+        if child is None :
+            stack.pop()
+            if undo_stack :
+                board._unmake_move(undo_stack.pop())
+            continue
+        key, subtree = child
+        undo, reason = play_key(board, key)
+        if undo is None :
+            res.append(BadEdge(node_path + (key,), reason))
+            continue
+        undo_stack.append(undo)
+        stack.append((node_path + (key,), iter(subtree.items())))
+    return res
+
+def _validate_task(task: tuple) -> List[BadEdge] :
+    path, move_tree, root_fen = task
+    return validate_move_tree(move_tree, path, root_fen)
+
+def split_move_tree(move_tree: dict, task_count: int, root_fen: str = None) -> tuple :
+    """
+    Split the tree into at least task_count subtrees (if possible), by going down level by level.
+    Return the list of the tasks (path, subtree) and the bad edges found above the subtrees.
+    """
+    board = Board(MoveLines("new"))
+    if root_fen is not None :
+        board.set_fen(root_fen)
+    tasks = [((), move_tree)]
+    bad_edges = []
+    while len(tasks) < task_count :
+        next_tasks = []
+        for path, subtree in tasks :
+            undo_stack = [board._make_move(*parse_key(key)) for key in path]
+            for key, child in subtree.items() :
+                undo, reason = play_key(board, key)
+                if undo is None :
+                    bad_edges.append(BadEdge(path + (key,), reason))
+                    continue
+                board._unmake_move(undo)
+                if child :
+                    next_tasks.append((path + (key,), child))
+            for undo in reversed(undo_stack) :
+                board._unmake_move(undo)
+        tasks = next_tasks
+        if not tasks :
+            break
+    return tasks, bad_edges
+
+def validate_move_lines(move_lines: MoveLines, process_count: int = None) -> List[BadEdge] :
+    """
+    Return the bad edges of the move lines given (MoveLines, or any class with a to_move_tree method),
+    sorted by path. The tree is split into subtrees validated by a pool of process_count processes
+    (os.cpu_count() by default, 1 to validate in the current process).
+    """
+    if hasattr(move_lines, "to_move_tree") :
+        move_tree = move_lines.to_move_tree()
+    else :
+        move_tree = move_lines["move_lines"]
+    root_fen = move_lines.root_fen
+    process_count = process_count or os.cpu_count() or 1
+    if process_count == 1 :
+        return sorted(validate_move_tree(move_tree, (), root_fen), key=_get_sort_key)
+    # Several tasks by process, so that the processes finish at the same time
+    tasks, bad_edges = split_move_tree(move_tree, 4*process_count, root_fen)
+    with Pool(process_count) as pool :
+        tasks = [(path, subtree, root_fen) for path, subtree in tasks]
+        for task_bad_edges in pool.imap_unordered(_validate_task, tasks) :
+            bad_edges.extend(task_bad_edges)
+    return sorted(bad_edges, key=_get_sort_key)
+
+def _get_sort_key(bad_edge: BadEdge) -> list :
+    # The invalid keys can be strings
+    return [key_to_string(key) for key in bad_edge.path]
+
+if __name__ == "__main__" :
+    lines_name = sys.argv[1]
+    process_count = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    bad_edges = validate_move_lines(MoveLines(lines_name), process_count)
+    for bad_edge in bad_edges :
+        print(f"{' '.join(key_to_string(key) for key in bad_edge.path)}: {bad_edge.reason}")
+    print(f"{len(bad_edges)} bad edge(s)")
@@ -0,0 +1,94 @@
+# This file is part of the chessopy library.
+# Copyright (C) 2020 Nicolas Sénave <email>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Minimal UCI engine for the tests of chessopy.uci (no engine binary needed):
+the score is the static evaluation of chessopy.engine, the best move the legal move
+with the best static evaluation after it.
+"setoption name Delay value <ms>" makes each "go" wait, to test concurrent analyses.
+"setoption name CrashMove value <n>" makes the engine exit on the "go" of the positions 
+whose fullmove number is n, to test the engines which stop.
+Usage: python fake_uci_engine.py
+"""
+
+import sys
+import time
+
+import chessopy
+from chessopy.engine import evaluate
+
+def get_uci_move(move: tuple) -> str :
+    res = chessopy.SQUARE_NAMES[move[0]] + chessopy.SQUARE_NAMES[move[1]]
+    if move[2] is not None :
+        res += "nbrq"[move[2] - 1]
+    return res
+
+def go(board: chessopy.Board, delay: float) :
+    time.sleep(delay)
+    moves = board._generate_legal_moves()
+    if not moves :
+        if board.is_check() :
+            print("info depth 0 score mate 0")
+        else :
+            print("info depth 0 score cp 0")
+        print("bestmove (none)")
+        return
+    best_score, best_move = None, None
+    for move in moves :
+        undo = board._make_move(*move)
+        score = -evaluate(board)
+        board._unmake_move(undo)
+        if best_score is None or score > best_score :
+            best_score, best_move = score, move
+    print(f"info depth 1 score cp {best_score} pv {get_uci_move(best_move)}")
+    print(f"bestmove {get_uci_move(best_move)}")
+
+def main() :
+    board = chessopy.Board(chessopy.MoveLines("new"))
+    delay = 0
+    crash_move = None
+    fullmove_number = 1
+    for line in sys.stdin :
+        words = line.split()
+        if not words :
+            continue
+        if words[0] == "uci" :
+            print("id name chessopy fake engine")
+            print("option name Delay type spin default 0 min 0 max 10000")
+            print("option name CrashMove type spin default 0 min 0 max 10000")
+            print("uciok")
+        elif words[0] == "isready" :
+            print("readyok")
+        elif words[0] == "setoption" and words[2] == "Delay" :
+            delay = int(words[4]) / 1000
+        elif words[0] == "setoption" and words[2] == "CrashMove" :
+            crash_move = int(words[4])
+        elif words[0] == "position" and words[1] == "fen" :
+            board.set_fen(" ".join(words[2:8]))
+            fullmove_number = int(words[7])
+        elif words[0] == "position" and words[1] == "startpos" :
+            board.set_fen(chessopy.STARTING_FEN)
+            fullmove_number = 1
+        elif words[0] == "go" :
+            if fullmove_number == crash_move :
+                sys.exit(1)
+            go(board, delay)
+        elif words[0] == "quit" :
+            break
+        sys.stdout.flush()
+
+if __name__ == "__main__" :
+    main()
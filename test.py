@@ -15,8 +15,49 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import chessopy
+import chessopy.analysis
+import chessopy.binary_database
+import chessopy.engine
+import chessopy.gui
+import chessopy.library
+import chessopy.pgn
+import chessopy.polyglot
+import chessopy.scheduler
+import chessopy.sound
+import chessopy.training
+import chessopy.uci
+import chessopy.validation
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
 import unittest
 
+chessopy.FOLDER_PATH = os.path.dirname(os.path.abspath(__file__)) + "/"
+
+def key(key_string: str) -> int :
+    """Return the key of a move in the move lines from its key in the json files (for instance "12,28")."""
+    return chessopy.key_from_string(key_string)
+
+class TemporaryFolderMixin() :
+    """Mixin of the test cases which write databases."""
+
+    def use_temporary_folder(self) -> str :
+        """Set chessopy.FOLDER_PATH to a new temporary folder containing a databases folder 
+        until the end of the test, and return the path of the temporary folder."""
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.addCleanup(setattr, chessopy, "FOLDER_PATH", chessopy.FOLDER_PATH)
+        chessopy.FOLDER_PATH = temporary_directory.name + "/"
+        os.mkdir(temporary_directory.name + "/databases")
+        return temporary_directory.name
+
 class SquareTestCase(unittest.TestCase):
 
     def test_square(self):
@@ -30,4 +71,1092 @@ class SquareTestCase(unittest.TestCase):
         e4_square = chessopy.Square(3, 3)
         self.assertEqual('e4', e4_square.get_name())
 
-#TODO: write the tests!!!
+class BoardTestCase(unittest.TestCase):
+
+    def test_initial_bitboards(self):
+        board = chessopy.Board()
+        self.assertEqual(0xFFFF00000000FFFF, board.get_occupancy())
+        self.assertEqual(0xFFFF, board.get_occupancy(chessopy.PieceColor.WHITE))
+        self.assertEqual(0xFF00, board.get_bitboard(chessopy.PieceType.PAWN, chessopy.PieceColor.WHITE))
+        self.assertEqual(1 << 60, board.get_bitboard(chessopy.PieceType.KING, chessopy.PieceColor.BLACK))
+        self.assertEqual(32, len(board.get_all_pieces()))
+    
+    def test_square_views(self):
+        board = chessopy.Board()
+        e2_square = board.get_square_from_name('e2')
+        self.assertIsInstance(e2_square.get_piece(), chessopy.Pawn)
+        self.assertEqual(chessopy.PieceColor.WHITE, e2_square.get_piece().get_color())
+        self.assertTrue(board.get_square_from_name('e4').is_empty())
+    
+    def test_move_and_undo(self):
+        board = chessopy.Board()
+        bitboards = list(board.bitboards)
+        board.move_from_numbers(12, 28) # e4
+        board.move_from_numbers(51, 35) # d5
+        board.move_from_numbers(28, 35) # exd5
+        self.assertEqual(chessopy.PieceColor.WHITE, board.get_color_at(35))
+        self.assertEqual(chessopy.PieceType.PAWN, board.get_piece_type_at(35))
+        self.assertEqual(31, len(board.get_all_pieces()))
+        for k in range(3) :
+            board.pop_last_move()
+        self.assertEqual(bitboards, board.bitboards)
+        self.assertEqual(0xFFFF00000000FFFF, board.get_occupancy())
+    
+    def test_slots(self):
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        board.move_from_numbers(12, 28) # e4
+        board.move_from_numbers(51, 35) # d5
+        board.move_from_numbers(28, 35) # exd5
+        move = board.move_played[-1]
+        piece = board.get_piece_at(35)
+        for instance in [move, piece, move.start_square] :
+            self.assertFalse(hasattr(instance, "__dict__"))
+        self.assertEqual(('Q', 9), (chessopy.Queen(chessopy.PieceColor.BLACK).get_san_name(), chessopy.Queen.value))
+        # The piece taken is stored as its bitboard index
+        self.assertEqual(chessopy.PieceColor.BLACK.value*6 + chessopy.PieceType.PAWN.value, move.piece_taken_index)
+        self.assertIsInstance(move.get_piece_taken(), chessopy.Pawn)
+        self.assertEqual((chessopy.PieceColor.BLACK, 35), (move.piece_taken.get_color(), move.piece_taken.get_square_number()))
+        self.assertIsNone(board.move_played[0].piece_taken)
+
+class FenTestCase(TemporaryFolderMixin, unittest.TestCase):
+
+    MIDDLEGAME_FEN = "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"
+
+    def test_fen_round_trip(self):
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        self.assertEqual(chessopy.STARTING_FEN, board.get_fen())
+        for fen, node_counts in MoveGenerationTestCase.PERFT_POSITIONS + [(self.MIDDLEGAME_FEN, [])] :
+            board.set_fen(fen)
+            self.assertEqual(fen, board.get_fen())
+            self.assertEqual(board.compute_zobrist_hash(), board.get_zobrist_hash())
+        self.assertRaises(chessopy.NotValidFenException, board.set_fen, "8/8/8 w - - 0 1")
+
+    def test_not_valid_fen(self):
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        board.set_fen(self.MIDDLEGAME_FEN)
+        board.move_from_numbers(*board.parse_san("Ng5")[:2])
+        fen = board.get_fen()
+        for not_valid_fen in ["4k3/8/8/8/8/8/8/p3K3 b - - 0 1", "P3k3/8/8/8/8/8/8/4K3 w - - 0 1",
+                              "4k3/8/8/8/8/8/8/4K3 w - zz 0 1", "4k3/8/8/8/8/8/8/4K3 w - e4 0 1",
+                              "4k3/8/8/8/8/8/8/4K3 w - - x 1", "4k3/8/8/8/8/8/8/4K3 w - - 0 -1",
+                              "4k3/8/8/8/8/8/8/4K3 w Kx - 0 1", "4k3/8/8/8/8/8/8/4K3 x - - 0 1"] :
+            self.assertRaises(chessopy.NotValidFenException, board.set_fen, not_valid_fen)
+            self.assertNotIn(not_valid_fen, chessopy.FEN_CACHE)
+            # The board is unchanged
+            self.assertEqual(fen, board.get_fen())
+            self.assertEqual(1, len(board.move_played))
+
+    def test_fen_cache(self):
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        board.set_fen(self.MIDDLEGAME_FEN)
+        self.assertIn(self.MIDDLEGAME_FEN, chessopy.FEN_CACHE)
+        state = board.get_position_state()
+        # The cached state is not changed by the moves
+        board._make_move(*board.parse_san("Nxe5"))
+        board.set_fen(self.MIDDLEGAME_FEN)
+        self.assertEqual(state, board.get_position_state())
+        self.assertEqual(self.MIDDLEGAME_FEN, board.get_fen())
+
+    def test_lines_from_fen(self):
+        self.use_temporary_folder()
+        move_lines = chessopy.MoveLines("new")
+        move_lines.set_root_fen(self.MIDDLEGAME_FEN)
+        board = chessopy.Board(move_lines)
+        self.assertEqual(self.MIDDLEGAME_FEN, board.get_fen())
+        board.move_from_numbers(*board.parse_san("Ng5")[:2])
+        board.move_from_numbers(*board.parse_san("d5")[:2])
+        move_lines.save_new_database("italian_database.json")
+        board = chessopy.Board(chessopy.MoveLines("italian"))
+        self.assertEqual(self.MIDDLEGAME_FEN, board.get_fen())
+        self.assertEqual([(21, 38)], board.move_lines.get_coords_of_childs_of_current_node())
+        session = chessopy.training.TrainingSession(board)
+        session.start()
+        self.assertTrue(session.play_user_move(21, 38))
+        scheduler = chessopy.scheduler.RepetitionScheduler(chessopy.PieceColor.BLACK)
+        scheduler.index_move_lines(board.move_lines)
+        self.assertEqual(1, len(scheduler))
+        self.assertEqual([], chessopy.validation.validate_move_lines(board.move_lines, 1))
+        position_move_lines = chessopy.PositionMoveLines("italian")
+        self.assertEqual(self.MIDDLEGAME_FEN, position_move_lines.root_fen)
+        self.assertEqual([(21, 38)], position_move_lines.get_coords_of_childs_of_current_node())
+
+class MoveGenerationTestCase(unittest.TestCase):
+
+    # Perft node counts at small depths, cf. bench.py for the complete suite
+    PERFT_POSITIONS = [
+        ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902]),
+        ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039]),
+        ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812]),
+        ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264]),
+        ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486]),
+    ]
+
+    def test_perft(self):
+        board = chessopy.Board()
+        for fen, node_counts in self.PERFT_POSITIONS :
+            board.set_fen(fen)
+            for depth, node_count in enumerate(node_counts, 1) :
+                self.assertEqual(node_count, board.perft(depth), fen)
+            self.assertEqual(fen, board.get_fen())
+    
+    def test_castling(self):
+        board = chessopy.Board()
+        board.set_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        board.castle_king_side()
+        self.assertEqual(chessopy.PieceType.ROOK, board.get_piece_type_at(5))
+        self.assertEqual("r3k2r/8/8/8/8/8/8/R4RK1 b kq - 1 1", board.get_fen())
+        board.castle_queen_side()
+        self.assertEqual("2kr3r/8/8/8/8/8/8/R4RK1 w - - 2 2", board.get_fen())
+        board.pop_last_move()
+        board.pop_last_move()
+        self.assertEqual("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", board.get_fen())
+    
+    def test_en_passant_and_promotion(self):
+        board = chessopy.Board()
+        board.set_fen("4k3/1P6/8/8/4p3/8/3P4/4K3 w - - 0 1")
+        board.move_from_numbers(11, 27) # d4
+        board.move_en_passant(board.get_square_from_name('e4'))
+        self.assertTrue(board.move_played[-1].en_passant)
+        self.assertIsNone(board.get_piece_type_at(27))
+        board.move_from_numbers(49, 57) # b8=Q
+        self.assertEqual(chessopy.PieceType.QUEEN, board.get_piece_type_at(57))
+        self.assertTrue(board.is_check())
+        for k in range(3) :
+            board.pop_last_move()
+        self.assertEqual("4k3/1P6/8/8/4p3/8/3P4/4K3 w - - 0 1", board.get_fen())
+    
+    def test_legality(self):
+        board = chessopy.Board()
+        e2_square = board.get_square_from_name('e2')
+        self.assertTrue(board.is_legal(chessopy.Move(e2_square, board.get_square_from_name('e4'))))
+        self.assertFalse(board.is_legal(chessopy.Move(e2_square, board.get_square_from_name('e5'))))
+        board.set_fen("7k/6Q1/6K1/8/8/8/8/8 b - - 0 1")
+        self.assertTrue(board.is_checkmate())
+        board.set_fen("7k/8/6QK/8/8/8/8/8 b - - 0 1")
+        self.assertTrue(board.is_stalemate())
+
+class ZobristTestCase(unittest.TestCase):
+
+    def test_transposition(self):
+        board = chessopy.Board()
+        initial_hash = board.get_zobrist_hash()
+        for start, destination in [(12, 28), (52, 44), (11, 27)] : # 1.e4 e6 2.d4
+            board.move_from_numbers(start, destination)
+        first_hash = board.get_zobrist_hash()
+        board.set_new_game()
+        self.assertEqual(initial_hash, board.get_zobrist_hash())
+        for start, destination in [(11, 27), (52, 44), (12, 28)] : # 1.d4 e6 2.e4
+            board.move_from_numbers(start, destination)
+        self.assertEqual(first_hash, board.get_zobrist_hash())
+        self.assertNotEqual(initial_hash, first_hash)
+    
+    def test_incremental_update(self):
+        board = chessopy.Board()
+        board.set_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        initial_hash = board.get_zobrist_hash()
+        for move in board.generate_legal_moves() :
+            board.push_move(move)
+            self.assertEqual(board.compute_zobrist_hash(), board.get_zobrist_hash())
+            for answer in board.generate_legal_moves() :
+                board.push_move(answer)
+                self.assertEqual(board.compute_zobrist_hash(), board.get_zobrist_hash())
+                board.pop_move()
+            board.pop_move()
+        self.assertEqual(initial_hash, board.get_zobrist_hash())
+
+class MoveLinesTestCase(TemporaryFolderMixin, unittest.TestCase):
+
+    def test_navigation(self):
+        move_lines = chessopy.MoveLines("french")
+        move_lines.go_to_child(key("12,28"))
+        move_lines.go_to_child(key("52,44"))
+        move_lines.go_to_child(key("11,27"))
+        move_lines.go_to_parent()
+        move_lines.go_to_parent()
+        self.assertEqual([key("12,28")], move_lines.current_line)
+        self.assertIs(move_lines["move_lines"][key("12,28")], move_lines.current_node)
+        move_lines.go_to_parent()
+        move_lines.go_to_parent()
+        self.assertIs(move_lines["move_lines"], move_lines.current_node)
+
+    def test_move_keys(self):
+        self.assertEqual("12,28", chessopy.key_to_string(chessopy.move_key(12, 28)))
+        self.assertEqual((12, 28, None), chessopy.key_to_move(key("12,28")))
+        # A promotion to a queen is the default
+        self.assertEqual(key("52,60"), chessopy.move_key(52, 60, chessopy.PieceType.QUEEN.value))
+        knight_promotion = chessopy.move_key(52, 60, chessopy.PieceType.KNIGHT.value)
+        self.assertEqual("52,60,n", chessopy.key_to_string(knight_promotion))
+        self.assertEqual(knight_promotion, key("52,60,n"))
+        self.assertLess(knight_promotion, 1 << 16)
+        for key_string in ["x", "12", "64,1", "12,28,q", "12,-28"] :
+            self.assertIsNone(key(key_string))
+        # Invalid keys are kept as they are
+        json_tree = {"12,28": {"52,44": {}, "x": {}}, "49,57,r": {}}
+        move_tree = chessopy.move_tree_from_json(json_tree)
+        self.assertEqual({key("12,28"): {key("52,44"): {}, "x": {}}, key("49,57,r"): {}}, move_tree)
+        self.assertEqual(json_tree, chessopy.move_tree_to_json(move_tree))
+
+    def test_under_promotion(self):
+        self.use_temporary_folder()
+        move_lines = chessopy.MoveLines("new")
+        move_lines.set_root_fen("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1")
+        board = chessopy.Board(move_lines)
+        board.move_from_numbers(49, 57, chessopy.PieceType.KNIGHT)
+        board.pop_last_move()
+        board.move_from_numbers(49, 57)
+        self.assertEqual({key("49,57,n"): {}, key("49,57"): {}}, move_lines["move_lines"])
+        move_lines.save_new_database("test_database.json")
+        self.assertEqual(move_lines["move_lines"], chessopy.MoveLines("test")["move_lines"])
+
+class JournalTestCase(TemporaryFolderMixin, unittest.TestCase):
+
+    def test_journal(self):
+        temporary_folder = self.use_temporary_folder()
+        database_path = temporary_folder + "/databases/test_database.json"
+        journal_path = temporary_folder + "/databases/test_database.journal"
+        with open(database_path, 'w') as json_database :
+            json.dump({"move_lines": {"12,28": {"52,44": {}}}}, json_database)
+        move_lines = chessopy.MoveLines("test")
+        for key_string in ["12,28", "52,44", "11,27"] :
+            move_lines.go_to_child(key(key_string))
+        move_lines.go_to_root()
+        move_lines.go_to_child(key("11,27"))
+        move_lines.go_to_root()
+        move_lines.remove_move(key("11,27"))
+        move_lines.add_curent_lines_to_database()
+        with open(journal_path) as journal_file :
+            self.assertEqual("+ 12,28 52,44 11,27\n+ 11,27\n- 11,27\n", journal_file.read())
+        # The database file is unchanged, the journal is replayed when loading
+        with open(database_path) as json_database :
+            self.assertEqual({"12,28": {"52,44": {}}}, json.load(json_database)["move_lines"])
+        expected_move_lines = {key("12,28"): {key("52,44"): {key("11,27"): {}}}}
+        self.assertEqual(expected_move_lines, chessopy.MoveLines("test")["move_lines"])
+        # An interrupted writing of the journal is ignored
+        with open(journal_path, 'a') as journal_file :
+            journal_file.write("+ 6,21 57")
+        move_lines = chessopy.MoveLines("test")
+        self.assertEqual(expected_move_lines, move_lines["move_lines"])
+        self.assertEqual(3, move_lines.journal_size)
+        self.assertEqual(len("+ 12,28 52,44 11,27\n+ 11,27\n- 11,27\n"), os.path.getsize(journal_path))
+        # Compaction
+        move_lines.go_to_child(key("6,21"))
+        move_lines.JOURNAL_COMPACTION_SIZE = 0
+        move_lines.add_curent_lines_to_database()
+        self.assertFalse(os.path.exists(journal_path))
+        self.assertEqual(["test_database.json"], os.listdir(temporary_folder + "/databases"))
+        expected_move_lines[key("6,21")] = {}
+        self.assertEqual(expected_move_lines, chessopy.MoveLines("test")["move_lines"])
+
+class PositionMoveLinesTestCase(TemporaryFolderMixin, unittest.TestCase):
+
+    def test_load_tree_database(self):
+        move_lines = chessopy.PositionMoveLines("french")
+        self.assertEqual([(12, 28)], move_lines.get_coords_of_childs_of_current_node())
+        move_lines.go_to_child(key("12,28"))
+        move_lines.go_to_child(key("52,44"))
+        self.assertEqual([(11, 27)], move_lines.get_coords_of_childs_of_current_node())
+        move_lines.go_to_parent()
+        self.assertEqual([(52, 44)], move_lines.get_coords_of_childs_of_current_node())
+        # 8 moves and the root position
+        self.assertEqual(9, len(move_lines["positions"]))
+    
+    def test_transpositions_are_shared(self):
+        board = chessopy.Board(chessopy.PositionMoveLines("new"))
+        for start, destination in [(12, 28), (52, 44), (11, 27), (51, 35)] : # 1.e4 e6 2.d4 d5
+            board.move_from_numbers(start, destination)
+        board.set_new_game()
+        for start, destination in [(11, 27), (52, 44), (12, 28)] : # 1.d4 e6 2.e4
+            board.move_from_numbers(start, destination)
+        self.assertEqual([(51, 35)], board.move_lines.get_coords_of_childs_of_current_node())
+        self.assertEqual(7, len(board.move_lines["positions"]))
+        board.pop_last_move()
+        self.assertEqual([(12, 28)], board.move_lines.get_coords_of_childs_of_current_node())
+    
+    def test_bad_moves_are_skipped(self):
+        move_lines = chessopy.PositionMoveLines("new")
+        bad_edges = move_lines.add_move_tree({key("12,28"): {key("12,28"): {}, key("52,36"): {}},
+                                              "e2e4": {}, key("11,35"): {key("52,36"): {}}})
+        self.assertEqual([((key("12,28"), key("12,28")), chessopy.validation.NO_PIECE_ON_START_SQUARE),
+                          (("e2e4",), chessopy.validation.NOT_A_MOVE_KEY),
+                          ((key("11,35"),), chessopy.validation.ILLEGAL_MOVE)], bad_edges)
+        self.assertEqual([(12, 28)], move_lines.get_coords_of_childs_of_current_node())
+        move_lines.go_to_child(key("12,28"))
+        self.assertEqual([(52, 36)], move_lines.get_coords_of_childs_of_current_node())
+        self.assertEqual(3, len(move_lines["positions"]))
+
+    def test_save_and_load(self):
+        self.use_temporary_folder()
+        board = chessopy.Board(chessopy.PositionMoveLines("new"))
+        for start, destination in [(12, 28), (52, 44), (11, 27)] :
+            board.move_from_numbers(start, destination)
+        board.move_lines.save_new_database("test_database.json")
+        move_lines = chessopy.PositionMoveLines("test")
+        self.assertEqual(board.move_lines["positions"], move_lines["positions"])
+        self.assertEqual(board.move_lines["root"], move_lines["root"])
+
+class BinaryDatabaseTestCase(TemporaryFolderMixin, unittest.TestCase):
+
+    MOVE_TREE = {key("12,28"): {key("52,44"): {key("11,27"): {}}, key("50,34"): {key("6,21"): {}, key("11,27"): {}}}, key("11,27"): {}}
+
+    def test_conversions(self):
+        with tempfile.TemporaryDirectory() as temporary_folder :
+            binary_path = temporary_folder + "/test_database.bin"
+            json_path = temporary_folder + "/test_database.json"
+            chessopy.binary_database.convert_json_to_binary(
+                chessopy.FOLDER_PATH + "databases/french_database.json", binary_path)
+            chessopy.binary_database.convert_binary_to_json(binary_path, json_path)
+            with open(json_path) as json_database :
+                self.assertEqual(chessopy.MoveLines("french")["move_lines"], 
+                                 chessopy.move_tree_from_json(json.load(json_database)["move_lines"]))
+            chessopy.binary_database.write_binary_database(self.MOVE_TREE, binary_path)
+            self.assertEqual(8*8 + 16, os.path.getsize(binary_path))
+            self.assertEqual(self.MOVE_TREE, chessopy.binary_database.read_binary_database(binary_path))
+
+    def test_not_valid_key(self):
+        with tempfile.TemporaryDirectory() as temporary_folder :
+            binary_path = temporary_folder + "/test_database.bin"
+            json_path = temporary_folder + "/test_database.json"
+            with open(json_path, 'w') as json_database :
+                json.dump({"move_lines": {"12,28": {"52,44": {"e2e4": {}}}}}, json_database)
+            with self.assertRaisesRegex(chessopy.binary_database.NotValidBinaryDatabaseException,
+                                        "not valid move in the line: 12,28 52,44 e2e4") :
+                chessopy.binary_database.convert_json_to_binary(json_path, binary_path)
+            self.assertRaises(chessopy.binary_database.NotValidBinaryDatabaseException,
+                              chessopy.binary_database.write_binary_database, {"12,28": {}}, binary_path)
+            self.assertFalse(os.path.exists(binary_path))
+    
+    def test_binary_move_lines(self):
+        temporary_folder = self.use_temporary_folder()
+        chessopy.binary_database.write_binary_database(
+            self.MOVE_TREE, temporary_folder + "/databases/test_database.bin")
+        move_lines = chessopy.binary_database.BinaryMoveLines("test")
+        self.assertEqual([(12, 28), (11, 27)], move_lines.get_coords_of_childs_of_current_node())
+        move_lines.go_to_child(key("12,28"))
+        move_lines.go_to_child(key("50,34"))
+        self.assertEqual([(6, 21), (11, 27)], move_lines.get_coords_of_childs_of_current_node())
+        move_lines.go_to_child(key("1,18")) # new move, kept in memory
+        move_lines.go_to_child(key("57,42"))
+        move_lines.go_to_parent()
+        move_lines.go_to_parent()
+        self.assertEqual([(6, 21), (11, 27), (1, 18)], move_lines.get_coords_of_childs_of_current_node())
+        self.assertRaises(chessopy.binary_database.ReadOnlyBinaryDatabaseException, move_lines.remove_move, key("6,21"))
+        self.assertEqual([(6, 21), (11, 27), (1, 18)], move_lines.get_coords_of_childs_of_current_node())
+        self.assertEqual(([], False), (move_lines.journal_entries, move_lines.is_journaled))
+        move_lines.save_new_database("saved_database.bin")
+        move_lines.close()
+        move_tree = chessopy.binary_database.read_binary_database(temporary_folder + "/databases/saved_database.bin")
+        self.assertEqual({key("57,42"): {}}, move_tree[key("12,28")][key("50,34")][key("1,18")])
+
+class SanTestCase(unittest.TestCase):
+
+    def test_move_from_san(self):
+        board = chessopy.Board()
+        for san in ["e4", "e5", "Nf3", "Nc6", "Bc4", "Nf6", "O-O", "Nxe4"] :
+            board.move_from_san(san)
+        self.assertEqual("r1bqkb1r/pppp1ppp/2n5/4p3/2B1n3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 0 5", board.get_fen())
+        self.assertRaises(chessopy.NotValidSanMoveException, board.move_from_san, "Nc3x")
+        self.assertRaises(chessopy.NotValidSanMoveException, board.move_from_san, "Ke2")
+    
+    def test_disambiguation_and_promotion(self):
+        board = chessopy.Board()
+        board.set_fen("4k3/1P6/8/8/8/8/4K3/R6R w - - 0 1")
+        self.assertRaises(chessopy.NotValidSanMoveException, board.move_from_san, "Rd1")
+        self.assertEqual((7, 5, None), board.parse_san("Rhf1"))
+        self.assertEqual((49, 57, chessopy.PieceType.KNIGHT.value), board.parse_san("b8=N"))
+        self.assertRaises(chessopy.NotValidSanMoveException, board.move_from_san, "b8")
+
+    def test_san_round_trip(self):
+        board = chessopy.Board()
+        for fen, node_counts in MoveGenerationTestCase.PERFT_POSITIONS :
+            board.set_fen(fen)
+            for move in board._generate_legal_moves() :
+                self.assertEqual(move, board.parse_san(board._get_san(*move)), fen)
+    
+    def test_get_san(self):
+        board = chessopy.Board()
+        board.set_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        sans = {board._get_san(*move) for move in board._generate_legal_moves()}
+        for san in ["O-O", "O-O-O", "Nxf7", "Qxf6", "dxe6", "Rb1", "Kf1", "gxh3", "Nc6"] :
+            self.assertIn(san, sans)
+        board.set_fen("4k3/1P6/8/8/8/8/4K3/R6R w - - 0 1")
+        sans = {board._get_san(*move) for move in board._generate_legal_moves()}
+        for san in ["Rad1", "Rhd1", "b8=Q+", "b8=N", "Ra8+"] :
+            self.assertIn(san, sans)
+        board.set_fen("7k/8/8/8/8/1N3N2/8/1N2K3 w - - 0 1")
+        sans = {board._get_san(*move) for move in board._generate_legal_moves()}
+        for san in ["N1d2", "Nb3d2", "Nfd2"] :
+            self.assertIn(san, sans)
+        move = chessopy.Move(board.get_square_from_name('f3'), board.get_square_from_name('h2'))
+        self.assertEqual("Nh2", move.get_san_notation())
+        board.set_fen("6k1/5ppp/8/8/8/8/8/R3K3 w - - 0 1")
+        self.assertEqual("Ra8#", board._get_san(0, 56))
+
+class PgnTestCase(unittest.TestCase):
+
+    PGN = """[Event "Game 1"]
+[Result "1-0"]
+
+1. e4 e6 2. d4 d5 {French defence,
+[still a comment]} 3. e5 (3. Nc3 Nf6 (3... Bb4) 4. Bg5) 3... c5 $1 4. c3 1-0
+
+[Event "Game 2"]
+
+1.d4 e6 2.e4 d5 3.exd5!? exd5 *
+"""
+
+    def test_read_games(self):
+        games = list(chessopy.pgn.read_games(io.StringIO(self.PGN)))
+        self.assertEqual(2, len(games))
+        self.assertEqual("Game 1", games[0].headers["Event"])
+        self.assertEqual(["e4", "e6", "d4", "d5", "e5", "c5", "c3"], games[0].root.get_main_line())
+        d5_node = games[0].root.children[0].children[0].children[0].children[0]
+        self.assertEqual("French defence,\n[still a comment]", d5_node.comment)
+        self.assertEqual(["e5", "Nc3"], [node.san for node in d5_node.children])
+        self.assertEqual(["Nf6", "Bb4"], [node.san for node in d5_node.children[1].children])
+        self.assertEqual("*", games[1].result)
+    
+    def test_import(self):
+        importer = chessopy.pgn.PgnImporter(chessopy.PositionMoveLines("new"))
+        importer.import_games(chessopy.pgn.read_games(io.StringIO(self.PGN)))
+        move_lines = importer.finish()
+        # The second game transposes after 2.e4, only 1.d4 e6 and 3.exd5 exd5 are new
+        self.assertEqual(1 + 11 + 4, len(move_lines["positions"]))
+        self.assertEqual(0, importer.error_count)
+    
+    def test_zero_castling(self):
+        pgn = "1. e4 e5 2. Nf3 Nc6 3. Bc4 Nf6 4. 0-0 *\n"
+        game = next(chessopy.pgn.read_games(io.StringIO(pgn)))
+        self.assertEqual(["e4", "e5", "Nf3", "Nc6", "Bc4", "Nf6", "0-0"], game.root.get_main_line())
+        importer = chessopy.pgn.PgnImporter(chessopy.MoveLines("new"))
+        importer.import_games(chessopy.pgn.read_games(io.StringIO(pgn)))
+        move_lines = importer.finish()
+        self.assertEqual(0, importer.error_count)
+        move_lines.go_to_root()
+        for key_string in ["12,28", "52,36", "6,21", "57,42", "5,26", "62,45"] :
+            move_lines.go_to_child(key(key_string))
+        self.assertEqual([(4, 6)], move_lines.get_coords_of_childs_of_current_node())
+
+    def test_import_filters(self):
+        importer = chessopy.pgn.PgnImporter(chessopy.MoveLines("new"), max_plies=3, min_occurrences=2)
+        importer.import_games(chessopy.pgn.read_games(io.StringIO(self.PGN + "\n" + self.PGN)))
+        move_lines = importer.finish()
+        self.assertEqual({key("12,28"): {key("52,44"): {key("11,27"): {}}}, key("11,27"): {key("52,44"): {key("12,28"): {}}}}, 
+                         move_lines["move_lines"])
+
+    def test_import_malformed_pawn_move(self):
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        board.move_from_san("Nc3")
+        for san in ["b1", "h8"] : # pawn moves from off the board
+            with self.assertRaises(chessopy.NotValidSanMoveException) :
+                board.parse_san(san)
+        # The bad game is counted as an error, the next games are imported
+        importer = chessopy.pgn.PgnImporter(chessopy.MoveLines("new"))
+        importer.import_games(chessopy.pgn.read_games(io.StringIO("1. Nc3 d5 2. b1 *\n\n" + self.PGN)))
+        self.assertEqual(1, importer.error_count)
+        self.assertIn(key("12,28"), importer.finish()["move_lines"])
+
+class PolyglotTestCase(unittest.TestCase):
+
+    # 1.e4 e5 2.Nf3 Nc6 3.Bc4 Nf6 4.O-O, and 1.Nf3 Nc6 2.e4 e5 which transposes
+    MOVE_TREE = {key("12,28"): {key("52,36"): {key("6,21"): {key("57,42"): {key("5,26"): {key("62,45"): {key("4,6"): {}}}}}}}, 
+                 key("6,21"): {key("57,42"): {key("12,28"): {key("52,36"): {}}}}}
+
+    def test_polyglot_moves(self):
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        board.set_fen("r3k2r/8/8/8/8/8/1p6/R3K2R b KQkq - 0 1")
+        self.assertEqual((60, 62, None), chessopy.polyglot.decode_polyglot_move(60 << 6 | 63, board))
+        self.assertEqual(60 << 6 | 56, chessopy.polyglot.encode_polyglot_move(60, 58, None, board))
+        self.assertEqual(9 << 6 | 0 | 4 << 12, chessopy.polyglot.encode_polyglot_move(9, 0, None, board))
+        self.assertEqual((9, 1, chessopy.PieceType.KNIGHT.value), 
+                         chessopy.polyglot.decode_polyglot_move(9 << 6 | 1 | 1 << 12, board))
+
+    def test_book(self):
+        move_lines = chessopy.MoveLines("new")
+        move_lines["move_lines"] = self.MOVE_TREE
+        move_lines.go_to_root()
+        with tempfile.TemporaryDirectory() as temporary_folder :
+            book_path = temporary_folder + "/book.bin"
+            chessopy.polyglot.export_move_lines(move_lines, book_path)
+            self.assertEqual(11*16, os.path.getsize(book_path))
+            with chessopy.polyglot.PolyglotBook(book_path) as book :
+                keys = [book.get_entry(index).key for index in range(len(book))]
+                self.assertEqual(sorted(keys), keys)
+                self.assertEqual([0x463b96181691fc9c]*2, [entry.key for entry in book.get_entries(0x463b96181691fc9c)])
+            polyglot_move_lines = chessopy.polyglot.PolyglotMoveLines(book_path)
+            board = chessopy.Board(polyglot_move_lines)
+            self.assertEqual({key("12,28"): 1, key("6,21"): 1}, polyglot_move_lines.current_node)
+            for san in ["Nf3", "Nc6", "e4", "e5", "Bc4", "Nf6"] :
+                self.assertIn(polyglot_move_lines.choose_random_child(), polyglot_move_lines.current_node)
+                board.move_from_san(san)
+            self.assertEqual([(4, 6)], polyglot_move_lines.get_coords_of_childs_of_current_node())
+            board.move_from_san("O-O")
+            self.assertIsNone(polyglot_move_lines.choose_random_child())
+            polyglot_move_lines.go_to_parent()
+            self.assertEqual({key("4,6"): 1}, polyglot_move_lines.current_node)
+            # Illegal moves (no piece on e2, black pawn with White to move)
+            for key_string in ["12,28", "52,44"] :
+                self.assertRaises(chessopy.IllegalMoveException, polyglot_move_lines.go_to_child, key(key_string))
+            self.assertEqual({key("4,6"): 1}, polyglot_move_lines.current_node)
+            self.assertEqual(6, len(polyglot_move_lines.current_line))
+            # The book is replaced, not written in place while it is read
+            inode = os.stat(book_path).st_ino
+            chessopy.polyglot.write_book([], book_path)
+            self.assertNotEqual(inode, os.stat(book_path).st_ino)
+            self.assertEqual(["book.bin"], os.listdir(temporary_folder))
+            self.assertEqual({key("4,6"): 1}, polyglot_move_lines.current_node)
+            # Chosen with the weights, uniformly if they are all 0
+            polyglot_move_lines.current_node = {key("4,6"): 0, key("11,27"): 3}
+            self.assertEqual({key("11,27")}, {polyglot_move_lines.choose_random_child() for k in range(20)})
+            polyglot_move_lines.current_node = {key("4,6"): 0, key("11,27"): 0}
+            self.assertEqual({key("4,6"), key("11,27")}, {polyglot_move_lines.choose_random_child() for k in range(50)})
+            polyglot_move_lines.close()
+
+    def test_export_from_fen(self):
+        fen = "4k3/8/8/8/8/8/8/R3K3 w - - 0 1"
+        move_lines = chessopy.MoveLines("new")
+        move_lines.set_root_fen(fen)
+        # a1a2 e8d8, e2e4 (no pawn) and a key which is not valid are skipped
+        move_lines["move_lines"] = {key("0,8"): {key("60,59"): {}}, key("12,28"): {key("52,36"): {}}, "e2e4": {}}
+        with tempfile.TemporaryDirectory() as temporary_folder :
+            book_path = temporary_folder + "/book.bin"
+            bad_edges = chessopy.polyglot.export_move_lines(move_lines, book_path)
+            self.assertEqual([((key("12,28"),), chessopy.validation.NO_PIECE_ON_START_SQUARE),
+                              (("e2e4",), chessopy.validation.NOT_A_MOVE_KEY)], bad_edges)
+            board = chessopy.Board(chessopy.MoveLines("new"))
+            board.set_fen(fen)
+            with chessopy.polyglot.PolyglotBook(book_path) as book :
+                self.assertEqual(2, len(book))
+                self.assertEqual([((0, 8, None), 1)], book.get_moves(board))
+                board.move_from_numbers(0, 8)
+                self.assertEqual([((60, 59, None), 1)], book.get_moves(board))
+
+class TrainingSessionTestCase(unittest.TestCase):
+
+    def test_training_session(self):
+        move_lines = chessopy.MoveLines("new")
+        move_lines["move_lines"] = {key("12,28"): {key("52,44"): {key("11,27"): {}}}, key("11,27"): {}}
+        session = chessopy.training.TrainingSession(chessopy.Board(move_lines))
+        session.start()
+        result = session.play_move(12, 20)
+        self.assertEqual((False, None, False), result)
+        self.assertEqual(1, session.mistake_count)
+        result = session.play_move(12, 28)
+        self.assertEqual((True, (52, 44, None), False), result)
+        result = session.play_move(11, 27)
+        self.assertEqual((True, None, True), result)
+        self.assertEqual(3, len(session.board.move_played))
+        session.undo()
+        session.undo()
+        self.assertEqual({key("52,44"): {key("11,27"): {}}}, session.move_lines.current_node)
+        session.start()
+        self.assertEqual([], session.board.move_played)
+        self.assertEqual(0, session.mistake_count)
+
+    def test_prepared_reply(self):
+        # The reply is searched on a copy of the position taken when it is prepared
+        move_lines = chessopy.MoveLines("new")
+        move_lines.set_root_fen("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+        board = chessopy.Board(move_lines)
+        session = chessopy.training.TrainingSession(board, engine=chessopy.engine.Engine(table_size=1024),
+                                                    engine_time_budget=0.1)
+        session.start()
+        search_reply = session.prepare_reply()
+        board.set_fen(chessopy.STARTING_FEN)
+        self.assertEqual((0, 56, None), search_reply()) # Ra8#
+        # The move of the lines is chosen when the reply is prepared
+        move_lines = chessopy.MoveLines("new")
+        move_lines["move_lines"] = {key("12,28"): {}}
+        session = chessopy.training.TrainingSession(chessopy.Board(move_lines))
+        session.start()
+        book_reply = session.prepare_reply()
+        move_lines["move_lines"] = {}
+        move_lines.go_to_root()
+        self.assertEqual((12, 28, None), book_reply())
+
+    def test_engine_replies(self):
+        move_lines = chessopy.MoveLines("new")
+        move_lines["move_lines"] = {key("12,28"): {}}
+        engine = chessopy.engine.Engine(table_size=1024)
+        session = chessopy.training.TrainingSession(chessopy.Board(move_lines), engine=engine, engine_time_budget=0.05)
+        session.start()
+        # The engine replies once the line is finished, its move is not added to the lines
+        result = session.play_move(12, 28)
+        self.assertTrue(result.accepted and result.line_finished)
+        last_move = session.board.move_played[-1]
+        self.assertEqual(result.reply[:2], (last_move.start_square.get_number(), last_move.destination_square.get_number()))
+        self.assertEqual({key("12,28"): {}}, move_lines["move_lines"])
+        self.assertEqual([], move_lines.journal_entries)
+        # The user plays on freely (legal moves only), out of the lines
+        self.assertFalse(session.play_user_move(0, 63))
+        self.assertTrue(session.play_user_move(11, 27))
+        self.assertEqual(0, session.mistake_count)
+        self.assertEqual({key("12,28"): {}}, move_lines["move_lines"])
+        self.assertEqual(2, session.board.unrecorded_move_count)
+        for k in range(3) :
+            session.undo()
+        self.assertEqual(([], move_lines["move_lines"]), (move_lines.current_line, move_lines.current_node))
+        # Without engine, the line is finished
+        session = chessopy.training.TrainingSession(chessopy.Board(move_lines))
+        session.start()
+        self.assertEqual((True, None, True), session.play_move(12, 28))
+
+    def test_under_promotion(self):
+        move_lines = chessopy.MoveLines("new")
+        move_lines.set_root_fen("4k3/1P4p1/8/8/8/8/8/4K3 w - - 0 1")
+        # 1.b8=N g5 2.Nc6
+        move_lines["move_lines"] = {key("49,57,n"): {key("54,38"): {key("57,42"): {}}}}
+        session = chessopy.training.TrainingSession(chessopy.Board(move_lines))
+        session.start()
+        self.assertFalse(session.check_move(49, 57))
+        self.assertFalse(session.play_user_move(49, 57, chessopy.PieceType.QUEEN))
+        result = session.play_move(49, 57, chessopy.PieceType.KNIGHT)
+        self.assertEqual((True, (54, 38, None), False), result)
+        self.assertEqual(chessopy.PieceType.KNIGHT, session.board.get_piece_type_at(57))
+        self.assertTrue(session.play_user_move(57, 42))
+        # The reply keeps its promotion: 1...g1=R
+        move_lines.set_root_fen("4k3/8/8/8/8/8/6p1/4K3 b - - 0 1")
+        move_lines["move_lines"] = {key("14,6,r"): {}}
+        session.start()
+        self.assertEqual((14, 6, chessopy.PieceType.ROOK), session.play_reply())
+        self.assertEqual(chessopy.PieceType.ROOK, session.board.get_piece_type_at(6))
+
+    def test_headless_import(self):
+        code = "import chessopy.training, sys; print('tkinter' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, 
+                                cwd=chessopy.FOLDER_PATH).stdout
+        self.assertEqual("False", output.strip())
+
+class SchedulerTestCase(unittest.TestCase):
+
+    MOVE_TREE = {key("12,28"): {key("52,44"): {key("11,27"): {key("51,35"): {}}}, key("52,36"): {key("6,21"): {}}}}
+
+    def test_review_state(self):
+        state = chessopy.scheduler.ReviewState()
+        intervals = []
+        for k in range(4) :
+            state.review(4, 0)
+            intervals.append(state.interval)
+        self.assertEqual([1, 6], intervals[:2])
+        self.assertAlmostEqual(6 * 2.5, intervals[2])
+        state.review(1, 0)
+        self.assertEqual((0, 600, 0.2), (state.interval, state.due, state.get_error_rate()))
+
+    def test_scheduler(self):
+        now = [0]
+        move_lines = chessopy.MoveLines("new")
+        move_lines["move_lines"] = self.MOVE_TREE
+        scheduler = chessopy.scheduler.RepetitionScheduler(clock=lambda: now[0])
+        scheduler.index_move_lines(move_lines)
+        self.assertEqual(3, len(scheduler))
+        session = chessopy.training.TrainingSession(chessopy.Board(move_lines), scheduler)
+        session.start()
+        # The most urgent line is followed
+        scheduler.review((key("12,28"),), True)
+        scheduler.review((key("12,28"), key("52,36"), key("6,21")), True)
+        self.assertEqual((key("12,28"), key("52,44"), key("11,27")), scheduler.get_next_line())
+        self.assertEqual((True, (52, 44, None), False), session.play_move(12, 28))
+        # A mistake makes the move due soon
+        self.assertFalse(session.play_user_move(1, 18))
+        self.assertEqual(600, scheduler.states[(key("12,28"), key("52,44"), key("11,27"))].due)
+        now[0] = 1000
+        session.start()
+        self.assertEqual((True, (52, 44, None), False), session.play_move(12, 28))
+        session.play_move(11, 27)
+        self.assertEqual((key("12,28"), key("52,36"), key("6,21")), scheduler.get_next_line())
+        with tempfile.TemporaryDirectory() as temporary_folder :
+            scheduler.save(temporary_folder + "/reviews.json")
+            loaded_scheduler = chessopy.scheduler.RepetitionScheduler.load(temporary_folder + "/reviews.json")
+        self.assertEqual({line: state.to_list() for line, state in scheduler.states.items()}, 
+                         {line: state.to_list() for line, state in loaded_scheduler.states.items()})
+
+class GuiTestCase(unittest.TestCase):
+
+    def test_dirty_squares(self):
+        # Only the board state is needed, no window is created
+        board_gui = types.SimpleNamespace(board=chessopy.Board(chessopy.MoveLines("new")), displayed_pieces=[None] * 64)
+        get_dirty_squares = chessopy.gui.BoardGui.get_dirty_squares
+        self.assertEqual(list(range(16)) + list(range(48, 64)), get_dirty_squares(board_gui))
+        board = board_gui.board
+        board.set_fen("r3k2r/8/8/3pP3/8/8/8/R3K2R w KQkq d6 0 1")
+        board_gui.displayed_pieces = [board.get_bitboard_index_at(n) for n in range(64)]
+        self.assertEqual([], get_dirty_squares(board_gui))
+        board.move_from_san("exd6")
+        self.assertEqual([35, 36, 43], get_dirty_squares(board_gui))
+        board.pop_last_move()
+        self.assertEqual([], get_dirty_squares(board_gui))
+        board.move_from_san("O-O-O")
+        self.assertEqual([0, 2, 3, 4], get_dirty_squares(board_gui))
+
+    class FakeBoardGui():
+        """after() callbacks run by run_until_idle, like the Tk mainloop would."""
+
+        def __init__(self):
+            self.callbacks = {}
+            self.after_count = 0
+            self.replies = []
+        
+        def after(self, delay, callback):
+            self.after_count += 1
+            after_id = self.after_count
+            self.callbacks[after_id] = (time.perf_counter() + delay/1000, callback)
+            return after_id
+        
+        def after_cancel(self, after_id):
+            del self.callbacks[after_id]
+        
+        def run_until_idle(self):
+            while self.callbacks :
+                after_id = min(self.callbacks, key=lambda after_id: self.callbacks[after_id][0])
+                run_time, callback = self.callbacks.pop(after_id)
+                time.sleep(max(0, run_time - time.perf_counter()))
+                callback()
+        
+        def play_computer_reply(self, reply):
+            self.replies.append(reply)
+
+    def test_computer_reply(self):
+        board_gui = self.FakeBoardGui()
+        reply_ready = threading.Event()
+        def slow_reply_source():
+            reply_ready.wait(1)
+            return (52, 36)
+        computer_reply = chessopy.gui.ComputerReply(board_gui, lambda stop_event: slow_reply_source, delay=20)
+        computer_reply.schedule()
+        # The Tk thread is not blocked while the reply is computed
+        self.assertTrue(computer_reply.is_pending())
+        reply_ready.set()
+        board_gui.run_until_idle()
+        self.assertEqual([(52, 36)], board_gui.replies)
+        self.assertFalse(computer_reply.is_pending())
+        # A cancelled reply is not played
+        computer_reply.schedule()
+        computer_reply.cancel()
+        board_gui.run_until_idle()
+        self.assertEqual([(52, 36)], board_gui.replies)
+        # A reply already computed is not stopped
+        computer_reply.schedule()
+        computer_reply.future.result(1)
+        stop_event = computer_reply.stop_event
+        computer_reply.cancel()
+        self.assertFalse(stop_event.is_set())
+        computer_reply.shutdown()
+
+    def test_engine_reply_cancelled(self):
+        board_gui = self.FakeBoardGui()
+        engine = chessopy.engine.Engine(table_size=1024)
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        reply_started = threading.Event()
+        can_search = threading.Event()
+        def engine_reply_source(stop_event):
+            position_state = board.get_position_state()
+            def search_reply():
+                reply_started.set()
+                can_search.wait(1)
+                return engine.search_position(position_state, 60, stop_event=stop_event).move
+            return search_reply
+        computer_reply = chessopy.gui.ComputerReply(board_gui, engine_reply_source, delay=0)
+        computer_reply.schedule()
+        reply_started.wait(1)
+        start_time = time.perf_counter()
+        # The search is stopped, instead of going on for the whole time budget, 
+        # even if it is cancelled before the search starts
+        computer_reply.cancel()
+        can_search.set()
+        computer_reply.executor.shutdown(wait=True)
+        self.assertLess(time.perf_counter() - start_time, 10)
+        self.assertEqual([], board_gui.replies)
+
+    def test_training_moves(self):
+        # The moves of the user go through the training session
+        move_lines = chessopy.MoveLines("new")
+        move_lines["move_lines"] = {key("12,28"): {key("52,44"): {}}}
+        board = chessopy.Board(move_lines)
+        session = chessopy.training.TrainingSession(board)
+        session.start()
+        shown_moves = []
+        board_gui = types.SimpleNamespace(
+            training_session=session, 
+            computer_reply=types.SimpleNamespace(cancel=lambda: None),
+            show_move_played=lambda: shown_moves.append(board.move_played[-1].get_key()))
+        def play(start_square_number, destination_square_number):
+            board_gui.square_gui_selected = types.SimpleNamespace(square=board.squares[start_square_number])
+            square_gui = types.SimpleNamespace(square=board.squares[destination_square_number])
+            chessopy.gui.BoardGui.check_then_make_move(board_gui, square_gui)
+        play(11, 27)
+        self.assertEqual((1, [], []), (session.mistake_count, board.move_played, shown_moves))
+        play(12, 28)
+        self.assertEqual((1, 1, [key("12,28")]), (session.mistake_count, session.move_count, shown_moves))
+
+    def test_canvas_click_mapping(self):
+        board_gui = types.SimpleNamespace(squares_gui=list(range(64)))
+        get_square_gui_at = chessopy.gui.CanvasBoardGui.get_square_gui_at
+        size = chessopy.gui.SQUARE_SIZE
+        self.assertEqual(0, get_square_gui_at(board_gui, 0, 8*size - 1))
+        self.assertEqual(63, get_square_gui_at(board_gui, 8*size - 1, 0))
+        self.assertEqual(28, get_square_gui_at(board_gui, 4*size + size//2, 4*size + 1))
+        self.assertIsNone(get_square_gui_at(board_gui, 8*size, 0))
+
+class EngineTestCase(unittest.TestCase):
+
+    def search(self, fen, time_budget=5, max_depth=3):
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        board.set_fen(fen)
+        state = board.get_position_state()
+        result = chessopy.engine.Engine(table_size=4096).search(board, time_budget, max_depth)
+        # The search is made on a board of the engine
+        self.assertEqual(state, board.get_position_state())
+        return result
+
+    def test_mate_in_one(self):
+        result = self.search("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+        self.assertEqual((0, 56, None), result.move) # Ra8#
+        self.assertEqual(chessopy.engine.MATE_SCORE - 1, result.score)
+    
+    def test_material(self):
+        # The queen taken by the knight is worth more than the pawn taken by the queen
+        result = self.search("rnb1kbnr/pppp1ppp/8/4p3/3qP3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 0 3")
+        self.assertEqual((21, 27, None), result.move) # Nxd4
+        self.assertGreater(result.score, 500)
+        self.assertEqual(3, result.depth)
+        self.assertEqual(0, chessopy.engine.evaluate(chessopy.Board(chessopy.MoveLines("new"))))
+    
+    def test_no_legal_move(self):
+        result = self.search("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1") # stalemate
+        self.assertIsNone(result.move)
+        self.assertEqual(0, result.score)
+        result = self.search("R6k/6pp/8/8/8/8/8/6K1 b - - 0 1") # checkmate
+        self.assertIsNone(result.move)
+        self.assertEqual(-chessopy.engine.MATE_SCORE, result.score)
+    
+    def test_time_budget(self):
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        engine = chessopy.engine.Engine(table_size=100)
+        start_time = time.perf_counter()
+        result = engine.search(board, 0.2)
+        self.assertLess(time.perf_counter() - start_time, 2)
+        self.assertGreaterEqual(result.depth, 1)
+        self.assertIn(result.move, board._generate_legal_moves())
+        # The size of the table is bounded
+        self.assertEqual(128, engine.table.size)
+        self.assertLessEqual(len(engine.table), 128)
+
+class UciTestCase(unittest.TestCase):
+
+    # Engine of the tests, no engine binary needed
+    FAKE_ENGINE_COMMAND = [sys.executable, os.path.join(chessopy.FOLDER_PATH, "fake_uci_engine.py")]
+
+    def test_uci_keys(self):
+        self.assertEqual(key("12,28"), chessopy.uci.uci_to_key("e2e4"))
+        self.assertEqual(key("52,60"), chessopy.uci.uci_to_key("e7e8q"))
+        self.assertEqual(key("52,60,n"), chessopy.uci.uci_to_key("e7e8n"))
+        self.assertIsNone(chessopy.uci.uci_to_key("(none)"))
+
+    def test_transpositions_are_analysed_once(self):
+        move_tree = {
+            key("12,28"): {key("52,36"): {key("6,21"): {key("57,42"): {}}}},
+            key("6,21"): {key("57,42"): {key("12,28"): {key("52,36"): {}}}},
+        }
+        async def annotate():
+            async with chessopy.uci.UciEnginePool(self.FAKE_ENGINE_COMMAND, 2, options={"Delay": 20}) as pool :
+                evaluations = await chessopy.uci.annotate_move_tree(pool, move_tree)
+                # The evaluations are cached
+                await pool.analyse(chessopy.STARTING_FEN)
+                return evaluations, pool.get_analysed_count(), [engine.analysed_count for engine in pool.engines]
+        evaluations, analysed_count, engine_counts = asyncio.run(annotate())
+        self.assertEqual(9, len(evaluations))
+        self.assertEqual(8, analysed_count)
+        # The positions are spread over the engines
+        self.assertTrue(all(engine_counts))
+        self.assertEqual(evaluations[(key("12,28"), key("52,36"), key("6,21"), key("57,42"))], 
+                         evaluations[(key("6,21"), key("57,42"), key("12,28"), key("52,36"))])
+        self.assertEqual(chessopy.PieceColor.WHITE, evaluations[()].turn)
+        self.assertEqual(chessopy.PieceColor.BLACK, evaluations[(key("12,28"),)].turn)
+
+    def test_dubious_moves(self):
+        move_lines = chessopy.MoveLines("new")
+        # 1.e4 d5 2.exd5 and 2.Qg4?? which loses the queen
+        move_lines["move_lines"] = {key("12,28"): {key("51,35"): {key("28,35"): {}, key("3,30"): {}}}}
+        evaluations = chessopy.uci.annotate_move_lines(move_lines, self.FAKE_ENGINE_COMMAND, 1)
+        self.assertEqual([(key("12,28"), key("51,35"), key("3,30"))], 
+                         chessopy.uci.get_dubious_moves(evaluations, chessopy.PieceColor.WHITE, 300))
+        self.assertEqual([], chessopy.uci.get_dubious_moves(evaluations, chessopy.PieceColor.BLACK, 300))
+
+    def test_mate(self):
+        async def analyse(fen):
+            async with chessopy.uci.UciEnginePool(self.FAKE_ENGINE_COMMAND, 1) as pool :
+                return await pool.analyse(fen)
+        evaluation = asyncio.run(analyse("R6k/6pp/8/8/8/8/8/6K1 b - - 0 1"))
+        self.assertIsNone(evaluation.best_move)
+        self.assertEqual(chessopy.engine.MATE_SCORE, chessopy.uci.get_white_score(evaluation))
+
+    def test_engine_crash(self):
+        crash_fen = "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2"
+        async def analyse():
+            async with chessopy.uci.UciEnginePool(self.FAKE_ENGINE_COMMAND, 1, options={"CrashMove": 2}) as pool :
+                engine = pool.engines[0]
+                with self.assertRaises(chessopy.uci.UciException) :
+                    await pool.analyse(crash_fen)
+                # The position is not cached, and the engine is replaced
+                self.assertEqual({}, pool.cache)
+                self.assertIsNot(engine, pool.engines[0])
+                self.assertIsNotNone(engine.process.returncode)
+                evaluation = await pool.analyse(chessopy.STARTING_FEN)
+                with self.assertRaises(chessopy.uci.UciException) :
+                    await pool.analyse(crash_fen)
+                return evaluation, pool.get_analysed_count()
+        evaluation, analysed_count = asyncio.run(analyse())
+        self.assertEqual(chessopy.PieceColor.WHITE, evaluation.turn)
+        self.assertEqual(1, analysed_count)
+
+class SoundTestCase(unittest.TestCase):
+
+    def test_silent_player(self):
+        backend = chessopy.sound.SilentBackend()
+        sound_player = chessopy.sound.SoundPlayer(backend)
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        for san in ["e4", "d5", "exd5"] :
+            board.move_from_san(san)
+            sound_player.play_move_sound(board.move_played[-1])
+        sound_player.wait()
+        self.assertEqual(["move", "move", "capture"], backend.played_names)
+        sound_player.close()
+
+    def test_sound_files(self):
+        for file_path in chessopy.sound.SOUND_FILES.values() :
+            self.assertTrue(os.path.isfile(chessopy.FOLDER_PATH + file_path))
+
+class LibraryTestCase(TemporaryFolderMixin, unittest.TestCase):
+
+    def test_library(self):
+        temporary_folder = self.use_temporary_folder()
+        for name, key_string in [("french", "12,28"), ("sicilian", "12,28"), ("london", "11,27")] :
+            with open(f"{temporary_folder}/databases/{name}_database.json", 'w') as json_database :
+                json.dump({"move_lines": {key_string: {}}}, json_database)
+        chessopy.binary_database.write_binary_database({key("6,21"): {}}, temporary_folder + "/databases/reti_database.bin")
+        library = chessopy.library.RepertoireLibrary(max_loaded=2)
+        self.assertEqual(["french", "london", "reti", "sicilian"], library.get_names())
+        self.assertFalse(library.is_loaded("french"))
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        board.set_training_lines("french", library)
+        self.assertEqual([(12, 28)], board.move_lines.get_coords_of_childs_of_current_node())
+        # The current repertoire is pinned, the least recently used one is dropped
+        self.assertEqual([(11, 27)], library.get("london").get_coords_of_childs_of_current_node())
+        self.assertIs(library.get("london"), library.get("london"))
+        self.assertEqual([(6, 21)], library.get("reti").get_coords_of_childs_of_current_node())
+        self.assertEqual([True, False, True], [library.is_loaded(name) for name in ["french", "london", "reti"]])
+        board.set_training_lines("sicilian", library)
+        self.assertEqual([False, True, True], [library.is_loaded(name) for name in ["french", "reti", "sicilian"]])
+        self.assertRaises(chessopy.library.UnknownRepertoireException, library.get, "dutch")
+        library.get("reti").close()
+
+    def test_pinned_and_unsaved_moves(self):
+        temporary_folder = self.use_temporary_folder()
+        for name in ["french", "london", "sicilian"] :
+            with open(f"{temporary_folder}/databases/{name}_database.json", 'w') as json_database :
+                json.dump({"move_lines": {"12,28": {}}}, json_database)
+        library = chessopy.library.RepertoireLibrary(max_loaded=2)
+        library.pin("french")
+        french = library.get("french")
+        # The compaction of the journal changes the file of a pinned repertoire, it is not reloaded
+        french_path = temporary_folder + "/databases/french_database.json"
+        os.utime(french_path, (0, 0))
+        french.go_to_child(key("12,28"))
+        french.go_to_child(key("52,44"))
+        french.JOURNAL_COMPACTION_SIZE = 0
+        french.add_curent_lines_to_database()
+        self.assertNotEqual(0, os.path.getmtime(french_path))
+        self.assertIs(french, library.get("french"))
+        self.assertEqual([key("12,28"), key("52,44")], french.current_line)
+        # The unsaved moves of a dropped repertoire are saved
+        london = library.get("london")
+        london.go_to_child(key("11,27"))
+        library.get("sicilian")
+        self.assertFalse(library.is_loaded("london"))
+        self.assertEqual({key("12,28"): {}, key("11,27"): {}}, library.get("london")["move_lines"])
+
+class ValidationTestCase(unittest.TestCase):
+
+    def test_validate_move_lines(self):
+        move_lines = chessopy.MoveLines("new")
+        move_lines["move_lines"] = {
+            key("12,28"): {key("52,36"): {key("3,27"): {}, key("6,21"): {key("57,42"): {}}}, key("1,18"): {}, key("12,20"): {}, key("51,35"): {key("28,35"): {}}},
+            key("50,40"): {},
+            key("6,5"): {},
+            "x": {},
+        }
+        bad_edges = [
+            chessopy.validation.BadEdge((key("12,28"), key("1,18")), chessopy.validation.NOT_THE_SIDE_TO_MOVE),
+            chessopy.validation.BadEdge((key("12,28"), key("12,20")), chessopy.validation.NO_PIECE_ON_START_SQUARE),
+            chessopy.validation.BadEdge((key("12,28"), key("52,36"), key("3,27")), chessopy.validation.ILLEGAL_MOVE),
+            chessopy.validation.BadEdge((key("50,40"),), chessopy.validation.NOT_THE_SIDE_TO_MOVE),
+            chessopy.validation.BadEdge((key("6,5"),), chessopy.validation.ILLEGAL_MOVE),
+            chessopy.validation.BadEdge(("x",), chessopy.validation.NOT_A_MOVE_KEY),
+        ]
+        self.assertEqual(bad_edges, chessopy.validation.validate_move_lines(move_lines, 1))
+        self.assertEqual(bad_edges, chessopy.validation.validate_move_lines(move_lines, 2))
+
+    def test_pseudo_legal_tuple(self):
+        board = chessopy.Board(chessopy.MoveLines("new"))
+        for game in [["e4", "d5", "exd5", "c5", "dxc6"], ["Nf3", "Nf6", "g3", "g6", "Bg2", "Bg7", "e4"], 
+                     ["e4", "f5", "exf5", "g5", "fxg6", "Nf6", "gxh7", "Ng8"]] :
+            board.set_new_game()
+            for san in game :
+                board._make_move(*board.parse_san(san))
+                pseudo_legal_moves = set(board._generate_pseudo_legal_moves())
+                for start in range(64) :
+                    for destination in range(64) :
+                        for promotion in [None] + chessopy.PROMOTION_TYPES :
+                            move = (start, destination, promotion)
+                            self.assertEqual(move in pseudo_legal_moves, board._is_pseudo_legal_tuple(move), move)
+
+class AnalysisTestCase(TemporaryFolderMixin, unittest.TestCase):
+
+    def test_statistics(self):
+        move_tree = {key("12,28"): {key("52,36"): {key("6,21"): {}}, key("50,34"): {key("6,21"): {key("51,43"): {}}, key("1,18"): {}}}, key("11,27"): {}}
+        statistics = chessopy.analysis.compute_statistics(move_tree, chessopy.PieceColor.WHITE)
+        self.assertEqual(8, statistics.move_count)
+        self.assertEqual(4, statistics.max_depth)
+        self.assertEqual([2, 2, 3, 1], statistics.node_counts)
+        self.assertEqual([2, 2, 1.5, 1], statistics.branching_factors)
+        self.assertEqual([(key("12,28"), key("52,36"), key("6,21")), (key("12,28"), key("50,34"), key("6,21"), key("51,43")), (key("12,28"), key("50,34"), key("1,18"))], 
+                         statistics.get_line_ends((key("12,28"),)))
+        self.assertEqual(4, len(statistics.line_ends))
+        # Black is to move after 1.e4 and 2.Nf3
+        self.assertEqual([(key("12,28"),), (key("12,28"), key("50,34"), key("6,21"))], list(statistics.uncovered_replies))
+        self.assertEqual(18, len(statistics.uncovered_replies[(key("12,28"),)]))
+        self.assertNotIn(key("51,43"), statistics.uncovered_replies[(key("12,28"), key("50,34"), key("6,21"))])
+        self.assertEqual({}, chessopy.analysis.compute_statistics(move_tree).get_uncovered_replies())
+
+    def test_deep_lines(self):
+        # Deeper than the recursion limit
+        move_tree = {}
+        node = move_tree
+        for ply in range(2*sys.getrecursionlimit()) :
+            node = node.setdefault([key("6,21"), key("62,45"), key("21,6"), key("45,62")][ply % 4], {})
+        statistics = chessopy.analysis.compute_statistics(move_tree, chessopy.PieceColor.BLACK)
+        self.assertEqual(2*sys.getrecursionlimit(), statistics.max_depth)
+        self.assertEqual(sys.getrecursionlimit(), len(statistics.uncovered_replies))
+
+    def test_index(self):
+        temporary_folder = self.use_temporary_folder()
+        with open(temporary_folder + "/databases/french_database.json", 'w') as json_database :
+            json.dump({"move_lines": {"12,28": {"52,44": {}}}}, json_database)
+        move_lines = chessopy.MoveLines("french")
+        statistics = chessopy.analysis.get_statistics(move_lines, chessopy.PieceColor.WHITE)
+        index_path = temporary_folder + "/databases/french_database.stats.json"
+        self.assertTrue(os.path.isfile(index_path))
+        # The index is read instead of the move lines
+        move_lines["move_lines"] = {}
+        self.assertEqual(statistics.to_dict(), 
+                         chessopy.analysis.get_statistics(move_lines, chessopy.PieceColor.WHITE).to_dict())
+        # The index is not used for unsaved moves, and is outdated when the database changes
+        move_lines = chessopy.MoveLines("french")
+        for key_string in ["12,28", "52,44", "11,27"] :
+            move_lines.go_to_child(key(key_string))
+        self.assertEqual(3, chessopy.analysis.get_statistics(move_lines, chessopy.PieceColor.WHITE).max_depth)
+        self.assertEqual(2, chessopy.analysis.get_statistics(chessopy.MoveLines("french"), chessopy.PieceColor.WHITE).max_depth)
+        move_lines.add_curent_lines_to_database()
+        self.assertEqual(3, chessopy.analysis.get_statistics(move_lines, chessopy.PieceColor.WHITE).max_depth)
+        self.assertEqual(3, chessopy.analysis.get_statistics(chessopy.MoveLines("french"), chessopy.PieceColor.WHITE).max_depth)
+
+#TODO: write more tests!!!